@@ -34,6 +34,20 @@ import {
 } from 'react-icons/hi'
 import './FormBuilder.css'
 
+const API_URL = import.meta.env.VITE_API_URL || 'https://apidata.geodatos.com.mx/api'
+
+// Questions carry sparse order keys, ORDER_GAP apart, so moving one only
+// gives it a key between its new neighbours; the others keep theirs
+const ORDER_GAP = 1024
+
+const orderBetween = (before, after) => {
+  if (before == null && after == null) return ORDER_GAP
+  if (after == null) return before + ORDER_GAP
+  if (before == null) return after - ORDER_GAP
+  if (after - before < 2) return null
+  return Math.floor((before + after) / 2)
+}
+
 const QUESTION_TYPES = [
   { type: 'text', label: 'Texto corto', icon: HiOutlineMenuAlt2, category: 'basic' },
   { type: 'textarea', label: 'Texto largo', icon: HiOutlineDocumentDuplicate, category: 'basic' },
@@ -89,8 +103,13 @@ function FormBuilder({ form, onSave, onCancel }) {
   const [activeCategory, setActiveCategory] = useState('basic')
   const [previewMode, setPreviewMode] = useState(false)
   const [draggedIndex, setDraggedIndex] = useState(null)
+  const [dragStartIndex, setDragStartIndex] = useState(null)
+  const [deletedIds, setDeletedIds] = useState([]) // Saved questions removed since opening
+
+  const getAuthToken = () => localStorage.getItem('authToken')
 
   useEffect(() => {
+    setDeletedIds([])
     if (form) {
       setFormData({
         ...form,
@@ -105,6 +124,11 @@ function FormBuilder({ form, onSave, onCancel }) {
     }
   }, [form])
 
+  const nextOrder = () => {
+    const orders = formData.questions.map(q => q.order ?? 0)
+    return orderBetween(orders.length ? Math.max(...orders) : null, null)
+  }
+
   const addQuestion = (type) => {
     const typeInfo = QUESTION_TYPES.find(t => t.type === type)
     const newQuestion = {
@@ -114,7 +138,7 @@ function FormBuilder({ form, onSave, onCancel }) {
       description: '',
       placeholder: '',
       required: false,
-      order: formData.questions.length,
+      order: nextOrder(),
       options: type === 'select_one' || type === 'select_multiple' ? [
         { value: 'opcion1', label: 'Opción 1' },
         { value: 'opcion2', label: 'Opción 2' }
@@ -142,6 +166,7 @@ function FormBuilder({ form, onSave, onCancel }) {
   }
 
   const deleteQuestion = (questionId) => {
+    if (typeof questionId === 'number') setDeletedIds([...deletedIds, questionId])
     setFormData({
       ...formData,
       questions: formData.questions.filter(q => q.id !== questionId)
@@ -156,7 +181,7 @@ function FormBuilder({ form, onSave, onCancel }) {
       ...question,
       id: `q_${Date.now()}`,
       label: `${question.label} (Copia)`,
-      order: formData.questions.length
+      order: nextOrder()
     }
     setFormData({
       ...formData,
@@ -173,12 +198,24 @@ function FormBuilder({ form, onSave, onCancel }) {
     questions[index] = questions[newIndex]
     questions[newIndex] = temp
 
-    questions.forEach((q, i) => q.order = i)
-    setFormData({ ...formData, questions })
+    placeQuestion(questions, newIndex)
+  }
+
+  // Give the question at `index` a key between its neighbours, respacing
+  // all of them only when there is no room. The order is kept locally and
+  // goes to the server with the rest of the form on save
+  const placeQuestion = (questions, index) => {
+    const moved = questions[index]
+    const order = orderBetween(questions[index - 1]?.order, questions[index + 1]?.order)
+    const placed = order === null
+      ? questions.map((q, i) => ({ ...q, order: (i + 1) * ORDER_GAP }))
+      : questions.map(q => q.id === moved.id ? { ...q, order } : q)
+    setFormData({ ...formData, questions: placed })
   }
 
   const handleDragStart = (index) => {
     setDraggedIndex(index)
+    setDragStartIndex(index)
   }
 
   const handleDragOver = (e, index) => {
@@ -189,17 +226,65 @@ function FormBuilder({ form, onSave, onCancel }) {
     const draggedItem = questions[draggedIndex]
     questions.splice(draggedIndex, 1)
     questions.splice(index, 0, draggedItem)
-    questions.forEach((q, i) => q.order = i)
     
     setFormData({ ...formData, questions })
     setDraggedIndex(index)
   }
 
   const handleDragEnd = () => {
+    if (draggedIndex !== null && draggedIndex !== dragStartIndex) {
+      placeQuestion(formData.questions, draggedIndex)
+    }
     setDraggedIndex(null)
+    setDragStartIndex(null)
+  }
+
+  // A saved form goes back as one document, which the server diffs against
+  // the stored questions; questions not yet on the server are sent without
+  // id, and removed ones are named in deleted_ids
+  const saveDocument = async () => {
+    const token = getAuthToken()
+    if (!form?.id || !token) return null
+
+    const response = await fetch(`${API_URL}/forms/${form.id}/document`, {
+      method: 'PUT',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({
+        ...formData,
+        questions: formData.questions.map(q => ({ ...q, id: typeof q.id === 'number' ? q.id : null })),
+        deleted_ids: deletedIds
+      })
+    })
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}))
+      // Validation errors (422) come as a list of {loc, msg, type} objects
+      const detail = Array.isArray(error.detail)
+        ? error.detail.map(d => d?.msg || String(d)).join('\n')
+        : error.detail
+      throw new Error(detail)
+    }
+    return response.json()
   }
 
-  const handleSave = () => {
+  const handleSave = async () => {
+    try {
+      const saved = await saveDocument()
+      if (saved) {
+        onSave(saved)
+        return
+      }
+    } catch (err) {
+      console.error('Error saving form:', err)
+      // Without a reachable API the form is kept locally, as before
+      if (!(err instanceof TypeError)) {
+        alert(`Error al guardar el formulario. ${err.message || ''}`)
+        return
+      }
+    }
+
     const dataToSave = {
       ...formData,
       id: form?.id || Date.now(),
@@ -12,7 +12,8 @@ import {
   HiOutlineDocumentReport,
   HiOutlineX,
   HiOutlineChevronLeft,
-  HiOutlineChevronRight
+  HiOutlineChevronRight,
+  HiOutlineBadgeCheck
 } from 'react-icons/hi'
 import './FormResponses.css'
 
@@ -24,13 +25,17 @@ function FormResponses({ form, onBack }) {
   const [view, setView] = useState('table') // table, detail, chart
   const [selectedSubmission, setSelectedSubmission] = useState(null)
   const [page, setPage] = useState(1)
+  const [cursors, setCursors] = useState([null]) // cursors[i] opens page i + 1
   const [totalPages, setTotalPages] = useState(1)
   const [showExportModal, setShowExportModal] = useState(false)
   const [dateFilter, setDateFilter] = useState({ from: '', to: '' })
+  const [selected, setSelected] = useState(new Set())
+  const [bulkRunning, setBulkRunning] = useState(false)
 
   const getAuthToken = () => localStorage.getItem('authToken')
 
   useEffect(() => {
+    setSelected(new Set())
     fetchSubmissions()
   }, [form, page, dateFilter])
 
@@ -39,22 +44,26 @@ function FormResponses({ form, onBack }) {
     
     try {
       setLoading(true)
-      const params = new URLSearchParams({
-        skip: (page - 1) * 20,
-        limit: 20
-      })
+      const params = new URLSearchParams({ limit: 20 })
       
+      const cursor = cursors[page - 1]
+      if (cursor) params.append('cursor', cursor)
       if (dateFilter.from) params.append('date_from', dateFilter.from)
       if (dateFilter.to) params.append('date_to', dateFilter.to)
 
-      const response = await fetch(`${API_URL}/submissions/forms/${form.id}?${params}`, {
+      const response = await fetch(`${API_URL}/submissions/forms/${form.id}/page?${params}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       })
 
       if (response.ok) {
         const data = await response.json()
-        setSubmissions(data)
-        setTotalPages(Math.ceil((form.submission_count || data.length) / 20))
+        setSubmissions(data.items)
+        setCursors(prev => {
+          const next = prev.slice(0, page)
+          if (data.next_cursor) next[page] = data.next_cursor
+          return next
+        })
+        setTotalPages(Math.ceil((form.submission_count || data.items.length) / 20))
       } else {
         // Mock data
         setSubmissions(getMockSubmissions())
@@ -67,6 +76,12 @@ function FormResponses({ form, onBack }) {
     }
   }
 
+  const changeDateFilter = (filter) => {
+    setPage(1)
+    setCursors([null])
+    setDateFilter(filter)
+  }
+
   const getMockSubmissions = () => {
     const mockData = []
     for (let i = 1; i <= 10; i++) {
@@ -139,6 +154,65 @@ function FormResponses({ form, onBack }) {
     }
   }
 
+  const toggleSelected = (submissionId) => {
+    const next = new Set(selected)
+    if (next.has(submissionId)) next.delete(submissionId)
+    else next.add(submissionId)
+    setSelected(next)
+  }
+
+  const allSelected = submissions.length > 0 && submissions.every(s => selected.has(s.id))
+
+  const toggleAll = () => {
+    setSelected(allSelected ? new Set() : new Set(submissions.map(s => s.id)))
+  }
+
+  // Bulk actions apply either to the selected rows or, with `byFilter`, to
+  // every response in the current date range, in a single request
+  const runBulk = async (action, extra, byFilter = false) => {
+    const token = getAuthToken()
+    const selection = byFilter
+      ? { date_from: dateFilter.from || null, date_to: dateFilter.to || null }
+      : { ids: [...selected] }
+
+    try {
+      setBulkRunning(true)
+      const response = await fetch(`${API_URL}/submissions/forms/${form.id}/${action}`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ ...selection, ...extra })
+      })
+
+      if (response.ok) {
+        setSelected(new Set())
+        setPage(1)
+        setCursors([null])
+        fetchSubmissions()
+      } else {
+        alert('Error al aplicar la acción. Intente de nuevo.')
+      }
+    } catch (err) {
+      console.error('Bulk action error:', err)
+    } finally {
+      setBulkRunning(false)
+    }
+  }
+
+  const handleBulkDelete = (byFilter = false) => {
+    const message = byFilter
+      ? '¿Eliminar todas las respuestas del periodo filtrado?'
+      : `¿Eliminar ${selected.size} respuestas seleccionadas?`
+    if (!confirm(message)) return
+    runBulk('bulk-delete', {}, byFilter)
+  }
+
+  const handleBulkValidate = () => {
+    runBulk('bulk-status', { new_status: 'validated' })
+  }
+
   const getAnswerValue = (submission, questionIndex) => {
     const answer = submission.answers?.find(a => a.question_id === questionIndex + 1)
     if (!answer) return '-'
@@ -216,7 +290,7 @@ function FormResponses({ form, onBack }) {
           <input
             type="date"
             value={dateFilter.from}
-            onChange={(e) => setDateFilter({ ...dateFilter, from: e.target.value })}
+            onChange={(e) => changeDateFilter({ ...dateFilter, from: e.target.value })}
           />
         </div>
         <div className="filter-group">
@@ -224,9 +298,18 @@ function FormResponses({ form, onBack }) {
           <input
             type="date"
             value={dateFilter.to}
-            onChange={(e) => setDateFilter({ ...dateFilter, to: e.target.value })}
+            onChange={(e) => changeDateFilter({ ...dateFilter, to: e.target.value })}
           />
         </div>
+        {(dateFilter.from || dateFilter.to) && (
+          <button
+            className="btn btn-secondary danger"
+            disabled={bulkRunning}
+            onClick={() => handleBulkDelete(true)}
+          >
+            <HiOutlineTrash size={18} /> Eliminar periodo
+          </button>
+        )}
         <div className="view-toggle">
           <button
             className={view === 'table' ? 'active' : ''}
@@ -258,10 +341,27 @@ function FormResponses({ form, onBack }) {
           </div>
         ) : view === 'table' ? (
           <>
+            {selected.size > 0 && (
+              <div className="bulk-actions">
+                <span>{selected.size} seleccionadas</span>
+                <button className="btn btn-secondary" disabled={bulkRunning} onClick={handleBulkValidate}>
+                  <HiOutlineBadgeCheck size={18} /> Marcar validadas
+                </button>
+                <button className="btn btn-secondary danger" disabled={bulkRunning} onClick={() => handleBulkDelete()}>
+                  <HiOutlineTrash size={18} /> Eliminar
+                </button>
+                <button className="btn btn-icon" onClick={() => setSelected(new Set())}>
+                  <HiOutlineX size={18} />
+                </button>
+              </div>
+            )}
             <div className="responses-table-container">
               <table className="responses-table">
                 <thead>
                   <tr>
+                    <th className="select-cell">
+                      <input type="checkbox" checked={allSelected} onChange={toggleAll} />
+                    </th>
                     <th>#</th>
                     <th>Fecha</th>
                     <th>Estado</th>
@@ -273,12 +373,19 @@ function FormResponses({ form, onBack }) {
                 </thead>
                 <tbody>
                   {submissions.map((sub, idx) => (
-                    <tr key={sub.id}>
+                    <tr key={sub.id} className={selected.has(sub.id) ? 'selected' : ''}>
+                      <td className="select-cell">
+                        <input
+                          type="checkbox"
+                          checked={selected.has(sub.id)}
+                          onChange={() => toggleSelected(sub.id)}
+                        />
+                      </td>
                       <td>{(page - 1) * 20 + idx + 1}</td>
                       <td>{new Date(sub.created_at).toLocaleString('es-MX')}</td>
                       <td>
                         <span className={`status-badge ${sub.status}`}>
-                          {sub.status === 'completed' ? 'Completado' : sub.status}
+                          {sub.status === 'completed' ? 'Completado' : sub.status === 'validated' ? 'Validado' : sub.status}
                         </span>
                       </td>
                       {(form.questions || []).slice(0, 4).map((q, i) => (
@@ -310,7 +417,7 @@ function FormResponses({ form, onBack }) {
               </button>
               <span>Página {page} de {totalPages}</span>
               <button
-                disabled={page === totalPages}
+                disabled={page === totalPages || !cursors[page]}
                 onClick={() => setPage(page + 1)}
               >
                 <HiOutlineChevronRight size={18} />
@@ -117,9 +117,24 @@ function Forms() {
     setSelectedForm({ ...template.template_data, id: null, title: template.name, description: template.description, status: 'draft' })
     setView('builder')
   }
-  const handleEdit = (form) => { setSelectedForm(form); setView('builder') }
-  const handleViewResponses = (form) => { setSelectedForm(form); setView('responses') }
-  const handlePreview = (form) => { setSelectedForm(form); setView('preview') }
+  // List items carry no questions; views that show or edit them get the whole form
+  const fetchFullForm = async (form) => {
+    const token = getAuthToken()
+    if (!token || form.questions) return form
+    try {
+      const response = await fetch(`${API_URL}/forms/${form.id}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      })
+      if (response.ok) return await response.json()
+    } catch (err) {
+      console.error('Error fetching form:', err)
+    }
+    return form
+  }
+  const openForm = async (form, nextView) => { setSelectedForm(await fetchFullForm(form)); setView(nextView) }
+  const handleEdit = (form) => openForm(form, 'builder')
+  const handleViewResponses = (form) => openForm(form, 'responses')
+  const handlePreview = (form) => openForm(form, 'preview')
   const handleDelete = async () => {
     if (!formToDelete) return
     setForms(forms.filter(f => f.id !== formToDelete.id))
@@ -0,0 +1,519 @@
+from sqlalchemy import Text, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+import asyncio
+import json
+
+import numpy as np
+
+from .cache import SizedLRUCache
+from .compiled import CompiledForm
+from .config import settings
+from .counters import current_change_seq
+from .models import Answer, Submission, SubmissionTombstone, QuestionType
+from .packed_answers import packed_entry
+from .schemas import FormStatistics
+from .statistics import (
+    CHOICE_TYPES, NUMERIC_TYPES, COMPLETED_STATUSES, PERCENTILES,
+    answer_choices, answer_number, is_answered
+)
+
+# Analytics that filter or cross questions cannot be answered from the
+# rollups, and pivoting the answers table on every request costs seconds on
+# large forms. Instead each form's submissions are materialized once as
+# NumPy columns and kept current from the form's change sequence.
+
+MIN_CAPACITY = 1024
+ANSWER_BATCH = 5000
+PACKED_BATCH = 500  # Submissions, each with a whole packed document
+
+# Fill value of each kind of column for rows without a value
+FILL = {
+    "id": 0,
+    "created_at": np.datetime64("NaT", "us"),
+    "status": -1,
+    "duration": np.nan,
+    "live": False,
+    "answered": False,
+    "number": np.nan,
+    "choice": -1,
+    "choices": 0,
+}
+DTYPES = {
+    "id": np.int64,
+    "created_at": "datetime64[us]",
+    "status": np.int16,
+    "duration": np.float64,
+    "live": np.bool_,
+    "answered": np.bool_,
+    "number": np.float64,
+    "choice": np.int32,
+    "choices": np.uint8,
+}
+
+Key = Hashable  # "id", or ("number", question id) ...
+
+
+class _AnswerValues(NamedTuple):
+    value_text: Optional[str]
+    value_number: Optional[float]
+    value_json: Any
+    value_file: Optional[str]
+
+
+def _kind(key: Key) -> str:
+    return key if isinstance(key, str) else key[0]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class AnswerMatrix:
+    """Submissions of one form version as typed columns, one row per submission.
+
+    Rows are kept in submission id order. Every question has an `answered`
+    flag; numeric questions also get a float64 column (NaN when unanswered),
+    single-choice questions a column of codes into `categories` (-1 when
+    unanswered) and multiple-choice questions a 0/1 matrix with one column
+    per category. Values come from the first repeat instance; later
+    instances only count toward `answered`.
+
+    The matrix is built on first use and then brought up to date from the
+    form's change sequence: submissions inserted or modified since the last
+    refresh are read again and deleted ones are dropped.
+    """
+
+    def __init__(self, form: CompiledForm):
+        self.form_id = form.id
+        self.version = form.version
+        self.watermark: Optional[int] = None
+        self.size = 0
+        self.capacity = 0
+        self.dead = 0
+        self.lock = asyncio.Lock()
+
+        self.questions = {q.id: q for q in form.questions if q.question_type != QuestionType.NOTE}
+        self.statuses: List[str] = []
+        self.categories: Dict[int, List[str]] = {}
+        self._category_codes: Dict[int, Dict[str, int]] = {}
+
+        keys: List[Key] = ["id", "created_at", "status", "duration", "live"]
+        for question in self.questions.values():
+            keys.append(("answered", question.id))
+            if question.question_type in NUMERIC_TYPES:
+                keys.append(("number", question.id))
+            if question.question_type in CHOICE_TYPES:
+                keys.append((
+                    "choices" if question.question_type == QuestionType.SELECT_MULTIPLE else "choice",
+                    question.id
+                ))
+                options = [] if question.question_type == QuestionType.RATING else list(question.option_values)
+                self.categories[question.id] = options
+                self._category_codes[question.id] = {value: code for code, value in enumerate(options)}
+
+        self._columns: Dict[Key, np.ndarray] = {}
+        for key in keys:
+            width = (max(len(self.categories[key[1]]), 4),) if _kind(key) == "choices" else ()
+            self._columns[key] = np.full((0,) + width, FILL[_kind(key)], dtype=DTYPES[_kind(key)])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns.values())
+
+    def column(self, key: Key) -> np.ndarray:
+        """View of a column over the current rows"""
+        column = self._columns[key][:self.size]
+        if _kind(key) == "choices":
+            column = column[:, :len(self.categories[key[1]])]
+        return column
+
+    # Storage
+
+    def _reserve(self, rows: int) -> None:
+        """Make room for `rows` more rows, growing geometrically"""
+        needed = self.size + rows
+        if needed <= self.capacity:
+            return
+        capacity = max(MIN_CAPACITY, self.capacity * 2, needed)
+        for key, old in self._columns.items():
+            new = np.full((capacity,) + old.shape[1:], FILL[_kind(key)], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            self._columns[key] = new
+        self.capacity = capacity
+
+    def _code(self, question_id: int, value: str) -> int:
+        codes = self._category_codes[question_id]
+        code = codes.get(value)
+        if code is None:
+            categories = self.categories[question_id]
+            code = codes[value] = len(categories)
+            categories.append(value)
+            key = ("choices", question_id)
+            old = self._columns.get(key)
+            if old is not None and code >= old.shape[1]:
+                new = np.zeros((old.shape[0], old.shape[1] * 2), dtype=old.dtype)
+                new[:, :old.shape[1]] = old
+                self._columns[key] = new
+        return code
+
+    def _status_code(self, status: Optional[str]) -> int:
+        if status is None:
+            return -1
+        if status not in self.statuses:
+            self.statuses.append(status)
+        return self.statuses.index(status)
+
+    def _place(self, ids: np.ndarray) -> np.ndarray:
+        """Row of each id in `ids` (sorted), appending the ones not present yet"""
+        existing = self._columns["id"][:self.size]
+        found = np.searchsorted(existing, ids)
+        present = np.zeros(len(ids), dtype=bool)
+        inside = found < self.size
+        present[inside] = existing[found[inside]] == ids[inside]
+        rows = np.where(present, found, 0)
+
+        new = ~present
+        count = int(new.sum())
+        if count:
+            self._reserve(count)
+            rows[new] = np.arange(self.size, self.size + count)
+            self._columns["id"][self.size:self.size + count] = ids[new]
+            self.size += count
+
+        # Clear what is stored for rows that are read again
+        reread = rows[present]
+        if len(reread):
+            for key, column in self._columns.items():
+                if _kind(key) in ("answered", "number", "choice", "choices"):
+                    column[reread] = FILL[_kind(key)]
+        return rows
+
+    def _sort(self) -> None:
+        ids = self._columns["id"][:self.size]
+        if self.size < 2 or bool(np.all(ids[:-1] < ids[1:])):
+            return
+        order = np.argsort(ids, kind="stable")
+        for column in self._columns.values():
+            column[:self.size] = column[:self.size][order]
+
+    def _drop(self, ids: np.ndarray) -> None:
+        existing = self._columns["id"][:self.size]
+        found = np.searchsorted(existing, ids)
+        inside = found < self.size
+        found = found[inside]
+        found = found[existing[found] == ids[inside]]
+        live = self._columns["live"]
+        self.dead += int(live[found].sum())
+        live[found] = False
+
+        if self.dead > MIN_CAPACITY and self.dead * 2 > self.size:
+            keep = live[:self.size].copy()
+            for key, column in self._columns.items():
+                kept = column[:self.size][keep]
+                column[:len(kept)] = kept
+                column[len(kept):self.size] = FILL[_kind(key)]
+            self.size = int(keep.sum())
+            self.dead = 0
+
+    # Loading
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Read what changed since the last refresh; call under `lock`"""
+        # Sequence numbers up to this one all belong to committed changes
+        change_seq = await current_change_seq(db, self.form_id)
+        if change_seq == self.watermark:
+            return
+
+        submissions = select(
+            Submission.id, Submission.status, Submission.created_at, Submission.duration_seconds
+        ).where(Submission.form_id == self.form_id).order_by(Submission.id)
+        answers = (
+            select(
+                Answer.submission_id, Answer.question_id, Answer.value_text, Answer.value_number,
+                type_coerce(Answer.value_json, Text), Answer.value_file
+            )
+            .join(Submission, Answer.submission_id == Submission.id)
+            .where(Submission.form_id == self.form_id)
+            .order_by(Answer.submission_id, Answer.repeat_index, Answer.id)
+        )
+        packed = (
+            select(Submission.id, Submission.packed_answers)
+            .where(Submission.form_id == self.form_id, Submission.packed_answers.is_not(None))
+            .order_by(Submission.id)
+        )
+        if self.watermark is not None:
+            submissions = submissions.where(Submission.change_seq > self.watermark)
+            answers = answers.where(Submission.change_seq > self.watermark)
+            packed = packed.where(Submission.change_seq > self.watermark)
+
+        result = await db.execute(submissions)
+        rows = result.all()
+        if rows:
+            ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=len(rows))
+            positions = self._place(ids)
+            self._columns["status"][positions] = [self._status_code(r.status) for r in rows]
+            self._columns["created_at"][positions] = np.array(
+                [r.created_at for r in rows], dtype="datetime64[us]"
+            )
+            self._columns["duration"][positions] = np.array(
+                [r.duration_seconds for r in rows], dtype=np.float64
+            )
+            self._columns["live"][positions] = True
+
+            stream = await db.stream(answers.execution_options(yield_per=ANSWER_BATCH))
+            last = {"submission_id": None, "seen": set()}
+            async for batch in stream.partitions():
+                self._load_answers(batch, ids, positions, last)
+
+            stream = await db.stream(packed.execution_options(yield_per=PACKED_BATCH))
+            last = {"submission_id": None, "seen": set()}
+            async for documents in stream.partitions():
+                # (submission_id, question_id, value_text, ...) as the answers query has them
+                batch = [
+                    (submission_id, entry[0]) + entry[2:]
+                    for submission_id, document in documents
+                    for entry in map(packed_entry, document)
+                ]
+                if batch:
+                    self._load_answers(batch, ids, positions, last, decoded=True)
+
+        self._sort()
+        if self.watermark is not None:
+            result = await db.execute(
+                select(SubmissionTombstone.submission_id)
+                .where(
+                    SubmissionTombstone.form_id == self.form_id,
+                    SubmissionTombstone.change_seq > self.watermark
+                )
+            )
+            deleted = np.unique(np.array(result.scalars().all(), dtype=np.int64))
+            if len(deleted):
+                self._drop(deleted)
+
+        self.watermark = change_seq
+
+    def _load_answers(
+        self, batch, ids: np.ndarray, positions: np.ndarray, last: Dict[str, Any], decoded: bool = False
+    ) -> None:
+        """Store a batch of answers; `last` carries the submission being read
+        and the questions already seen in it over to the next batch.
+
+        value_json comes as raw JSON text from answers rows, or already
+        `decoded` from packed documents.
+        """
+        submission_ids = np.fromiter((a[0] for a in batch), dtype=np.int64, count=len(batch))
+        found = np.minimum(np.searchsorted(ids, submission_ids), len(ids) - 1)
+        # Answers of submissions committed after the submissions were read wait for the next refresh
+        known = ids[found] == submission_ids
+        rows = positions[found]
+
+        answered: Dict[int, List[int]] = {}
+        numbers: Dict[int, Tuple[List[int], List[float]]] = {}
+        choices: Dict[Key, Tuple[List[int], List[int]]] = {}
+        seen = last["seen"]
+        for (submission_id, question_id, value_text, value_number, raw_json, value_file), row, ok in zip(
+            batch, rows.tolist(), known.tolist()
+        ):
+            question = self.questions.get(question_id)
+            if not ok or question is None:
+                continue
+            # JSON is decoded only where there is a value; most answers have none
+            if decoded:
+                value_json = raw_json
+            else:
+                value_json = None if raw_json is None or raw_json == "null" else json.loads(raw_json)
+            answer = _AnswerValues(value_text, value_number, value_json, value_file)
+            if not is_answered(answer):
+                continue
+            answered.setdefault(question_id, []).append(row)
+
+            if submission_id != last["submission_id"]:
+                last["submission_id"] = submission_id
+                seen.clear()
+            if question_id in seen:
+                continue
+            seen.add(question_id)
+
+            question_type = question.question_type
+            if question_type in NUMERIC_TYPES:
+                value = answer_number(answer)
+                if value is not None:
+                    target = numbers.setdefault(question_id, ([], []))
+                    target[0].append(row)
+                    target[1].append(value)
+            if question_type in CHOICE_TYPES:
+                multiple = question_type == QuestionType.SELECT_MULTIPLE
+                values = answer_choices(question, answer)
+                for value in (values if multiple else values[:1]):
+                    target = choices.setdefault(("choices" if multiple else "choice", question_id), ([], []))
+                    target[0].append(row)
+                    target[1].append(self._code(question_id, value))
+
+        for question_id, target_rows in answered.items():
+            self._columns[("answered", question_id)][target_rows] = True
+        for question_id, (target_rows, values) in numbers.items():
+            self._columns[("number", question_id)][target_rows] = values
+        for key, (target_rows, codes) in choices.items():
+            if key[0] == "choices":
+                self._columns[key][target_rows, codes] = 1
+            else:
+                self._columns[key][target_rows] = codes
+
+    # Queries
+
+    def mask(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> np.ndarray:
+        """Rows of live submissions matching the filters"""
+        mask = self.column("live").copy()
+        if status:
+            code = self.statuses.index(status) if status in self.statuses else -2
+            mask &= self.column("status") == code
+        created_at = self.column("created_at")
+        if date_from:
+            mask &= created_at >= np.datetime64(_naive_utc(date_from), "us")
+        if date_to:
+            mask &= created_at <= np.datetime64(_naive_utc(date_to), "us")
+        return mask
+
+    def _indicators(self, question_id: int, mask: np.ndarray) -> np.ndarray:
+        """0/1 matrix of selected categories for the rows in `mask`"""
+        if ("choices", question_id) in self._columns:
+            return self.column(("choices", question_id))[mask].astype(np.float64)
+        codes = self.column(("choice", question_id))[mask]
+        indicators = np.zeros((len(codes), len(self.categories[question_id])))
+        chosen = codes >= 0
+        indicators[np.nonzero(chosen)[0], codes[chosen]] = 1.0
+        return indicators
+
+    def crosstab(self, row_question: int, column_question: int, mask: np.ndarray) -> Dict[str, Any]:
+        """Counts of submissions by the categories chosen for two choice questions"""
+        row_labels, column_labels = self.categories[row_question], self.categories[column_question]
+        single = ("choice", row_question) in self._columns and ("choice", column_question) in self._columns
+        if single:
+            a = self.column(("choice", row_question))[mask]
+            b = self.column(("choice", column_question))[mask]
+            both = (a >= 0) & (b >= 0)
+            counts = np.bincount(
+                a[both].astype(np.int64) * len(column_labels) + b[both],
+                minlength=len(row_labels) * len(column_labels)
+            ).reshape(len(row_labels), len(column_labels))
+            total = int(both.sum())
+        else:
+            a, b = self._indicators(row_question, mask), self._indicators(column_question, mask)
+            counts = (a.T @ b).round().astype(np.int64)
+            total = int(((a.sum(axis=1) > 0) & (b.sum(axis=1) > 0)).sum())
+        row_order, column_order = self._label_order(row_question), self._label_order(column_question)
+        return {
+            "row_question_id": row_question,
+            "column_question_id": column_question,
+            "rows": [row_labels[i] for i in row_order],
+            "columns": [column_labels[i] for i in column_order],
+            "counts": counts[np.ix_(np.array(row_order, dtype=np.intp), np.array(column_order, dtype=np.intp))].tolist(),
+            "total": total
+        }
+
+    def _label_order(self, question_id: int) -> List[int]:
+        """Category positions in display order: the form's option order, or by value for ratings"""
+        labels = self.categories[question_id]
+        if self.questions[question_id].question_type == QuestionType.RATING:
+            return sorted(range(len(labels)), key=lambda i: float(labels[i]))
+        return list(range(len(labels)))
+
+    def statistics(self, mask: np.ndarray, now: datetime) -> FormStatistics:
+        """The form statistics, restricted to the rows in `mask`"""
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        week_start = today_start - timedelta(days=today_start.weekday())
+        month_start = today_start.replace(day=1)
+
+        total = int(mask.sum())
+        created_at = self.column("created_at")[mask]
+        durations = self.column("duration")[mask]
+        durations = durations[~np.isnan(durations)]
+        completed_codes = [i for i, s in enumerate(self.statuses) if s in COMPLETED_STATUSES]
+        completed = int(np.isin(self.column("status")[mask], completed_codes).sum())
+
+        stats = []
+        for question in self.questions.values():
+            answered = int(self.column(("answered", question.id))[mask].sum())
+            item = {
+                "question_id": question.id,
+                "label": question.label,
+                "question_type": question.question_type.value,
+                "answered": answered,
+                "skipped": max(total - answered, 0)
+            }
+
+            if question.question_type in CHOICE_TYPES:
+                if question.question_type == QuestionType.SELECT_MULTIPLE:
+                    counts = self.column(("choices", question.id))[mask].sum(axis=0, dtype=np.int64)
+                else:
+                    codes = self.column(("choice", question.id))[mask]
+                    counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[question.id]))
+                item["options"] = {
+                    label: int(count)
+                    for label, count in zip(self.categories[question.id], counts.tolist())
+                    if count > 0
+                }
+
+            if question.question_type in NUMERIC_TYPES:
+                values = self.column(("number", question.id))[mask]
+                values = values[~np.isnan(values)]
+                n = len(values)
+                item["count"] = n
+                item["min"] = float(values.min()) if n else None
+                item["max"] = float(values.max()) if n else None
+                item["mean"] = float(values.mean()) if n else None
+                item["percentiles"] = {
+                    f"p{p}": float(v)
+                    for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES, method="lower"))
+                } if n else {}
+
+            stats.append(item)
+
+        return FormStatistics(
+            total_submissions=total,
+            submissions_today=int((created_at >= np.datetime64(today_start, "us")).sum()),
+            submissions_this_week=int((created_at >= np.datetime64(week_start, "us")).sum()),
+            submissions_this_month=int((created_at >= np.datetime64(month_start, "us")).sum()),
+            average_duration=float(durations.mean()) if len(durations) else None,
+            completion_rate=round(100.0 * completed / total, 2) if total else 0.0,
+            question_stats=stats
+        )
+
+
+class AnswerMatrixCache(SizedLRUCache):
+    """Answer matrices keyed by form id, bounded by their total memory"""
+
+    def get_version(self, form_id: int, version: int) -> Optional[AnswerMatrix]:
+        matrix = self.get(form_id)
+        if matrix is not None and matrix.version != version:
+            # Built for an older definition of the form
+            self.invalidate(form_id)
+            return None
+        return matrix
+
+
+answer_matrices = AnswerMatrixCache(
+    max_bytes=settings.answer_matrix_cache_bytes,
+    sizeof=lambda matrix: matrix.nbytes
+)
+
+
+async def get_answer_matrix(db: AsyncSession, form: CompiledForm) -> AnswerMatrix:
+    """The form's answer matrix, built or brought up to date as needed"""
+    matrix = answer_matrices.get_version(form.id, form.version)
+    if matrix is None:
+        matrix = AnswerMatrix(form)
+    async with matrix.lock:
+        await matrix.refresh(db)
+    # Put back every time so its grown size is accounted for
+    answer_matrices.put(form.id, matrix)
+    return matrix
@@ -0,0 +1,168 @@
+"""Convert forms between answers rows and packed answer documents.
+
+A form's `answer_storage` decides how new submissions are written; this
+converts the ones already stored, a chunk per transaction, so it can run
+against a live database and be re-run to finish an interrupted conversion:
+
+    python -m app.answer_storage pack 12 15
+    python -m app.answer_storage unpack --all
+"""
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Callable, Iterable, List, Optional
+import argparse
+import asyncio
+
+from .compiled import bump_form_version
+from .database import async_session
+from .models import Answer, AnswerStorage, Form, Question, Submission
+from .packed_answers import FIELDS, pack_answers, packed_entry
+
+CONVERT_CHUNK = 500
+
+
+async def strip_packed_answers(db: AsyncSession, form_id: int, question_ids: Iterable[int]) -> int:
+    """Drop answers to deleted questions from a form's packed documents, as
+    the cascade does for answers rows. Returns how many documents changed;
+    the caller commits."""
+    question_ids = set(question_ids)
+    changed = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Submission.id, Submission.packed_answers)
+            .where(
+                Submission.form_id == form_id,
+                Submission.packed_answers.is_not(None),
+                Submission.id > last_id
+            )
+            .order_by(Submission.id)
+            .limit(CONVERT_CHUNK)
+        )
+        rows = result.all()
+        if not rows:
+            return changed
+        last_id = rows[-1].id
+
+        documents = [
+            {"id": submission_id, "packed_answers": [e for e in document if e[0] not in question_ids]}
+            for submission_id, document in rows
+            if any(e[0] in question_ids for e in document)
+        ]
+        if documents:
+            await db.execute(update(Submission), documents)
+            changed += len(documents)
+
+
+async def _pack_chunk(db: AsyncSession, form_id: int, last_id: int) -> List[int]:
+    result = await db.execute(
+        select(Submission.id)
+        .where(Submission.form_id == form_id, Submission.packed_answers.is_(None), Submission.id > last_id)
+        .order_by(Submission.id)
+        .limit(CONVERT_CHUNK)
+    )
+    ids = result.scalars().all()
+    if not ids:
+        return []
+
+    result = await db.execute(
+        select(Answer.submission_id, *(getattr(Answer, field) for field in FIELDS))
+        .where(Answer.submission_id.in_(ids))
+        .order_by(Answer.submission_id, Answer.repeat_index, Answer.id)
+    )
+    answers = {submission_id: [] for submission_id in ids}
+    for row in result:
+        answers[row.submission_id].append(row)
+
+    await db.execute(update(Submission), [
+        {"id": submission_id, "packed_answers": pack_answers(rows)}
+        for submission_id, rows in answers.items()
+    ])
+    await db.execute(delete(Answer).where(Answer.submission_id.in_(ids)))
+    return ids
+
+
+async def _unpack_chunk(db: AsyncSession, form_id: int, last_id: int) -> List[int]:
+    result = await db.execute(
+        select(Submission.id, Submission.created_at, Submission.packed_answers)
+        .where(Submission.form_id == form_id, Submission.packed_answers.is_not(None), Submission.id > last_id)
+        .order_by(Submission.id)
+        .limit(CONVERT_CHUNK)
+    )
+    rows = result.all()
+    if not rows:
+        return []
+
+    # Answers to questions deleted meanwhile would break the foreign key
+    result = await db.execute(select(Question.id).where(Question.form_id == form_id))
+    question_ids = set(result.scalars())
+
+    answer_rows = [
+        {"submission_id": submission_id, "created_at": created_at, **dict(zip(FIELDS, packed_entry(entry)))}
+        for submission_id, created_at, document in rows
+        for entry in document
+        if entry[0] in question_ids
+    ]
+    if answer_rows:
+        await db.execute(insert(Answer).execution_options(render_nulls=True), answer_rows)
+    ids = [row.id for row in rows]
+    await db.execute(update(Submission).where(Submission.id.in_(ids)).values(packed_answers=None))
+    return ids
+
+
+async def convert_form(
+    form_id: int,
+    storage: AnswerStorage,
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """Switch a form to `storage` and convert its stored submissions.
+
+    The form is switched first, so submissions arriving meanwhile are
+    written in the new layout, then the existing ones are converted in
+    chunks of CONVERT_CHUNK, each in its own transaction. The answers read
+    the same in either layout, so change sequences are left alone.
+    Returns how many submissions were converted.
+    """
+    async with async_session() as db:
+        result = await db.execute(select(Form.id).where(Form.id == form_id))
+        if result.scalar_one_or_none() is None:
+            raise LookupError(f"Form {form_id} not found")
+        await db.execute(update(Form).where(Form.id == form_id).values(answer_storage=storage))
+        await bump_form_version(db, form_id)
+        await db.commit()
+
+    convert_chunk = _pack_chunk if storage == AnswerStorage.PACKED else _unpack_chunk
+    converted = 0
+    last_id = 0
+    while True:
+        async with async_session() as db:
+            ids = await convert_chunk(db, form_id, last_id)
+            if not ids:
+                return converted
+            await db.commit()
+        last_id = ids[-1]
+        converted += len(ids)
+        if progress:
+            progress(len(ids))
+
+
+async def main(action: str, form_ids: list, all_forms: bool) -> None:
+    if all_forms:
+        async with async_session() as db:
+            result = await db.execute(select(Form.id).order_by(Form.id))
+            form_ids = result.scalars().all()
+    storage = AnswerStorage.PACKED if action == "pack" else AnswerStorage.ROWS
+    for form_id in form_ids:
+        converted = await convert_form(form_id, storage)
+        print(f"form {form_id}: {converted} submissions converted to {storage.value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("action", choices=["pack", "unpack"])
+    parser.add_argument("form_ids", type=int, nargs="*")
+    parser.add_argument("--all", action="store_true", help="Convert every form")
+    args = parser.parse_args()
+    if not args.form_ids and not args.all:
+        parser.error("give form ids or --all")
+    asyncio.run(main(args.action, args.form_ids, args.all))
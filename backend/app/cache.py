@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded in-process cache with least-recently-used eviction"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 10.0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            with self._lock:
+                # Counted as a hit by the base class, it is really a miss
+                self.hits -= 1
+                self.misses += 1
+                self._data.pop(key, None)
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        super().put(key, (time.monotonic() + self.ttl, value))
+
+
+class SizedLRUCache(LRUCache):
+    """LRU cache bounded by the total size of its entries, as measured by
+    `sizeof`, rather than by their number. Entries larger than the whole
+    budget are not kept. Re-put an entry after it grows so its size is
+    counted again."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int]):
+        super().__init__(maxsize=0)
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self._sizes: Dict[Hashable, int] = {}
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        del stats["maxsize"]
+        stats.update(bytes=self.total_bytes, max_bytes=self.max_bytes)
+        return stats
+
+    def _pop(self, key: Hashable) -> None:
+        if self._data.pop(key, None) is not None:
+            self.total_bytes -= self._sizes.pop(key)
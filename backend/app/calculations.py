@@ -0,0 +1,347 @@
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Set
+import logging
+import math
+
+import numpy as np
+
+from .expressions import ExpressionError, Evaluator, Node, compile_expression, parse, references
+from .models import Question, QuestionType
+from .schemas import AnswerCreate
+from .skip_logic import find_cycle, topological_order
+
+logger = logging.getLogger(__name__)
+
+# Calculated answers are computed by the server: whatever a client sends for
+# a calculate question is replaced. Results are stored as ordinary answers
+# (numbers in value_number, text in value_text, true/false as 1/0) on the
+# first repeat instance. Calculations read the submitted answers, not skip
+# logic; an empty result stores no answer.
+
+
+def stored_value(value: Any) -> Any:
+    """A calculation result as it reads back once stored"""
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return number if not math.isnan(number) else None
+    return value
+
+
+def calculated_answer(question_id: int, value: Any) -> Optional[AnswerCreate]:
+    """The answer to store for a calculation result, or None when empty"""
+    value = stored_value(value)
+    if value is None:
+        return None
+    if isinstance(value, float):
+        return AnswerCreate(question_id=question_id, value_number=value)
+    if isinstance(value, str):
+        return AnswerCreate(question_id=question_id, value_text=value)
+    return AnswerCreate(question_id=question_id, value_json=value)
+
+
+def _calculations(questions: Iterable[Question]):
+    """(question id, formula) for each calculate question that has one"""
+    for question in questions:
+        if question.question_type == QuestionType.CALCULATE and question.calculation and question.calculation.strip():
+            yield question.id, question.calculation
+
+
+def calculation_errors(questions: List[Question]) -> List[str]:
+    """Problems that keep a form's calculations from being evaluated"""
+    errors = []
+    ids = {q.id for q in questions}
+    dependencies: Dict[int, Set[int]] = {}
+
+    for question_id, formula in _calculations(questions):
+        try:
+            refs = references(parse(formula))
+        except ExpressionError as e:
+            errors.append(f"Question {question_id}: invalid calculation: {e}")
+            continue
+        unknown = sorted(refs - ids)
+        if unknown:
+            errors.append(f"Question {question_id}: calculation refers to unknown questions {unknown}")
+        dependencies[question_id] = refs & ids
+
+    cycle = find_cycle(dependencies)
+    if cycle:
+        errors.append("Calculation depends on itself: " + " -> ".join(str(q) for q in cycle))
+    return errors
+
+
+# Vectorized evaluation. Every value is a float64 column with NaN for a
+# missing answer and 1/0 for true/false, which is how the scalar evaluator's
+# results read back once stored. Anything needing text (string literals,
+# selected(), concat() ...) or reading a column that is not purely numeric is
+# left to the scalar evaluator.
+
+class NotVectorizable(Exception):
+    """An expression, or one of the columns it reads, that is not purely numeric"""
+
+
+VectorEvaluator = Callable[[Mapping[int, Optional[np.ndarray]]], np.ndarray]
+
+
+def _truth(column: np.ndarray) -> np.ndarray:
+    return ~np.isnan(column) & (column != 0)
+
+
+def _as_column(mask: np.ndarray) -> np.ndarray:
+    return mask.astype(np.float64)
+
+
+def _constant(value: Any) -> float:
+    if value is None:
+        return math.nan
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    raise NotVectorizable(value)
+
+
+def _divide(op: str, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = a / b if op == "/" else np.fmod(a, b)
+    return np.where(b == 0, math.nan, result)
+
+
+def _round(digits: int) -> Callable[[np.ndarray], np.ndarray]:
+    if digits == 0:
+        # rint rounds half to even, as round() does
+        return np.rint
+    rounder = np.frompyfunc(lambda v: round(v, digits), 1, 1)
+    return lambda column: rounder(column).astype(np.float64)
+
+
+def compile_vector(node: Node) -> VectorEvaluator:
+    """Turn a parsed tree into a function of {question id: column}.
+
+    Raises NotVectorizable for expressions that need the scalar evaluator,
+    and the returned function raises it for a column that is None.
+    """
+    kind = node[0]
+
+    if kind == "const":
+        value = _constant(node[1])
+        return lambda columns: np.float64(value)
+
+    if kind == "ref":
+        question_id = node[1]
+
+        def column(columns):
+            values = columns.get(question_id)
+            if values is None:
+                raise NotVectorizable(question_id)
+            return values
+        return column
+
+    if kind == "not":
+        operand = compile_vector(node[1])
+        return lambda columns: _as_column(~_truth(operand(columns)))
+
+    if kind in ("and", "or"):
+        items = [compile_vector(n) for n in node[1]]
+        combine = np.logical_and if kind == "and" else np.logical_or
+
+        def logical(columns):
+            result = _truth(items[0](columns))
+            for item in items[1:]:
+                result = combine(result, _truth(item(columns)))
+            return _as_column(result)
+        return logical
+
+    if kind == "neg":
+        operand = compile_vector(node[1])
+        return lambda columns: -operand(columns)
+
+    if kind == "cmp":
+        op, left, right = node[1], compile_vector(node[2]), compile_vector(node[3])
+
+        def compare(columns):
+            a, b = left(columns), right(columns)
+            if op in ("=", "!="):
+                equal = (a == b) | (np.isnan(a) & np.isnan(b))
+                return _as_column(equal if op == "=" else ~equal)
+            # NaN compares false, as a missing answer does
+            return _as_column({"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}[op](a, b))
+        return compare
+
+    if kind == "arith":
+        op, left, right = node[1], compile_vector(node[2]), compile_vector(node[3])
+        if op == "+":
+            return lambda columns: left(columns) + right(columns)
+        if op == "-":
+            return lambda columns: left(columns) - right(columns)
+        if op == "*":
+            return lambda columns: left(columns) * right(columns)
+        return lambda columns: _divide(op, left(columns), right(columns))
+
+    if kind == "call":
+        name, args = node[1], node[2]
+        if name == "round":
+            if len(args) > 1 and args[1][0] != "const":
+                raise NotVectorizable(name)
+            digits = _constant(args[1][1]) if len(args) > 1 else 0.0
+            digits = 0 if math.isnan(digits) else int(digits)
+            operand, rounder = compile_vector(args[0]), _round(digits)
+            return lambda columns: rounder(operand(columns))
+
+        items = [compile_vector(n) for n in args]
+        if name == "if":
+            condition, then, otherwise = items
+            return lambda columns: np.where(_truth(condition(columns)), then(columns), otherwise(columns))
+        if name == "number":
+            return items[0]
+        if name == "int":
+            return lambda columns: np.trunc(items[0](columns))
+        if name == "abs":
+            return lambda columns: np.abs(items[0](columns))
+        if name == "empty":
+            return lambda columns: _as_column(np.isnan(items[0](columns)))
+        if name in ("min", "max", "coalesce"):
+            # fmin/fmax skip NaN the way min()/max() skip missing answers
+            combine = {"min": np.fmin, "max": np.fmax}.get(name)
+
+            def reduce(columns):
+                result = items[0](columns)
+                for item in items[1:]:
+                    value = item(columns)
+                    result = combine(result, value) if combine else np.where(np.isnan(result), value, result)
+                return result
+            return reduce
+
+    raise NotVectorizable(kind)
+
+
+def numeric_column(values: Sequence[Any]) -> Optional[np.ndarray]:
+    """The values as a float64 column, or None unless all are numbers or missing"""
+    for value in values:
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return None
+    return np.array([math.nan if v is None else v for v in values], dtype=np.float64)
+
+
+class _Calculation:
+    __slots__ = ("question_id", "evaluate", "vector")
+
+    def __init__(self, question_id: int, tree: Node):
+        self.question_id = question_id
+        self.evaluate: Evaluator = compile_expression(tree)
+        try:
+            self.vector: Optional[VectorEvaluator] = compile_vector(tree)
+        except NotVectorizable:
+            self.vector = None
+
+
+class CalculationGraph:
+    """Compiled calculations of a form, in dependency order.
+
+    Built once per form version. Submissions are evaluated one at a time
+    with the scalar evaluators; recomputing stored submissions after a
+    formula changes evaluates whole columns at once.
+    """
+
+    def __init__(self, questions: Iterable[Question]):
+        calculations: Dict[int, _Calculation] = {}
+        dependencies: Dict[int, FrozenSet[int]] = {}
+
+        for question_id, formula in _calculations(questions):
+            try:
+                tree = parse(formula)
+            except ExpressionError:
+                logger.warning("Ignoring invalid calculation on question %s", question_id)
+                continue
+            calculations[question_id] = _Calculation(question_id, tree)
+            dependencies[question_id] = references(tree)
+
+        cycle = find_cycle(dependencies)
+        while cycle:
+            # Publishing refuses cycles; older forms may still have one
+            logger.warning("Ignoring calculation cycle %s", cycle)
+            for question_id in cycle:
+                calculations.pop(question_id, None)
+                dependencies.pop(question_id, None)
+            cycle = find_cycle(dependencies)
+
+        self.calculations = calculations
+        self.dependencies = dependencies
+        self.order = [q for q in topological_order(dependencies) if q in calculations]
+
+    def __bool__(self) -> bool:
+        return bool(self.calculations)
+
+    def __contains__(self, question_id: int) -> bool:
+        return question_id in self.calculations
+
+    def answers(self, values: Dict[int, Any]) -> List[AnswerCreate]:
+        """Evaluate every calculation for one submission.
+
+        Results are added to `values` as they are computed, so later
+        calculations and skip logic can read them.
+        """
+        answers = []
+        for question_id in self.order:
+            value = stored_value(self.calculations[question_id].evaluate(values))
+            if value is None:
+                values.pop(question_id, None)
+                continue
+            values[question_id] = value
+            answers.append(calculated_answer(question_id, value))
+        return answers
+
+    def downstream(self, question_ids: Iterable[int]) -> List[int]:
+        """Calculations affected by a change to these questions, in evaluation order"""
+        changed = set(question_ids)
+        affected = []
+        for question_id in self.order:
+            if question_id in changed or self.dependencies[question_id] & changed:
+                changed.add(question_id)
+                affected.append(question_id)
+        return affected
+
+    def inputs(self, targets: Iterable[int]) -> Set[int]:
+        """Questions the target calculations read, other than the targets themselves"""
+        targets = set(targets)
+        needed = set()
+        for question_id in targets:
+            needed |= self.dependencies[question_id]
+        return needed - targets
+
+    def evaluate_columns(self, targets: Sequence[int], values: Dict[int, List[Any]], rows: int) -> Dict[int, List[Any]]:
+        """Evaluate `targets` (in evaluation order) for many submissions.
+
+        `values` maps each input question to one value per submission; the
+        results are added to it, one list per target. Calculations that are
+        purely numeric run as NumPy column operations, the rest row by row.
+        """
+        columns: Dict[int, Optional[np.ndarray]] = {}
+        for question_id in targets:
+            calculation = self.calculations[question_id]
+            result = None
+            if calculation.vector is not None:
+                needed = self.dependencies[question_id]
+                for ref in needed:
+                    if ref not in columns:
+                        columns[ref] = numeric_column(values.get(ref) or [None] * rows)
+                try:
+                    column = np.broadcast_to(calculation.vector(columns), (rows,)).astype(np.float64)
+                except NotVectorizable:
+                    pass
+                else:
+                    columns[question_id] = column
+                    result = [None if math.isnan(v) else v for v in column.tolist()]
+
+            if result is None:
+                needed = [ref for ref in self.dependencies[question_id] if ref in values]
+                evaluate = calculation.evaluate
+                result = [
+                    stored_value(evaluate({ref: values[ref][row] for ref in needed}))
+                    for row in range(rows)
+                ]
+                columns.pop(question_id, None)
+            values[question_id] = result
+        return values
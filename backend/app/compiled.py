@@ -0,0 +1,144 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from typing import Optional
+
+from .cache import LRUCache
+from .calculations import CalculationGraph
+from .config import settings
+from .models import AnswerStorage, Form, Question, QuestionType
+from .schemas import FormResponse, QuestionResponse
+from .skip_logic import RelevanceGraph
+from .validation import FormValidator
+
+
+class CompiledQuestion:
+    """Per-question facts needed while ingesting answers"""
+
+    __slots__ = ("id", "question_type", "label", "required", "option_values")
+
+    def __init__(self, question: Question):
+        self.id = question.id
+        self.question_type = QuestionType(question.question_type)
+        self.label = question.label
+        self.required = bool(question.required)
+        self.option_values = tuple(
+            str(opt.get("value")) for opt in (question.options or []) if isinstance(opt, dict)
+        )
+
+
+class CompiledForm:
+    """Read-only snapshot of a form definition at a given version.
+
+    Holds everything the public fill path needs so that it does not have to
+    reload and re-serialize the questions on every request.
+    """
+
+    def __init__(self, form: Form):
+        questions = sorted(form.questions, key=lambda x: x.order)
+
+        self.id = form.id
+        self.version = form.version
+        self.owner_id = form.owner_id
+        self.status = form.status
+        self.is_public = form.is_public
+        self.allow_anonymous = form.allow_anonymous
+        self.submission_limit = form.submission_limit
+        self.start_date = form.start_date
+        self.end_date = form.end_date
+        self.packed = form.answer_storage == AnswerStorage.PACKED
+
+        self.questions = tuple(CompiledQuestion(q) for q in questions)
+        self.question_map = {q.id: q for q in self.questions}
+        self.question_ids = frozenset(self.question_map)
+        self.required_ids = frozenset(q.id for q in questions if q.required)
+        self.validator = FormValidator(questions)
+        self.relevance = RelevanceGraph(questions)
+        self.calculations = CalculationGraph(questions)
+
+        # Public representation, serialized once per version
+        self.public_body = FormResponse(
+            id=form.id,
+            title=form.title,
+            description=form.description,
+            status=form.status,
+            settings=form.settings,
+            is_public=form.is_public,
+            allow_anonymous=form.allow_anonymous,
+            submission_limit=form.submission_limit,
+            start_date=form.start_date,
+            end_date=form.end_date,
+            owner_id=None,  # Hide owner for public access
+            created_at=form.created_at,
+            updated_at=form.updated_at,
+            questions=[QuestionResponse.model_validate(q) for q in questions],
+            submission_count=0,
+            answer_storage=form.answer_storage
+        ).model_dump_json().encode()
+
+
+class FormCache(LRUCache):
+    """LRU cache of compiled forms keyed by form id and version"""
+
+    def get_version(self, form_id: int, version: int) -> Optional[CompiledForm]:
+        with self._lock:
+            compiled = self._data.get(form_id)
+            if compiled is None or compiled.version != version:
+                # Missing, or left over from an older version of the form
+                self._data.pop(form_id, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(form_id)
+            self.hits += 1
+            return compiled
+
+
+form_cache = FormCache(maxsize=settings.form_cache_size)
+
+
+async def get_compiled_form(
+    db: AsyncSession,
+    form_id: int,
+    version: Optional[int] = None
+) -> Optional[CompiledForm]:
+    """Return the compiled definition of a form, compiling it on a cache miss.
+
+    Callers that already read the form's version can pass it to skip the
+    version lookup.
+    """
+    if version is None:
+        # Forms waiting for the background purge are gone for every reader
+        result = await db.execute(select(Form.version).where(Form.id == form_id, Form.deleted_at.is_(None)))
+        version = result.scalar_one_or_none()
+
+    if version is None:
+        return None
+
+    compiled = form_cache.get_version(form_id, version)
+    if compiled is not None:
+        return compiled
+
+    result = await db.execute(
+        select(Form)
+        .options(selectinload(Form.questions))
+        .where(Form.id == form_id)
+    )
+    form = result.scalar_one_or_none()
+
+    if not form:
+        return None
+
+    compiled = CompiledForm(form)
+    form_cache.put(form_id, compiled)
+    return compiled
+
+
+async def bump_form_version(db: AsyncSession, form_id: int) -> None:
+    """Mark a form definition as changed so cached compilations are discarded"""
+    await db.execute(
+        update(Form)
+        .where(Form.id == form_id)
+        .values(version=Form.version + 1, updated_at=datetime.utcnow())
+    )
+    form_cache.invalidate(form_id)
@@ -28,6 +28,30 @@ class Settings(BaseSettings):
     upload_dir: str = "uploads"
     max_upload_size: int = 10 * 1024 * 1024  # 10MB
     
+    # Submissions
+    bulk_submission_max_items: int = 1000  # Payloads accepted by one bulk upload
+    ingest_buffer_enabled: bool = False  # Acknowledge submits once journaled, store them in batches
+    ingest_journal_path: str = "ingest.journal"  # Each worker journals to this path plus its pid
+    ingest_rejected_path: str = "ingest.rejected"  # Acknowledged submissions that could not be stored
+    ingest_batch_size: int = 500  # Submissions written per transaction
+    ingest_flush_interval: float = 0.05  # Seconds to wait for a batch to fill
+    answer_storage_default: str = "rows"  # Layout of new forms: "rows" or "packed" (one document per submission)
+    
+    # Export
+    export_chunk_size: int = 1000  # Submissions fetched per round trip while exporting
+    export_row_group_size: int = 50000  # Rows per Parquet row group / Arrow batch
+    export_workers: int = 2  # Background export jobs running at once
+    export_cache_dir: str = "exports"
+    export_cache_ttl: float = 6 * 60 * 60  # Seconds finished exports are kept
+    
+    # Deletion
+    form_purge_batch_size: int = 1000  # Submissions deleted per transaction when purging a form in the background
+    
+    # Caches
+    form_cache_size: int = 512  # Compiled form definitions kept in memory
+    statistics_cache_ttl: float = 10.0  # Seconds a form's statistics are reused
+    answer_matrix_cache_bytes: int = 256 * 1024 * 1024  # Memory for per-form answer matrices
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,72 @@
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from .models import Form
+
+# Every insert, modification and deletion of a submission takes the next
+# value of its form's change sequence; submissions changed together by one
+# bulk update may share a number. Sequence numbers are handed out under
+# the form's row lock, so they become visible in commit order and can serve
+# as watermarks for incremental exports.
+
+
+async def reserve_submissions(db: AsyncSession, form_id: int, count: int = 1) -> Optional[int]:
+    """Atomically take `count` slots from a form's submission counter.
+
+    The increment only applies while the form stays within its
+    `submission_limit`, so concurrent submits cannot overshoot it. Returns
+    the last of the `count` change sequence numbers assigned to the new
+    submissions, or None when the limit would be exceeded. The form row
+    stays locked until the surrounding transaction ends.
+    """
+    result = await db.execute(
+        update(Form)
+        .where(and_(
+            Form.id == form_id,
+            or_(
+                Form.submission_limit.is_(None),
+                Form.submission_limit == 0,
+                Form.submission_count + count <= Form.submission_limit
+            )
+        ))
+        .values(
+            submission_count=Form.submission_count + count,
+            change_seq=Form.change_seq + count
+        )
+        .returning(Form.change_seq)
+    )
+    return result.scalar_one_or_none()
+
+
+async def release_submissions(db: AsyncSession, form_id: int, count: int = 1) -> int:
+    """Give back counter slots after submissions are deleted.
+
+    Returns the last change sequence number assigned to the deletions.
+    """
+    result = await db.execute(
+        update(Form)
+        .where(Form.id == form_id)
+        .values(
+            submission_count=Form.submission_count - count,
+            change_seq=Form.change_seq + count
+        )
+        .returning(Form.change_seq)
+    )
+    return result.scalar_one()
+
+
+async def next_change_seq(db: AsyncSession, form_id: int, count: int = 1) -> int:
+    """Assign change sequence numbers to modified submissions; returns the last one"""
+    result = await db.execute(
+        update(Form)
+        .where(Form.id == form_id)
+        .values(change_seq=Form.change_seq + count)
+        .returning(Form.change_seq)
+    )
+    return result.scalar_one()
+
+
+async def current_change_seq(db: AsyncSession, form_id: int) -> int:
+    result = await db.execute(select(Form.change_seq).where(Form.id == form_id))
+    return result.scalar_one_or_none() or 0
@@ -0,0 +1,221 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+import aiofiles
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+from .compiled import CompiledForm
+from .config import settings
+from .counters import current_change_seq
+from .exports import STREAMERS, count_export_rows
+from .schemas import ExportRequest
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_SAVE_INTERVAL = 1.0  # Seconds between progress writes of a running job
+
+
+class ExportJob:
+    """State of one background export"""
+
+    def __init__(self, form: CompiledForm, config: ExportRequest, cache_key: str, path: Path):
+        self.id = uuid.uuid4().hex
+        self.form_id = form.id
+        self.owner_id = form.owner_id
+        self.config = config
+        self.cache_key = cache_key
+        self.path = path
+        self.status = "queued"  # queued, running, completed, failed
+        self.rows_done = 0
+        self.rows_total: Optional[int] = None
+        self.cached = False
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def advance(self, rows: int) -> None:
+        self.rows_done += rows
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "form_id": self.form_id,
+            "owner_id": self.owner_id,
+            "config": self.config.model_dump(mode="json"),
+            "cache_key": self.cache_key,
+            "path": str(self.path),
+            "status": self.status,
+            "rows_done": self.rows_done,
+            "rows_total": self.rows_total,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExportJob":
+        job = cls.__new__(cls)
+        job.id = data["id"]
+        job.form_id = data["form_id"]
+        job.owner_id = data["owner_id"]
+        job.config = ExportRequest.model_validate(data["config"])
+        job.cache_key = data["cache_key"]
+        job.path = Path(data["path"])
+        job.status = data["status"]
+        job.rows_done = data["rows_done"]
+        job.rows_total = data["rows_total"]
+        job.cached = data["cached"]
+        job.error = data["error"]
+        job.created_at = datetime.fromisoformat(data["created_at"])
+        job.finished_at = datetime.fromisoformat(data["finished_at"]) if data["finished_at"] else None
+        return job
+
+
+class ExportJobManager:
+    """Runs exports in a bounded pool of background tasks.
+
+    Finished files are kept in `export_cache_dir` under a key derived from the
+    export parameters and the state of the form's data, so asking again for
+    an unchanged dataset is served from disk without regenerating it. Each
+    job's state is saved next to them as `<job id>.job`, so any worker can
+    report on a job and serve its file, not only the one running it.
+    """
+
+    def __init__(self, cache_dir: str, workers: int, ttl: float):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self._running: Dict[str, ExportJob] = {}
+        self._tasks = set()
+        self._slots = asyncio.Semaphore(workers)
+
+    async def cache_key(self, db: AsyncSession, form: CompiledForm, config: ExportRequest) -> str:
+        """Changes whenever the form definition or its submissions change"""
+        # Every insert, modification and deletion advances the change sequence
+        change_seq = await current_change_seq(db, form.id)
+        state = {
+            "form_id": form.id,
+            "version": form.version,
+            "change_seq": change_seq,
+            "config": config.model_dump(mode="json")
+        }
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+    async def submit(self, db: AsyncSession, form: CompiledForm, config: ExportRequest) -> ExportJob:
+        self._prune()
+
+        key = await self.cache_key(db, form, config)
+        # An identical export is already being produced
+        if key in self._running:
+            return self._running[key]
+
+        job = ExportJob(form, config, key, self.cache_dir / f"{key}.{config.format}")
+
+        if job.path.exists():
+            job.status = "completed"
+            job.cached = True
+            job.finished_at = datetime.utcnow()
+            self._save(job)
+            return job
+
+        self._running[key] = job
+        self._save(job)
+        task = asyncio.create_task(self._run(job, form))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        # Jobs running here have fresher progress than their saved state
+        for job in self._running.values():
+            if job.id == job_id:
+                return job
+        # Ids come from URLs; anything but a job id must not reach the path
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id)) as f:
+                return ExportJob.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _state_path(self, job_id: str) -> Path:
+        return self.cache_dir / f"{job_id}.job"
+
+    def _save(self, job: ExportJob) -> None:
+        """Write the job's state, replacing the previous one atomically"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._state_path(job.id)
+        tmp_path = path.with_suffix(".job.part")
+        with open(tmp_path, "w") as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    async def _run(self, job: ExportJob, form: CompiledForm) -> None:
+        tmp_path = job.path.with_suffix(f".{job.id}.part")
+        saved_at = 0.0
+
+        def advance(rows: int) -> None:
+            nonlocal saved_at
+            job.advance(rows)
+            if time.monotonic() - saved_at >= PROGRESS_SAVE_INTERVAL:
+                saved_at = time.monotonic()
+                self._save(job)
+
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.rows_total = await count_export_rows(form.id, job.config)
+                self._save(job)
+
+                async with aiofiles.open(tmp_path, "wb") as f:
+                    async for chunk in STREAMERS[job.config.format](form, job.config, advance):
+                        await f.write(chunk)
+
+                os.replace(tmp_path, job.path)
+                job.status = "completed"
+        except asyncio.CancelledError:
+            # Saved as failed so other workers do not report it running forever
+            job.status = "failed"
+            job.error = "Export was interrupted"
+            raise
+        except Exception as exc:
+            logger.exception("Export job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(exc) or exc.__class__.__name__
+        finally:
+            job.finished_at = datetime.utcnow()
+            try:
+                self._save(job)
+            except OSError:
+                logger.exception("Could not save state of export job %s", job.id)
+            self._running.pop(job.cache_key, None)
+            tmp_path.unlink(missing_ok=True)
+
+    def _prune(self) -> None:
+        """Delete cached files and job states past their TTL"""
+        now = time.time()
+        if not self.cache_dir.exists():
+            return
+        for path in self.cache_dir.iterdir():
+            if path.suffix != ".part" and now - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+export_jobs = ExportJobManager(
+    cache_dir=settings.export_cache_dir,
+    workers=settings.export_workers,
+    ttl=settings.export_cache_ttl
+)
@@ -0,0 +1,465 @@
+from sqlalchemy import select, func, and_
+from sqlalchemy.orm import selectinload
+from datetime import date, datetime, time, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import aiofiles
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+
+from .compiled import CompiledForm
+from .config import settings
+from .database import async_session
+from .models import Submission, SubmissionTombstone, QuestionType
+from .schemas import ExportRequest
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file"
+}
+
+# Formats backed by optional packages
+REQUIRED_MODULES = {
+    "xlsx": "openpyxl",
+    "parquet": "pyarrow",
+    "arrow": "pyarrow"
+}
+
+NUMERIC_TYPES = {QuestionType.INTEGER, QuestionType.DECIMAL, QuestionType.RANGE, QuestionType.RATING}
+TEMPORAL_TYPES = {
+    QuestionType.DATE: date.fromisoformat,
+    QuestionType.DATETIME: datetime.fromisoformat,
+    QuestionType.TIME: time.fromisoformat
+}
+
+
+Progress = Optional[Callable[[int], None]]
+
+
+def export_available(format: str) -> bool:
+    module = REQUIRED_MODULES.get(format)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def answer_value(answer) -> Any:
+    """First populated value of an answer, in text/number/json order"""
+    if answer.value_text is not None:
+        return answer.value_text
+    if answer.value_number is not None:
+        return answer.value_number
+    return answer.value_json
+
+
+class ExportLayout:
+    """Column layout of an export, shared by every output format"""
+
+    def __init__(self, form: CompiledForm, include_metadata: bool):
+        self.questions = form.questions
+        self.include_metadata = include_metadata
+
+    def headers(self) -> List[str]:
+        headers = ["ID", "Fecha", "Estado"]
+        if self.include_metadata:
+            headers.extend(["IP", "Latitud", "Longitud"])
+        headers.extend([q.label[:50] for q in self.questions])
+        return headers
+
+    def row(self, sub: Submission) -> List[Any]:
+        row = [sub.id, sub.created_at, sub.status]
+        if self.include_metadata:
+            geo = sub.geolocation or {}
+            row.extend([sub.ip_address, geo.get("lat"), geo.get("lng")])
+
+        answer_map = {a.question_id: a for a in sub.answers}
+        for q in self.questions:
+            answer = answer_map.get(q.id)
+            row.append(answer_value(answer) if answer else None)
+        return row
+
+    def record(self, sub: Submission) -> Dict[str, Any]:
+        record = {
+            "id": sub.id,
+            "submitted_at": sub.created_at.isoformat(),
+            "status": sub.status
+        }
+        if self.include_metadata:
+            record["ip_address"] = sub.ip_address
+            record["geolocation"] = sub.geolocation
+
+        answer_map = {a.question_id: a for a in sub.answers}
+        for q in self.questions:
+            answer = answer_map.get(q.id)
+            if answer:
+                record[q.label[:50]] = answer_value(answer)
+        return record
+
+
+class Tombstone:
+    """A deleted submission, shaped like a Submission with status "deleted".
+
+    Lets every export format carry deletions without special cases.
+    """
+
+    status = "deleted"
+    ip_address = None
+    geolocation = None
+    answers = ()
+
+    def __init__(self, tombstone: SubmissionTombstone):
+        self.id = tombstone.submission_id
+        self.created_at = tombstone.deleted_at
+
+
+def _export_query(form_id: int, config: ExportRequest):
+    query = select(Submission).where(Submission.form_id == form_id)
+
+    if config.date_from:
+        query = query.where(Submission.created_at >= config.date_from)
+    if config.date_to:
+        query = query.where(Submission.created_at <= config.date_to)
+    if config.since is not None:
+        query = query.where(Submission.change_seq > config.since)
+        if config.until is not None:
+            query = query.where(Submission.change_seq <= config.until)
+    return query
+
+
+def _tombstone_query(form_id: int, config: ExportRequest):
+    query = select(SubmissionTombstone).where(and_(
+        SubmissionTombstone.form_id == form_id,
+        SubmissionTombstone.change_seq > config.since
+    ))
+    if config.until is not None:
+        query = query.where(SubmissionTombstone.change_seq <= config.until)
+    return query
+
+
+async def count_export_rows(form_id: int, config: ExportRequest) -> int:
+    query = _export_query(form_id, config).with_only_columns(func.count(Submission.id))
+    async with async_session() as session:
+        result = await session.execute(query)
+        count = result.scalar() or 0
+        if config.since is not None:
+            query = _tombstone_query(form_id, config).with_only_columns(func.count(SubmissionTombstone.id))
+            result = await session.execute(query)
+            count += result.scalar() or 0
+        return count
+
+
+async def iter_submissions(
+    form_id: int,
+    config: ExportRequest,
+    progress: Progress = None
+) -> AsyncIterator[Submission]:
+    """Stream a form's submissions with their answers from a server-side cursor.
+
+    Uses its own session: the request's session is closed before a streaming
+    response starts sending its body. `progress` is called once per row.
+    """
+    query = _export_query(form_id, config)
+    query = query.options(selectinload(Submission.answer_rows))
+    if config.since is not None:
+        # Incremental exports follow the change sequence
+        query = query.order_by(Submission.change_seq.asc())
+    else:
+        query = query.order_by(Submission.created_at.asc(), Submission.id.asc())
+    query = query.execution_options(yield_per=settings.export_chunk_size)
+
+    async with async_session() as session:
+        result = await session.stream_scalars(query)
+        async for sub in result:
+            yield sub
+            if progress:
+                progress(1)
+
+        # Incremental exports also report what was deleted since the watermark
+        if config.since is not None:
+            query = _tombstone_query(form_id, config).order_by(SubmissionTombstone.change_seq.asc())
+            result = await session.stream_scalars(query.execution_options(yield_per=settings.export_chunk_size))
+            async for tombstone in result:
+                yield Tombstone(tombstone)
+                if progress:
+                    progress(1)
+
+
+def _csv_cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+async def stream_csv(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    layout = ExportLayout(form, config.include_metadata)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(layout.headers())
+    # BOM so Excel detects UTF-8
+    yield buffer.getvalue().encode("utf-8-sig")
+
+    pending = 0
+    buffer.seek(0)
+    buffer.truncate()
+    async for sub in iter_submissions(form.id, config, progress):
+        writer.writerow([_csv_cell(v) for v in layout.row(sub)])
+        pending += 1
+        if pending >= settings.export_chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def stream_ndjson(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    layout = ExportLayout(form, config.include_metadata)
+    lines = []
+    async for sub in iter_submissions(form.id, config, progress):
+        lines.append(json.dumps(layout.record(sub), ensure_ascii=False, default=str))
+        if len(lines) >= settings.export_chunk_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def stream_json(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    layout = ExportLayout(form, config.include_metadata)
+    separator = "[\n"
+    async for sub in iter_submissions(form.id, config, progress):
+        yield (separator + json.dumps(layout.record(sub), indent=2, ensure_ascii=False, default=str)).encode()
+        separator = ",\n"
+
+    yield b"[]" if separator == "[\n" else b"\n]"
+
+
+def _typed_cell(question_type: QuestionType, value: Any) -> Any:
+    """Native spreadsheet value for an answer: numbers, dates and times stay typed"""
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if question_type in NUMERIC_TYPES and isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, float) and value.is_integer() and question_type in NUMERIC_TYPES:
+        return int(value)
+    if question_type in TEMPORAL_TYPES and isinstance(value, str):
+        try:
+            value = TEMPORAL_TYPES[question_type](value)
+        except ValueError:
+            return value
+        # Spreadsheets have no time zones
+        if getattr(value, "tzinfo", None) is not None:
+            if isinstance(value, datetime):
+                value = value.astimezone(timezone.utc)
+            value = value.replace(tzinfo=None)
+    return value
+
+
+async def _stream_file(path: str) -> AsyncIterator[bytes]:
+    try:
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(64 * 1024):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+async def stream_xlsx(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    from openpyxl import Workbook
+
+    layout = ExportLayout(form, config.include_metadata)
+    question_types = [q.question_type for q in layout.questions]
+    offset = len(layout.headers()) - len(question_types)
+
+    # Write-only workbooks spool rows to disk instead of keeping cells in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(layout.headers())
+
+    async for sub in iter_submissions(form.id, config, progress):
+        row = layout.row(sub)
+        for i, question_type in enumerate(question_types):
+            row[offset + i] = _typed_cell(question_type, row[offset + i])
+        sheet.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(workbook.save, path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    async for chunk in _stream_file(path):
+        yield chunk
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _choices(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [str(v) for v in value if v is not None]
+    return [v for v in str(value).split(",") if v]
+
+
+def _coordinates(value: Any) -> Tuple[Optional[float], Optional[float]]:
+    """(lat, lng) from {"lat", "lng"}, [lat, lng] or "lat lng" answers"""
+    if isinstance(value, dict):
+        return _number(value.get("lat", value.get("latitude"))), _number(value.get("lng", value.get("longitude")))
+    if isinstance(value, str):
+        value = value.replace(",", " ").split()
+    if isinstance(value, (list, tuple)) and len(value) >= 2:
+        return _number(value[0]), _number(value[1])
+    return None, None
+
+
+def _columnar_fields(pa, form: CompiledForm, include_metadata: bool) -> List[Tuple[str, Any, Callable]]:
+    """(name, arrow type, extractor) for every column of a columnar export.
+
+    Extractors take the submission and its answers by question id.
+    """
+    fields = [
+        ("id", pa.int64(), lambda sub, answers: sub.id),
+        ("submitted_at", pa.timestamp("us"), lambda sub, answers: sub.created_at),
+        ("status", pa.string(), lambda sub, answers: sub.status)
+    ]
+    if include_metadata:
+        fields.extend([
+            ("ip_address", pa.string(), lambda sub, answers: sub.ip_address),
+            ("latitude", pa.float64(), lambda sub, answers: _number((sub.geolocation or {}).get("lat"))),
+            ("longitude", pa.float64(), lambda sub, answers: _number((sub.geolocation or {}).get("lng")))
+        ])
+
+    names = {name for name, _, _ in fields}
+    for q in form.questions:
+        name = q.label[:50]
+        if name in names:
+            name = f"{name}_{q.id}"
+        names.add(name)
+
+        def value(sub, answers, question_id=q.id):
+            answer = answers.get(question_id)
+            return answer_value(answer) if answer else None
+
+        if q.question_type in NUMERIC_TYPES:
+            fields.append((name, pa.float64(), lambda sub, answers, v=value: _number(v(sub, answers))))
+        elif q.question_type == QuestionType.SELECT_MULTIPLE:
+            fields.append((name, pa.list_(pa.string()), lambda sub, answers, v=value: _choices(v(sub, answers))))
+        elif q.question_type == QuestionType.GEOPOINT:
+            fields.append((f"{name}_lat", pa.float64(), lambda sub, answers, v=value: _coordinates(v(sub, answers))[0]))
+            fields.append((f"{name}_lng", pa.float64(), lambda sub, answers, v=value: _coordinates(v(sub, answers))[1]))
+        else:
+            fields.append((name, pa.string(), lambda sub, answers, v=value: _text(v(sub, answers))))
+    return fields
+
+
+async def _stream_columnar(
+    form: CompiledForm,
+    config: ExportRequest,
+    open_writer,
+    progress: Progress = None
+) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+
+    fields = _columnar_fields(pa, form, config.include_metadata)
+    schema = pa.schema([(name, type_) for name, type_, _ in fields])
+
+    fd, path = tempfile.mkstemp(suffix=f".{config.format}")
+    os.close(fd)
+    try:
+        writer = open_writer(path, schema)
+        columns = [[] for _ in fields]
+        rows = 0
+
+        async def flush():
+            batch = pa.record_batch(
+                [pa.array(values, type=type_) for values, (_, type_, _) in zip(columns, fields)],
+                schema=schema
+            )
+            await asyncio.to_thread(writer.write_batch, batch)
+            for values in columns:
+                values.clear()
+
+        # Each batch becomes one row group, so memory is bounded by its size
+        async for sub in iter_submissions(form.id, config, progress):
+            answers = {a.question_id: a for a in sub.answers}
+            for values, (_, _, extract) in zip(columns, fields):
+                values.append(extract(sub, answers))
+            rows += 1
+            if rows % settings.export_row_group_size == 0:
+                await flush()
+
+        if rows % settings.export_row_group_size or not rows:
+            await flush()
+        await asyncio.to_thread(writer.close)
+    except Exception:
+        os.remove(path)
+        raise
+
+    async for chunk in _stream_file(path):
+        yield chunk
+
+
+def stream_parquet(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    import pyarrow.parquet as pq
+
+    return _stream_columnar(
+        form, config,
+        lambda path, schema: pq.ParquetWriter(path, schema, compression="zstd"),
+        progress
+    )
+
+
+def stream_arrow(form: CompiledForm, config: ExportRequest, progress: Progress = None) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+
+    return _stream_columnar(
+        form, config,
+        lambda path, schema: pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")),
+        progress
+    )
+
+
+STREAMERS = {
+    "csv": stream_csv,
+    "json": stream_json,
+    "ndjson": stream_ndjson,
+    "xlsx": stream_xlsx,
+    "parquet": stream_parquet,
+    "arrow": stream_arrow
+}
@@ -0,0 +1,420 @@
+"""Form expressions used by skip logic conditions and calculations.
+
+The syntax follows XLSForm: answers are referenced as ``${<question id>}``,
+with the usual comparison (``= != < <= > >=``), arithmetic (``+ - * / div
+mod``) and boolean (``and or not``) operators, string and number literals,
+``true``/``false``/``null`` and a small set of functions::
+
+    ${12} = 'yes' and (${14} >= 18 or selected(${15}, 'minor'))
+    if(empty(${20}), 0, ${20} * 1.16)
+
+Expressions are parsed by hand into a tuple tree and compiled into nested
+closures; nothing is ever passed to eval(). Missing answers are null: they
+make comparisons false and arithmetic null, and count as false in boolean
+context.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+import math
+import re
+
+MAX_LENGTH = 2000
+MAX_NESTING = 50  # Parentheses, function calls and unary operators inside each other
+MAX_DEPTH = 200  # Levels of the parsed tree, so evaluation stays clear of the recursion limit
+
+Node = Tuple
+Evaluator = Callable[[Mapping[int, Any]], Any]
+
+
+class ExpressionError(ValueError):
+    """An expression that cannot be parsed"""
+
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<ref>\$\{\s*(?P<ref_id>\d+)\s*\})
+      | (?P<number>\d+(?:\.\d*)?|\.\d+)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<op><=|>=|!=|<>|==|[=<>+\-*/(),])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_-]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "div", "mod", "true", "false", "null"}
+
+# name: (min args, max args); None means any number
+FUNCTIONS: Dict[str, Tuple[int, Optional[int]]] = {
+    "if": (3, 3),
+    "selected": (2, 2),
+    "count_selected": (1, 1),
+    "empty": (1, 1),
+    "number": (1, 1),
+    "string_length": (1, 1),
+    "coalesce": (2, None),
+    "concat": (1, None),
+    "round": (1, 2),
+    "int": (1, 1),
+    "abs": (1, 1),
+    "min": (1, None),
+    "max": (1, None),
+}
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise ExpressionError(f"Unexpected character at position {pos + 1}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        if match.group("ref"):
+            tokens.append(("ref", int(match.group("ref_id"))))
+        elif match.group("number"):
+            tokens.append(("num", float(match.group("number"))))
+        elif match.group("string"):
+            tokens.append(("str", match.group("string")[1:-1]))
+        elif match.group("op"):
+            op = match.group("op")
+            tokens.append(("op", {"==": "=", "<>": "!="}.get(op, op)))
+        else:
+            name = match.group("name").lower().replace("-", "_")
+            tokens.append(("kw" if name in _KEYWORDS else "name", name))
+    tokens.append(("end", None))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the token list, lowest precedence first"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self) -> Tuple[str, Any]:
+        return self.tokens[self.pos]
+
+    def take(self) -> Tuple[str, Any]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, kind: str, value: Any) -> bool:
+        if self.tokens[self.pos] == (kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, value: Any) -> None:
+        if not self.accept(kind, value):
+            found = self.peek()[1]
+            raise ExpressionError(f"Expected {value!r} but found {found if found is not None else 'end'!r}")
+
+    def parse(self) -> Node:
+        node = self.or_expr()
+        if self.peek()[0] != "end":
+            raise ExpressionError(f"Unexpected {self.peek()[1]!r}")
+        return node
+
+    def or_expr(self) -> Node:
+        items = [self.and_expr()]
+        while self.accept("kw", "or"):
+            items.append(self.and_expr())
+        return items[0] if len(items) == 1 else ("or", tuple(items))
+
+    def and_expr(self) -> Node:
+        items = [self.not_expr()]
+        while self.accept("kw", "and"):
+            items.append(self.not_expr())
+        return items[0] if len(items) == 1 else ("and", tuple(items))
+
+    def not_expr(self) -> Node:
+        if self.accept("kw", "not"):
+            return ("not", self.nested(self.not_expr))
+        return self.comparison()
+
+    def comparison(self) -> Node:
+        left = self.additive()
+        kind, value = self.peek()
+        if kind == "op" and value in ("=", "!=", "<", "<=", ">", ">="):
+            self.take()
+            return ("cmp", value, left, self.additive())
+        return left
+
+    def additive(self) -> Node:
+        node = self.term()
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in ("+", "-"):
+                self.take()
+                node = ("arith", value, node, self.term())
+            else:
+                return node
+
+    def term(self) -> Node:
+        node = self.unary()
+        while True:
+            kind, value = self.peek()
+            if (kind == "op" and value in ("*", "/")) or (kind == "kw" and value in ("div", "mod")):
+                self.take()
+                node = ("arith", {"div": "/", "mod": "%"}.get(value, value), node, self.unary())
+            else:
+                return node
+
+    def unary(self) -> Node:
+        if self.accept("op", "-"):
+            return ("neg", self.nested(self.unary))
+        return self.primary()
+
+    def nested(self, rule: Callable[[], Node]) -> Node:
+        self.depth += 1
+        if self.depth > MAX_NESTING:
+            raise ExpressionError("Expression is nested too deeply")
+        try:
+            return rule()
+        finally:
+            self.depth -= 1
+
+    def primary(self) -> Node:
+        kind, value = self.take()
+        if kind == "num":
+            return ("const", value)
+        if kind == "str":
+            return ("const", value)
+        if kind == "ref":
+            return ("ref", value)
+        if kind == "kw" and value in ("true", "false", "null"):
+            return ("const", {"true": True, "false": False, "null": None}[value])
+        if kind == "op" and value == "(":
+            node = self.nested(self.or_expr)
+            self.expect("op", ")")
+            return node
+        if kind == "name":
+            if value not in FUNCTIONS:
+                raise ExpressionError(f"Unknown function {value!r}")
+            self.expect("op", "(")
+            args = []
+            if not self.accept("op", ")"):
+                args.append(self.nested(self.or_expr))
+                while self.accept("op", ","):
+                    args.append(self.nested(self.or_expr))
+                self.expect("op", ")")
+            low, high = FUNCTIONS[value]
+            if len(args) < low or (high is not None and len(args) > high):
+                raise ExpressionError(f"Wrong number of arguments for {value}()")
+            return ("call", value, tuple(args))
+        raise ExpressionError(f"Unexpected {value if value is not None else 'end'!r}")
+
+
+@lru_cache(maxsize=4096)
+def parse(text: str) -> Node:
+    """Parse an expression into a tree, raising ExpressionError if invalid"""
+    if len(text) > MAX_LENGTH:
+        raise ExpressionError(f"Expression is longer than {MAX_LENGTH} characters")
+    if not text.strip():
+        raise ExpressionError("Expression is empty")
+    node = _Parser(_tokenize(text)).parse()
+    if _depth(node) > MAX_DEPTH:
+        raise ExpressionError("Expression is too long a chain of operations")
+    return node
+
+
+def _children(node: Node) -> Tuple:
+    kind = node[0]
+    if kind in ("and", "or"):
+        return node[1]
+    if kind in ("not", "neg"):
+        return (node[1],)
+    if kind in ("cmp", "arith"):
+        return node[2:]
+    if kind == "call":
+        return node[2]
+    return ()
+
+
+def _depth(node: Node) -> int:
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in _children(node))
+    return deepest
+
+
+def references(node: Node) -> FrozenSet[int]:
+    """Question ids an expression reads"""
+    found = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node[0] == "ref":
+            found.add(node[1])
+        stack.extend(_children(node))
+    return frozenset(found)
+
+
+# Value semantics shared by every evaluator
+
+def to_number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, (list, dict)):
+        return None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return " ".join(to_text(v) for v in value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def truthy(value: Any) -> bool:
+    if value is None or value == "" or value == []:
+        return False
+    if isinstance(value, str):
+        return value.lower() not in ("false", "0")
+    return bool(value)
+
+
+def _choices(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [to_text(v) for v in value if v is not None]
+    return to_text(value).replace(",", " ").split()
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    if op in ("=", "!="):
+        if left is None or right is None:
+            equal = _is_empty(left) and _is_empty(right)
+        else:
+            a, b = to_number(left), to_number(right)
+            if a is not None and b is not None and not (isinstance(left, str) and isinstance(right, str)):
+                equal = a == b
+            else:
+                equal = to_text(left) == to_text(right)
+        return equal if op == "=" else not equal
+
+    if _is_empty(left) or _is_empty(right):
+        return False
+    a, b = to_number(left), to_number(right)
+    if a is None or b is None:
+        # Text such as ISO dates compares lexically
+        a, b = to_text(left), to_text(right)
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+def _arith(op: str, left: Any, right: Any) -> Optional[float]:
+    a, b = to_number(left), to_number(right)
+    if a is None or b is None:
+        return None
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if b == 0:
+        return None
+    return a / b if op == "/" else math.fmod(a, b)
+
+
+def _call(name: str, args: List[Any]) -> Any:
+    if name == "selected":
+        return to_text(args[1]) in _choices(args[0])
+    if name == "count_selected":
+        return float(len(_choices(args[0])))
+    if name == "empty":
+        return _is_empty(args[0])
+    if name == "number":
+        return to_number(args[0])
+    if name == "string_length":
+        return float(len(to_text(args[0])))
+    if name == "coalesce":
+        return next((a for a in args if not _is_empty(a)), None)
+    if name == "concat":
+        return "".join(to_text(a) for a in args)
+    if name in ("min", "max"):
+        numbers = [n for n in map(to_number, args) if n is not None]
+        return (min if name == "min" else max)(numbers) if numbers else None
+    number = to_number(args[0])
+    if number is None:
+        return None
+    if name == "round":
+        digits = int(to_number(args[1]) or 0) if len(args) > 1 else 0
+        return float(round(number, digits))
+    if name == "int":
+        return float(math.trunc(number))
+    return abs(number)
+
+
+def compile_expression(node: Node) -> Evaluator:
+    """Turn a parsed tree into a function of {question id: value}"""
+    kind = node[0]
+
+    if kind == "const":
+        value = node[1]
+        return lambda values: value
+
+    if kind == "ref":
+        question_id = node[1]
+        return lambda values: values.get(question_id)
+
+    if kind == "not":
+        operand = compile_expression(node[1])
+        return lambda values: not truthy(operand(values))
+
+    if kind == "and":
+        items = [compile_expression(n) for n in node[1]]
+        return lambda values: all(truthy(item(values)) for item in items)
+
+    if kind == "or":
+        items = [compile_expression(n) for n in node[1]]
+        return lambda values: any(truthy(item(values)) for item in items)
+
+    if kind == "neg":
+        operand = compile_expression(node[1])
+
+        def negate(values):
+            number = to_number(operand(values))
+            return -number if number is not None else None
+        return negate
+
+    if kind == "cmp":
+        op, left, right = node[1], compile_expression(node[2]), compile_expression(node[3])
+        return lambda values: _compare(op, left(values), right(values))
+
+    if kind == "arith":
+        op, left, right = node[1], compile_expression(node[2]), compile_expression(node[3])
+        return lambda values: _arith(op, left(values), right(values))
+
+    if kind == "call":
+        name, args = node[1], [compile_expression(n) for n in node[2]]
+        if name == "if":
+            condition, then, otherwise = args
+            return lambda values: then(values) if truthy(condition(values)) else otherwise(values)
+        return lambda values: _call(name, [arg(values) for arg in args])
+
+    raise ExpressionError(f"Unknown node {kind!r}")
@@ -0,0 +1,87 @@
+from sqlalchemy import delete, select
+from typing import Dict
+import asyncio
+import logging
+
+from .answer_matrix import answer_matrices
+from .compiled import form_cache
+from .config import settings
+from .database import async_session
+from .models import Answer, Form, Question, QuestionRollup, Submission, SubmissionTombstone
+from .statistics import statistics_cache
+
+logger = logging.getLogger(__name__)
+
+
+class FormPurger:
+    """Deletes soft-deleted forms in the background.
+
+    A form deleted in the background is hidden at once by setting its
+    `deleted_at`; its submissions with their answers, and its tombstones,
+    are then deleted `batch_size` at a time, one transaction per batch, so
+    no statement holds locks for long. Its rollups, questions and the form
+    row go last. Children are deleted explicitly rather than left to ON
+    DELETE CASCADE, for databases app.schema_upgrade has not reached.
+    Purges cut short by a restart are picked up again by `resume`.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def schedule(self, form_id: int) -> None:
+        if form_id in self._tasks:
+            return
+        task = asyncio.create_task(self._purge(form_id))
+        self._tasks[form_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(form_id, None))
+
+    async def resume(self) -> None:
+        """Schedule every form left soft-deleted"""
+        async with async_session() as db:
+            result = await db.execute(select(Form.id).where(Form.deleted_at.is_not(None)))
+            for form_id in result.scalars():
+                self.schedule(form_id)
+
+    async def _delete_batch(self, model, form_id: int) -> int:
+        async with async_session() as db:
+            result = await db.execute(select(model.id).where(model.form_id == form_id).limit(self.batch_size))
+            ids = result.scalars().all()
+            if not ids:
+                return 0
+            if model is Submission:
+                await db.execute(delete(Answer).where(Answer.submission_id.in_(ids)))
+            await db.execute(delete(model).where(model.id.in_(ids)))
+            await db.commit()
+            return len(ids)
+
+    async def _purge(self, form_id: int) -> None:
+        try:
+            for model in (Submission, SubmissionTombstone):
+                while await self._delete_batch(model, form_id):
+                    # Let requests run between batches
+                    await asyncio.sleep(0)
+
+            async with async_session() as db:
+                await db.execute(delete(QuestionRollup).where(QuestionRollup.form_id == form_id))
+                await db.execute(delete(Question).where(Question.form_id == form_id))
+                await db.execute(delete(Form).where(Form.id == form_id))
+                await db.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Purging form %s failed; it stays hidden until the next start", form_id)
+            return
+        finally:
+            form_cache.invalidate(form_id)
+            statistics_cache.invalidate(form_id)
+            answer_matrices.invalidate(form_id)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+form_purger = FormPurger(batch_size=settings.form_purge_batch_size)
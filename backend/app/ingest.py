@@ -0,0 +1,483 @@
+from fastapi import Request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .calculations import calculated_answer, stored_value
+from .compiled import CompiledForm
+from .counters import reserve_submissions, release_submissions, next_change_seq
+from .database import dialect_insert
+from .models import Submission, Answer, User, FormStatus
+from .packed_answers import FIELDS as PACKED_FIELDS, pack_answers, packed_entry
+from .schemas import SubmissionCreate, SubmissionResponse, AnswerCreate, AnswerResponse
+from .skip_logic import answer_values
+from .statistics import rollup_deltas, apply_rollups
+
+
+class IngestError(Exception):
+    """A submission that cannot be stored, with the HTTP status to report"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class Origin:
+    """Who sent a submission, and when it was received"""
+
+    __slots__ = ("user_id", "ip_address", "user_agent", "received_at")
+
+    def __init__(
+        self,
+        user_id: Optional[int],
+        ip_address: Optional[str],
+        user_agent: str,
+        received_at: datetime
+    ):
+        self.user_id = user_id
+        self.ip_address = ip_address
+        self.user_agent = user_agent
+        self.received_at = received_at
+
+    @classmethod
+    def from_request(cls, request: Request, current_user: Optional[User], now: datetime) -> "Origin":
+        return cls(
+            user_id=current_user.id if current_user else None,
+            ip_address=request.client.host if request.client else None,
+            user_agent=request.headers.get("user-agent", "")[:500],
+            received_at=now
+        )
+
+
+class PendingSubmission:
+    """A checked submission waiting to be written"""
+
+    __slots__ = ("data", "answers", "origin", "id", "duplicate", "change_seq", "created_at", "answer_keys")
+
+    def __init__(self, data: SubmissionCreate, answers: List[AnswerCreate], origin: Origin):
+        self.data = data
+        self.answers = answers
+        self.origin = origin
+        self.id: Optional[int] = None
+        # Set when `id` is a submission stored earlier with the same client_uuid
+        self.duplicate = False
+        self.change_seq: Optional[int] = None
+        self.created_at: Optional[datetime] = None
+        # (id, created_at) of each stored answer, in the order of `answers`;
+        # the id is None for packed answers
+        self.answer_keys: List[Tuple[Optional[int], datetime]] = []
+
+
+def check_form_open(form: CompiledForm, current_user: Optional[User], now: datetime) -> None:
+    """Raise IngestError unless the form currently accepts submissions from this user"""
+    if form.status != FormStatus.PUBLISHED and (not current_user or form.owner_id != current_user.id):
+        raise IngestError(403, "Form is not published")
+
+    if not form.allow_anonymous and not current_user:
+        raise IngestError(401, "Authentication required")
+
+    if form.start_date and now < form.start_date:
+        raise IngestError(403, "Form not yet available")
+    if form.end_date and now > form.end_date:
+        raise IngestError(403, "Form has expired")
+
+
+def check_submission(form: CompiledForm, data: SubmissionCreate, origin: Origin) -> PendingSubmission:
+    """Check a payload against the form and keep the answers worth storing.
+
+    Calculated answers are computed here, replacing any the client sent.
+    Missing required answers fail with 400, except for questions hidden by
+    skip logic; answers breaking their question's validation rules fail
+    with 422 and one error per answer.
+    """
+    # Answers to unknown questions are dropped
+    answers = [a for a in data.answers if a.question_id in form.question_ids]
+
+    values = None
+    if form.calculations:
+        answers = [a for a in answers if a.question_id not in form.calculations]
+        values = answer_values(answers)
+        answers.extend(form.calculations.answers(values))
+
+    missing_required = form.required_ids - {a.question_id for a in answers}
+    if missing_required and form.relevance:
+        missing_required -= form.relevance.hidden(values if values is not None else answer_values(answers))
+    if missing_required:
+        raise IngestError(400, f"Missing required questions: {missing_required}")
+
+    errors = form.validator.validate(answers)
+    if errors:
+        raise IngestError(422, errors)
+
+    return PendingSubmission(data, answers, origin)
+
+
+async def _reserve(db: AsyncSession, form_id: int, pending: Sequence[PendingSubmission]) -> int:
+    """Take counter slots for as many submissions as the limit allows.
+
+    Assigns change sequence numbers and returns how many were accepted,
+    always a prefix of `pending`.
+    """
+    last_seq = await reserve_submissions(db, form_id, len(pending))
+    if last_seq is not None:
+        first_seq = last_seq - len(pending) + 1
+        for offset, item in enumerate(pending):
+            item.change_seq = first_seq + offset
+        return len(pending)
+
+    # Not enough room for all of them; take the remaining slots one by one
+    accepted = 0
+    for item in pending:
+        change_seq = await reserve_submissions(db, form_id)
+        if change_seq is None:
+            break
+        item.change_seq = change_seq
+        accepted += 1
+    return accepted
+
+
+async def _find_stored(db: AsyncSession, form_id: int, client_uuids) -> dict:
+    """Ids of the form's submissions stored under these client_uuids, by uuid;
+    other forms may use the same uuids"""
+    result = await db.execute(
+        select(Submission.client_uuid, Submission.id)
+        .where(Submission.form_id == form_id, Submission.client_uuid.in_(client_uuids))
+    )
+    return dict(result.all())
+
+
+async def _skip_duplicates(
+    db: AsyncSession,
+    form_id: int,
+    pending: Sequence[PendingSubmission]
+) -> List[PendingSubmission]:
+    """Mark submissions whose client_uuid is already stored for the form, or
+    repeated in `pending`, as duplicates; returns the ones still to be written"""
+    by_uuid = {}
+    for item in pending:
+        if item.data.client_uuid is not None:
+            by_uuid.setdefault(str(item.data.client_uuid), []).append(item)
+    if not by_uuid:
+        return list(pending)
+
+    stored = await _find_stored(db, form_id, list(by_uuid))
+    for client_uuid, items in by_uuid.items():
+        # Only the first of several items with one client_uuid is written
+        for item in items[1:]:
+            item.duplicate = True
+        if client_uuid in stored:
+            items[0].id = stored[client_uuid]
+            items[0].duplicate = True
+    return [item for item in pending if not item.duplicate]
+
+
+def _link_duplicates(pending: Sequence[PendingSubmission]) -> None:
+    """Point repeats within one batch at the submission written for them"""
+    first = {}
+    for item in pending:
+        if item.data.client_uuid is None:
+            continue
+        key = str(item.data.client_uuid)
+        if key not in first:
+            first[key] = item
+        elif item.id is None:
+            item.id = first[key].id
+
+
+async def store_submissions(
+    db: AsyncSession,
+    form: CompiledForm,
+    pending: Sequence[PendingSubmission]
+) -> int:
+    """Write checked submissions of one form with multi-row inserts.
+
+    Generated keys come back through RETURNING, so the stored rows never have
+    to be selected again. Forms in packed storage write each submission's
+    answers as one document on its row instead of answers rows. A submission whose client_uuid is already stored
+    for the form gets the stored id and is flagged as a duplicate instead of
+    being written again. Submissions beyond the form's submission limit are left
+    without an id. Returns how many were newly stored; the caller commits.
+    """
+    if not pending:
+        return 0
+
+    fresh = await _skip_duplicates(db, form.id, pending)
+    accepted = await _reserve(db, form.id, fresh) if fresh else 0
+    stored = fresh[:accepted]
+    if not stored:
+        _link_duplicates(pending)
+        return 0
+
+    submission_rows = [
+        {
+            "form_id": form.id,
+            "user_id": item.origin.user_id,
+            "status": item.data.status,
+            "ip_address": item.origin.ip_address,
+            "user_agent": item.origin.user_agent,
+            "geolocation": item.data.geolocation or {},
+            "started_at": item.origin.received_at,
+            "completed_at": item.origin.received_at if item.data.status == "completed" else None,
+            "change_seq": item.change_seq,
+            "client_uuid": str(item.data.client_uuid) if item.data.client_uuid else None
+        }
+        for item in stored
+    ]
+    if form.packed:
+        for row, item in zip(submission_rows, stored):
+            row["packed_answers"] = pack_answers(item.answers)
+
+    # Rows are matched back by key rather than by RETURNING order, which
+    # not every dialect can guarantee for a batched insert
+    result = await db.execute(
+        dialect_insert(db)(Submission)
+        .on_conflict_do_nothing(index_elements=[Submission.form_id, Submission.client_uuid])
+        .returning(Submission.id, Submission.change_seq, Submission.created_at),
+        submission_rows
+    )
+    by_seq = {item.change_seq: item for item in stored}
+    for submission_id, change_seq, created_at in result:
+        item = by_seq[change_seq]
+        item.id = submission_id
+        item.created_at = created_at
+
+    # A concurrent retry stored the same client_uuid first; hand back its slots
+    raced = [item for item in stored if item.id is None]
+    if raced:
+        await release_submissions(db, form.id, len(raced))
+        existing = await _find_stored(db, form.id, [str(item.data.client_uuid) for item in raced])
+        for item in raced:
+            item.id = existing.get(str(item.data.client_uuid))
+            item.duplicate = True
+        stored = [item for item in stored if not item.duplicate]
+    _link_duplicates(pending)
+
+    if form.packed:
+        # Packed answers have no keys of their own
+        for item in stored:
+            item.answer_keys = [(None, item.created_at)] * len(item.answers)
+    answer_rows = [] if form.packed else [
+        {
+            "submission_id": item.id,
+            "question_id": answer.question_id,
+            "value_text": answer.value_text,
+            "value_number": answer.value_number,
+            "value_json": answer.value_json,
+            "value_file": answer.value_file,
+            "repeat_index": answer.repeat_index
+        }
+        for item in stored
+        for answer in item.answers
+    ]
+    if answer_rows:
+        result = await db.execute(
+            insert(Answer)
+            .returning(Answer.id, Answer.submission_id, Answer.question_id, Answer.repeat_index, Answer.created_at)
+            .execution_options(render_nulls=True),
+            answer_rows
+        )
+        keys = {}
+        for answer_id, submission_id, question_id, repeat_index, created_at in result:
+            keys.setdefault((submission_id, question_id, repeat_index), []).append((answer_id, created_at))
+        for item in stored:
+            item.answer_keys = [
+                keys[(item.id, answer.question_id, answer.repeat_index)].pop(0)
+                for answer in item.answers
+            ]
+
+    deltas = {}
+    for item in stored:
+        rollup_deltas(form, item.answers, deltas=deltas)
+    await apply_rollups(db, form.id, deltas)
+    return len(stored)
+
+
+RECOMPUTE_CHUNK = 500
+
+
+def _first_values(rows) -> Dict[int, Dict[int, Any]]:
+    """{question id: {submission id: value}} from the first instance of each answer"""
+    found: Dict[int, Dict[int, Any]] = {}
+    for submission_id, question_id, value_text, value_number, value_json in rows:
+        by_submission = found.setdefault(question_id, {})
+        if submission_id in by_submission:
+            continue
+        if value_text is not None:
+            by_submission[submission_id] = value_text
+        elif value_number is not None:
+            by_submission[submission_id] = value_number
+        else:
+            by_submission[submission_id] = value_json
+    return found
+
+
+async def recompute_calculations(db: AsyncSession, form: CompiledForm, changed: Iterable[int]) -> int:
+    """Bring stored calculated answers up to date after `changed` questions changed.
+
+    `form` is compiled from the new definition. Only calculations downstream
+    of `changed` are evaluated, over all stored submissions at once, and
+    only submissions whose result differs are rewritten; those take new
+    change sequence numbers so incremental exports pick them up. Packed
+    submissions have their documents rewritten instead of their answers
+    rows. Returns how many submissions changed; the caller commits.
+    """
+    targets = form.calculations.downstream(changed)
+    if not targets:
+        return 0
+
+    result = await db.execute(
+        select(Submission.id).where(Submission.form_id == form.id).order_by(Submission.id)
+    )
+    submission_ids = result.scalars().all()
+    if not submission_ids:
+        return 0
+
+    # Question ids belong to one form, so they alone select its answers
+    inputs = form.calculations.inputs(targets)
+    read = inputs | set(targets)
+    result = await db.execute(
+        select(Answer.submission_id, Answer.question_id, Answer.value_text, Answer.value_number, Answer.value_json)
+        .where(Answer.question_id.in_(read), Answer.repeat_index == 0)
+        .order_by(Answer.id)
+    )
+    rows = result.all()
+
+    # Submissions stored packed, read a chunk of documents at a time
+    packed: Set[int] = set()
+    stream = await db.stream(
+        select(Submission.id, Submission.packed_answers)
+        .where(Submission.form_id == form.id, Submission.packed_answers.is_not(None))
+        .execution_options(yield_per=RECOMPUTE_CHUNK)
+    )
+    async for submission_id, document in stream:
+        packed.add(submission_id)
+        for entry in document:
+            if entry[0] in read and entry[1] == 0:
+                question_id, _, value_text, value_number, value_json, _ = packed_entry(entry)
+                rows.append((submission_id, question_id, value_text, value_number, value_json))
+    stored = _first_values(rows)
+
+    values = {
+        question_id: [stored.get(question_id, {}).get(s) for s in submission_ids]
+        for question_id in inputs
+    }
+    form.calculations.evaluate_columns(targets, values, len(submission_ids))
+
+    rewrite: Dict[int, Dict[int, Any]] = {}
+    for question_id in targets:
+        previous = stored.get(question_id, {})
+        for submission_id, value in zip(submission_ids, values[question_id]):
+            if stored_value(previous.get(submission_id)) != value:
+                rewrite.setdefault(question_id, {})[submission_id] = value
+    if not rewrite:
+        return 0
+
+    # Rollups are accumulated per submission, as for a delete and a re-insert
+    removed: Dict[int, list] = {}
+    added: Dict[int, list] = {}
+    for question_id, new_values in rewrite.items():
+        changed_ids = [s for s in new_values if s not in packed]
+        for start in range(0, len(changed_ids), RECOMPUTE_CHUNK):
+            chunk = changed_ids[start:start + RECOMPUTE_CHUNK]
+            result = await db.execute(
+                delete(Answer)
+                .where(Answer.question_id == question_id, Answer.submission_id.in_(chunk))
+                .returning(
+                    Answer.submission_id, Answer.question_id, Answer.value_text,
+                    Answer.value_number, Answer.value_json, Answer.value_file
+                )
+            )
+            for submission_id, *row in result:
+                removed.setdefault(submission_id, []).append(AnswerCreate(
+                    question_id=row[0], value_text=row[1], value_number=row[2], value_json=row[3], value_file=row[4]
+                ))
+
+            rows = []
+            for submission_id in chunk:
+                answer = calculated_answer(question_id, new_values[submission_id])
+                if answer is not None:
+                    added.setdefault(submission_id, []).append(answer)
+                    rows.append({"submission_id": submission_id, **answer.model_dump()})
+            if rows:
+                await db.execute(insert(Answer).execution_options(render_nulls=True), rows)
+
+    # Packed documents are rewritten whole, once for all their changed calculations
+    packed_rewrite: Dict[int, Dict[int, Any]] = {}
+    for question_id, new_values in rewrite.items():
+        for submission_id, value in new_values.items():
+            if submission_id in packed:
+                packed_rewrite.setdefault(submission_id, {})[question_id] = value
+    packed_ids = sorted(packed_rewrite)
+    for start in range(0, len(packed_ids), RECOMPUTE_CHUNK):
+        chunk = packed_ids[start:start + RECOMPUTE_CHUNK]
+        result = await db.execute(
+            select(Submission.id, Submission.packed_answers).where(Submission.id.in_(chunk))
+        )
+        documents = []
+        for submission_id, document in result:
+            new_values = packed_rewrite[submission_id]
+            kept = []
+            for entry in document:
+                if entry[0] not in new_values:
+                    kept.append(entry)
+                    continue
+                removed.setdefault(submission_id, []).append(
+                    AnswerCreate(**dict(zip(PACKED_FIELDS, packed_entry(entry))))
+                )
+            new_answers = [
+                answer for answer in (calculated_answer(q, v) for q, v in new_values.items())
+                if answer is not None
+            ]
+            added.setdefault(submission_id, []).extend(new_answers)
+            document = sorted(kept + pack_answers(new_answers), key=lambda entry: entry[1])
+            documents.append({"id": submission_id, "packed_answers": document})
+        if documents:
+            await db.execute(update(Submission), documents)
+
+    deltas = {}
+    for answers in removed.values():
+        rollup_deltas(form, answers, sign=-1, deltas=deltas)
+    for answers in added.values():
+        rollup_deltas(form, answers, deltas=deltas)
+    await apply_rollups(db, form.id, deltas)
+
+    changed_submissions: Set[int] = set()
+    for new_values in rewrite.values():
+        changed_submissions.update(new_values)
+    changed_submissions = sorted(changed_submissions)
+    last_seq = await next_change_seq(db, form.id, len(changed_submissions))
+    first_seq = last_seq - len(changed_submissions) + 1
+    now = datetime.utcnow()
+    await db.execute(update(Submission), [
+        {"id": submission_id, "change_seq": first_seq + offset, "updated_at": now}
+        for offset, submission_id in enumerate(changed_submissions)
+    ])
+    return len(changed_submissions)
+
+
+def submission_response(form_id: int, item: PendingSubmission) -> SubmissionResponse:
+    """Build the response for a stored submission from what was written"""
+    received_at = item.origin.received_at
+    return SubmissionResponse(
+        id=item.id,
+        form_id=form_id,
+        user_id=item.origin.user_id,
+        status=item.data.status,
+        geolocation=item.data.geolocation or {},
+        client_uuid=item.data.client_uuid,
+        started_at=received_at,
+        completed_at=received_at if item.data.status == "completed" else None,
+        duration_seconds=None,
+        created_at=item.created_at,
+        answers=[
+            AnswerResponse(
+                id=answer_id,
+                submission_id=item.id,
+                created_at=created_at,
+                **answer.model_dump()
+            )
+            for answer, (answer_id, created_at) in zip(item.answers, item.answer_keys)
+        ]
+    )
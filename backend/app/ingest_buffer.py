@@ -0,0 +1,383 @@
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: journals left by dead workers are not claimed
+    fcntl = None
+
+from .compiled import get_compiled_form
+from .config import settings
+from .database import async_session
+from .ingest import IngestError, Origin, check_submission, store_submissions
+from .schemas import SubmissionCreate
+from .statistics import statistics_cache
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ATTEMPTS = 3  # Tries before a batch that keeps failing is split to find the records at fault
+
+
+def _transient(error: Exception) -> bool:
+    """Failures that say nothing about the records, e.g. the database being unreachable"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError, OSError))
+
+
+class IngestBuffer:
+    """Group commit for submissions.
+
+    A checked submission is appended to a local journal and acknowledged once
+    the journal is fsynced; submissions arriving while an fsync is in flight
+    share the next one. A background task drains the journaled submissions
+    into the database in micro-batches of up to `batch_size`, waiting at most
+    `interval` seconds to fill one, and writes each batch in one transaction.
+
+    Every record carries a sequence number, and a commit marker with the last
+    stored number is journaled after each batch. On startup, records past the
+    last marker are replayed. A crash between a database commit and its
+    marker replays that batch again; records are journaled with a
+    client_uuid, generated when the client sent none, so the replay is
+    deduplicated like a client retry instead of storing them twice.
+
+    Each worker process keeps its own journal, `journal_path` suffixed with
+    its pid, held under a lock file for as long as it runs. On startup a
+    worker also takes over the journals whose lock is free, i.e. those left
+    by workers that died, and replays them as its own.
+
+    Acknowledged submissions that cannot be stored after all (the form
+    reached its limit, was deleted or changed) are appended with the reason
+    to `rejected_path` rather than dropped. So are records the database
+    keeps refusing: a batch failing FLUSH_ATTEMPTS times for a reason other
+    than the database being unreachable is split in halves, down to the
+    single records at fault, so one bad record cannot hold up the rest.
+    """
+
+    def __init__(self, journal_path: str, rejected_path: str, batch_size: int, interval: float):
+        self.base_path = Path(journal_path)
+        self.journal_path = self.base_path
+        self.rejected_path = Path(rejected_path)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._seq = 0
+        self._unsynced: List[tuple] = []
+        self._sync_lock = asyncio.Lock()
+        self._journal = None
+        self._lock = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """Replay what this process's journal and those of dead workers
+        hold, then start flushing"""
+        # Named at start rather than at import, as workers may be forked later
+        self.journal_path = self.base_path.with_name(f"{self.base_path.name}.{os.getpid()}")
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = self._claim(self.journal_path, wait=True)
+        records, self._seq = self._read_journal(self.journal_path)
+
+        orphans = self._claim_orphans()
+        for path, _ in orphans:
+            adopted, _ = self._read_journal(path)
+            for record in adopted:
+                self._seq += 1
+                records.append({**record, "seq": self._seq})
+
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        await asyncio.to_thread(self._rewrite, records)
+        # Their records are durable in this journal now
+        for path, lock in orphans:
+            logger.info("Took over journal %s", path)
+            self._release(path, lock, remove=True)
+
+        for record in records:
+            self.queue.put_nowait(record)
+        if records:
+            logger.info("Replaying %d journaled submissions", len(records))
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Write out everything queued, then stop the flusher.
+
+        Whatever cannot be stored within `timeout` stays in the journal.
+        """
+        if self._task is None:
+            return
+        self.queue.put_nowait(None)
+        done, _ = await asyncio.wait([self._task], timeout=timeout)
+        if not done:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._journal.close()
+        self._journal = None
+        self._release(self.journal_path, self._lock)
+        self._lock = None
+
+    async def submit(self, form_id: int, data: SubmissionCreate, origin: Origin) -> int:
+        """Journal a checked submission; returns once it is durable on disk"""
+        self._seq += 1
+        if data.client_uuid is None:
+            # Fixed in the journal, so replaying the record cannot store it twice
+            data = data.model_copy(update={"client_uuid": uuid.uuid4()})
+        record = {
+            "seq": self._seq,
+            "form_id": form_id,
+            "user_id": origin.user_id,
+            "ip_address": origin.ip_address,
+            "user_agent": origin.user_agent,
+            "received_at": origin.received_at.isoformat(),
+            "data": data.model_dump(mode="json")
+        }
+        done = asyncio.get_running_loop().create_future()
+        self._unsynced.append((record, done))
+
+        async with self._sync_lock:
+            # An earlier holder of the lock may have synced this record already
+            if not done.done():
+                batch, self._unsynced = self._unsynced, []
+                try:
+                    await asyncio.to_thread(self._append, [r for r, _ in batch])
+                except Exception as e:
+                    for _, waiter in batch:
+                        waiter.set_exception(e)
+                else:
+                    for r, waiter in batch:
+                        self.queue.put_nowait(r)
+                        waiter.set_result(None)
+
+        await done
+        return record["seq"]
+
+    def _append(self, records: List[dict]) -> None:
+        self._journal.write("".join(json.dumps(r) + "\n" for r in records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    @staticmethod
+    def _lock_path(journal_path: Path) -> Path:
+        return journal_path.with_name(journal_path.name + ".lock")
+
+    def _claim(self, journal_path: Path, wait: bool):
+        """Lock a journal's lock file; None if another live process holds it"""
+        if fcntl is None:
+            return None
+        lock_path = self._lock_path(journal_path)
+        while True:
+            lock = open(lock_path, "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock.close()
+                return None
+            # Whoever held it may have finished with the journal and removed the lock file
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock.fileno()).st_ino:
+                    return lock
+            except FileNotFoundError:
+                pass
+            lock.close()
+            if not wait:
+                return None
+
+    def _claim_orphans(self) -> List[Tuple[Path, object]]:
+        """Journals of workers no longer running, each with its lock held"""
+        if fcntl is None:
+            return []
+        prefix = self.base_path.name + "."
+        # The unsuffixed path is the shared journal of earlier versions
+        candidates = [self.base_path] + [
+            path for path in self.base_path.parent.glob(prefix + "*")
+            if path.name[len(prefix):].isdigit() and path != self.journal_path
+        ]
+        orphans = []
+        for path in candidates:
+            if not path.exists():
+                continue
+            lock = self._claim(path, wait=False)
+            if lock is not None:
+                orphans.append((path, lock))
+        return orphans
+
+    def _release(self, journal_path: Path, lock, remove: bool = False) -> None:
+        if remove:
+            journal_path.unlink(missing_ok=True)
+            self._lock_path(journal_path).unlink(missing_ok=True)
+        if lock is not None:
+            lock.close()
+
+    def _read_journal(self, path: Path) -> Tuple[List[dict], int]:
+        """Records not yet covered by a commit marker, and the last sequence number used"""
+        if not path.exists():
+            return [], 0
+        records: Dict[int, dict] = {}
+        committed = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the end of the file
+                if "committed" in entry:
+                    committed = max(committed, entry["committed"])
+                else:
+                    records[entry["seq"]] = entry
+        return [records[seq] for seq in sorted(records) if seq > committed], max([committed, *records])
+
+    def _rewrite(self, records: List[dict]) -> None:
+        """Replace the journal with just `records`, dropping committed history"""
+        tmp = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            # None is queued by stop() after the last record
+            record = await self.queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            await self._store(batch)
+
+    async def _store(self, batch: List[dict], last: bool = True) -> None:
+        """Flush a batch until it is stored or set aside, then mark it
+        committed; `last` is false for all but the last part of a split batch.
+
+        The records stay in the journal meanwhile, so while the database is
+        unreachable this keeps retrying. Other failures are retried
+        FLUSH_ATTEMPTS times, then the batch is split, and a single record
+        that still fails is set aside as rejected.
+        """
+        attempts = 0
+        while True:
+            try:
+                await self._flush(batch)
+                break
+            except Exception as e:
+                if not _transient(e):
+                    attempts += 1
+                if attempts >= FLUSH_ATTEMPTS:
+                    if len(batch) > 1:
+                        logger.exception("Flushing %d buffered submissions failed, splitting the batch", len(batch))
+                        middle = len(batch) // 2
+                        await self._store(batch[:middle], last=False)
+                        await self._store(batch[middle:], last=last)
+                        return
+                    logger.exception("Setting aside buffered submission %s", batch[0]["seq"])
+                    await asyncio.to_thread(self._reject, [(batch[0], str(getattr(e, "orig", None) or e))])
+                    break
+                logger.exception("Flushing %d buffered submissions failed, retrying", len(batch))
+                await asyncio.sleep(1.0)
+
+        async with self._sync_lock:
+            if last and self.queue.empty() and not self._unsynced:
+                # Everything journaled is stored; start the journal afresh
+                await asyncio.to_thread(self._rewrite, [])
+            else:
+                await asyncio.to_thread(self._append, [{"committed": batch[-1]["seq"]}])
+
+    def _reject(self, rejected: List[Tuple[dict, str]]) -> None:
+        """Keep acknowledged submissions that could not be stored, with why"""
+        now = datetime.utcnow().isoformat()
+        lines = "".join(
+            json.dumps({**record, "rejected": reason, "rejected_at": now}) + "\n"
+            for record, reason in rejected
+        )
+        self.rejected_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            # Shared by all workers
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _flush(self, batch: List[dict]) -> None:
+        if not batch:
+            return
+
+        by_form: Dict[int, List[dict]] = {}
+        for record in batch:
+            by_form.setdefault(record["form_id"], []).append(record)
+
+        rejected: List[Tuple[dict, str]] = []
+        async with async_session() as db:
+            for form_id, records in by_form.items():
+                form = await get_compiled_form(db, form_id)
+                if not form:
+                    rejected.extend((record, "Form not found") for record in records)
+                    continue
+
+                pending = []
+                checked = []
+                for record in records:
+                    origin = Origin(
+                        user_id=record["user_id"],
+                        ip_address=record["ip_address"],
+                        user_agent=record["user_agent"],
+                        received_at=datetime.fromisoformat(record["received_at"])
+                    )
+                    try:
+                        pending.append(check_submission(form, SubmissionCreate(**record["data"]), origin))
+                        checked.append(record)
+                    except IngestError as e:
+                        # The form changed since the submission was accepted
+                        rejected.append((record, e.detail))
+
+                await store_submissions(db, form, pending)
+                for record, item in zip(checked, pending):
+                    if item.id is None:
+                        rejected.append((record, "Form has reached submission limit"))
+            await db.commit()
+
+        if rejected:
+            # Before the commit marker, so a crash replays the batch rather than losing them
+            await asyncio.to_thread(self._reject, rejected)
+            logger.warning("Set aside %d buffered submissions in %s", len(rejected), self.rejected_path)
+
+        for form_id in by_form:
+            statistics_cache.invalidate(form_id)
+
+
+ingest_buffer = IngestBuffer(
+    journal_path=settings.ingest_journal_path,
+    rejected_path=settings.ingest_rejected_path,
+    batch_size=settings.ingest_batch_size,
+    interval=settings.ingest_flush_interval
+)
@@ -6,6 +6,12 @@ import os
 
 from .config import settings
 from .database import init_db
+from .answer_matrix import answer_matrices
+from .compiled import form_cache
+from .statistics import statistics_cache, rollup_backfill
+from .export_jobs import export_jobs
+from .form_purge import form_purger
+from .ingest_buffer import ingest_buffer
 from .routers import auth, forms, submissions, uploads, templates
 
 @asynccontextmanager
@@ -16,9 +22,22 @@ async def lifespan(app: FastAPI):
     # Create upload directory
     os.makedirs(settings.upload_dir, exist_ok=True)
     
+    # Replay journaled submissions and start batching new ones
+    if settings.ingest_buffer_enabled:
+        await ingest_buffer.start()
+    
+    # Finish purging forms deleted in the background before a restart
+    await form_purger.resume()
+    
+    # Build the rollups of forms with submissions from before them
+    rollup_backfill.start()
+    
     yield
     # Shutdown
-    pass
+    await ingest_buffer.stop()
+    await export_jobs.shutdown()
+    await form_purger.shutdown()
+    await rollup_backfill.shutdown()
 
 app = FastAPI(
     title=settings.app_name,
@@ -87,6 +106,15 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/api/health/cache")
+async def cache_stats():
+    """In-process cache hit/miss counters"""
+    return {
+        "forms": form_cache.stats(),
+        "statistics": statistics_cache.stats(),
+        "answer_matrices": answer_matrices.stats()
+    }
+
 @app.get("/api/question-types")
 async def get_question_types():
     """Get all available question types"""
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Float, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Float, Index, Enum as SQLEnum, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
+from .packed_answers import PackedAnswersType, unpack_answers
 import enum
 
 class QuestionType(str, enum.Enum):
@@ -37,6 +38,10 @@ class FormStatus(str, enum.Enum):
     PUBLISHED = "published"
     ARCHIVED = "archived"
 
+class AnswerStorage(str, enum.Enum):
+    ROWS = "rows"  # One answers row per answer
+    PACKED = "packed"  # One packed document per submission, see packed_answers
+
 class User(Base):
     __tablename__ = "users"
     
@@ -64,20 +69,34 @@ class Form(Base):
     is_public = Column(Boolean, default=False)
     allow_anonymous = Column(Boolean, default=True)
     submission_limit = Column(Integer, nullable=True)
+    submission_count = Column(Integer, default=0, server_default="0", nullable=False)  # Maintained on insert/delete
+    change_seq = Column(Integer, default=0, server_default="0", nullable=False)  # Last submission change sequence
     start_date = Column(DateTime, nullable=True)
     end_date = Column(DateTime, nullable=True)
+    version = Column(Integer, default=1, server_default="1", nullable=False)  # Bumped on every definition change
+    deleted_at = Column(DateTime, nullable=True)  # Hidden and waiting for the background purge
+    answer_storage = Column(
+        SQLEnum(AnswerStorage), default=AnswerStorage.ROWS, server_default=AnswerStorage.ROWS.name, nullable=False
+    )  # Layout new submissions are written in; existing ones are converted by app.answer_storage
+    # Whether question_rollups covers every stored submission: true from the
+    # start for new forms, false for forms that predate the rollups until
+    # statistics.rollup_backfill rebuilds them after startup
+    rollups_built = Column(Boolean, default=True, server_default=false(), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     owner = relationship("User", back_populates="forms")
+    # Children are deleted with the form by the ORM as well as by ON DELETE
+    # CASCADE, so deletes work on databases app.schema_upgrade has not reached
     questions = relationship("Question", back_populates="form", cascade="all, delete-orphan", order_by="Question.order")
     submissions = relationship("Submission", back_populates="form", cascade="all, delete-orphan")
+    tombstones = relationship("SubmissionTombstone", cascade="all, delete-orphan")
 
 class Question(Base):
     __tablename__ = "questions"
     
     id = Column(Integer, primary_key=True, index=True)
-    form_id = Column(Integer, ForeignKey("forms.id"), nullable=False)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False, index=True)
     question_type = Column(SQLEnum(QuestionType), nullable=False)
     label = Column(String(500), nullable=False)
     description = Column(Text)
@@ -110,7 +129,7 @@ class Question(Base):
     matrix_columns = Column(JSON, default=[])
     
     # Group settings
-    group_id = Column(Integer, ForeignKey("question_groups.id"), nullable=True)
+    group_id = Column(Integer, ForeignKey("question_groups.id", ondelete="SET NULL"), nullable=True)
     
     # Appearance settings
     appearance = Column(JSON, default={})  # {style, width, etc}
@@ -121,12 +140,13 @@ class Question(Base):
     form = relationship("Form", back_populates="questions")
     group = relationship("QuestionGroup", back_populates="questions")
     answers = relationship("Answer", back_populates="question", cascade="all, delete-orphan")
+    rollups = relationship("QuestionRollup", cascade="all, delete-orphan")
 
 class QuestionGroup(Base):
     __tablename__ = "question_groups"
     
     id = Column(Integer, primary_key=True, index=True)
-    form_id = Column(Integer, ForeignKey("forms.id"), nullable=False)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
     order = Column(Integer, default=0)
@@ -140,9 +160,10 @@ class Submission(Base):
     __tablename__ = "submissions"
     
     id = Column(Integer, primary_key=True, index=True)
-    form_id = Column(Integer, ForeignKey("forms.id"), nullable=False)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     status = Column(String(50), default="completed")  # draft, completed, validated
+    client_uuid = Column(String(36), nullable=True)  # Idempotency key sent by the client, unique per form
     
     # Metadata
     ip_address = Column(String(45))
@@ -155,19 +176,54 @@ class Submission(Base):
     completed_at = Column(DateTime)
     duration_seconds = Column(Integer)
     
+    # Form-wide sequence number of the last insert or modification
+    change_seq = Column(Integer, nullable=True)
+    
+    # Answers of submissions stored packed; NULL when they are answers rows
+    packed_answers = Column(PackedAnswersType, nullable=True)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     form = relationship("Form", back_populates="submissions")
     user = relationship("User", back_populates="submissions")
-    answers = relationship("Answer", back_populates="submission", cascade="all, delete-orphan")
+    answer_rows = relationship("Answer", back_populates="submission", cascade="all, delete-orphan")
+    
+    @property
+    def answers(self):
+        """The submission's answers in either layout; load `answer_rows` with selectinload"""
+        if self.packed_answers is not None:
+            return unpack_answers(self.packed_answers, self.id, self.created_at)
+        return self.answer_rows
+    
+    __table_args__ = (
+        # Serves per-form lookups and keyset pagination over (created_at, id)
+        Index("ix_submissions_form_created", "form_id", "created_at", "id"),
+        Index("ix_submissions_form_change_seq", "form_id", "change_seq"),
+        # Target of ON CONFLICT when storing; retries are only matched within a form
+        Index("ix_submissions_form_client_uuid", "form_id", "client_uuid", unique=True),
+    )
+
+class SubmissionTombstone(Base):
+    """Record of a deleted submission, reported by incremental exports"""
+    __tablename__ = "submission_tombstones"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
+    submission_id = Column(Integer, nullable=False)
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_submission_tombstones_form_change_seq", "form_id", "change_seq"),
+    )
 
 class Answer(Base):
     __tablename__ = "answers"
     
     id = Column(Integer, primary_key=True, index=True)
-    submission_id = Column(Integer, ForeignKey("submissions.id"), nullable=False)
-    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    submission_id = Column(Integer, ForeignKey("submissions.id", ondelete="CASCADE"), nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
     
     # Store different value types
     value_text = Column(Text)
@@ -180,8 +236,33 @@ class Answer(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    submission = relationship("Submission", back_populates="answers")
+    submission = relationship("Submission", back_populates="answer_rows")
     question = relationship("Question", back_populates="answers")
+    
+    __table_args__ = (
+        # Loads a submission's answers, and a form's via submissions, in instance order
+        Index("ix_answers_submission", "submission_id", "repeat_index", "id"),
+        # Serves the cascade from a deleted question
+        Index("ix_answers_question", "question_id"),
+    )
+
+class QuestionRollup(Base):
+    """Running per-question aggregates, updated as answers are stored.
+    
+    Each question has a summary row (empty bucket) with the answered count,
+    sum, min and max of numeric values, plus one row per histogram bucket:
+    "o:<value>" for choices and "p:<i>", "n:<i>", "z" for the log-scaled
+    bins used to estimate percentiles.
+    """
+    __tablename__ = "question_rollups"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(String(255), primary_key=True, default="")
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False, index=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float)
+    minimum = Column(Float)
+    maximum = Column(Float)
 
 class FormTemplate(Base):
     __tablename__ = "form_templates"
@@ -0,0 +1,90 @@
+from typing import List, Optional
+
+# Questions are ordered by sparse integer keys, ORDER_GAP apart when a form
+# is created or respaced, so a question can be moved between two others by
+# giving it a key in the gap without touching its neighbours. Only when a
+# gap runs out (or for forms stored with dense keys) does the whole form get
+# respaced.
+
+ORDER_GAP = 1024
+
+
+def spaced_orders(count: int) -> List[int]:
+    """Keys for `count` questions in order, ORDER_GAP apart"""
+    return [(i + 1) * ORDER_GAP for i in range(count)]
+
+
+def order_between(before: Optional[int], after: Optional[int]) -> Optional[int]:
+    """A key strictly between two neighbouring keys, or None when there is
+    no room left. A missing `before` means the start of the form and a
+    missing `after` its end."""
+    if before is None and after is None:
+        return ORDER_GAP
+    if after is None:
+        return before + ORDER_GAP
+    if before is None:
+        # Keys are not kept positive, so moving to the top never runs out
+        return after - ORDER_GAP
+    if after - before < 2:
+        return None
+    return (before + after) // 2
+
+
+def keep_orders(current: List[Optional[int]]) -> List[int]:
+    """Keys for questions listed in their new order, given each one's
+    current key (None for new questions).
+
+    The longest run of current keys that is still increasing is kept, and
+    the other questions get keys in the gaps around it, so a save writes
+    only the questions that actually moved. If some gap is too narrow the
+    whole list is respaced.
+    """
+    # Longest strictly increasing subsequence of the current keys
+    tails: List[int] = []  # Position ending the best run of each length
+    previous: List[Optional[int]] = [None] * len(current)
+    for position, key in enumerate(current):
+        if key is None:
+            continue
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if current[tails[middle]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        previous[position] = tails[low - 1] if low else None
+        if low == len(tails):
+            tails.append(position)
+        else:
+            tails[low] = position
+    kept = set()
+    position = tails[-1] if tails else None
+    while position is not None:
+        kept.add(position)
+        position = previous[position]
+
+    orders: List[Optional[int]] = [key if i in kept else None for i, key in enumerate(current)]
+    start = 0
+    while start < len(orders):
+        if orders[start] is not None:
+            start += 1
+            continue
+        end = start
+        while end < len(orders) and orders[end] is None:
+            end += 1
+        before = orders[start - 1] if start > 0 else None
+        after = orders[end] if end < len(orders) else None
+        count = end - start
+        if before is None and after is None:
+            keys = spaced_orders(count)
+        elif after is None:
+            keys = [before + (i + 1) * ORDER_GAP for i in range(count)]
+        elif before is None:
+            keys = [after - (count - i) * ORDER_GAP for i in range(count)]
+        elif after - before > count:
+            keys = [before + (after - before) * (i + 1) // (count + 1) for i in range(count)]
+        else:
+            return spaced_orders(len(orders))
+        orders[start:end] = keys
+        start = end
+    return orders
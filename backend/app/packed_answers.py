@@ -0,0 +1,81 @@
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime
+from typing import Any, Iterable, List, Optional
+import json
+import zlib
+
+# Forms in packed storage keep each submission's answers in one document on
+# the submission row instead of one `answers` row per answer. The document
+# is a list of answers in instance order, each a positional list
+#
+#     [question_id, repeat_index, value_text, value_number, value_json, value_file]
+#
+# with trailing nulls left out, so a choice is [12, 0, "a"] and a number
+# [13, 0, null, 5.0]. Postgres stores it as JSONB; other databases get the
+# same document as zlib-compressed JSON.
+
+FIELDS = ("question_id", "repeat_index", "value_text", "value_number", "value_json", "value_file")
+
+
+class PackedAnswersType(TypeDecorator):
+    """A packed answer document: JSONB on Postgres, compressed JSON bytes elsewhere"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB(none_as_null=True))
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return zlib.compress(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode())
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return json.loads(zlib.decompress(value))
+
+
+def pack_answers(answers: Iterable[Any]) -> List[list]:
+    """The packed document for answers (AnswerCreate, Answer rows ...), in instance order"""
+    document = []
+    for answer in sorted(answers, key=lambda a: a.repeat_index or 0):
+        entry = [
+            answer.question_id, answer.repeat_index or 0, answer.value_text,
+            answer.value_number, answer.value_json, answer.value_file
+        ]
+        while len(entry) > 2 and entry[-1] is None:
+            entry.pop()
+        document.append(entry)
+    return document
+
+
+def packed_entry(entry: list) -> tuple:
+    """An entry of a packed document as a full (question_id ... value_file) tuple"""
+    return tuple(entry) + (None,) * (len(FIELDS) - len(entry))
+
+
+class PackedAnswer:
+    """An answer read from a packed document, shaped like an Answer row.
+
+    Packed answers have no row of their own, so `id` is None.
+    """
+
+    __slots__ = FIELDS + ("submission_id", "created_at")
+
+    id = None
+
+    def __init__(self, entry: list, submission_id: Optional[int], created_at: Optional[datetime]):
+        (self.question_id, self.repeat_index, self.value_text,
+         self.value_number, self.value_json, self.value_file) = packed_entry(entry)
+        self.submission_id = submission_id
+        self.created_at = created_at
+
+
+def unpack_answers(document: List[list], submission_id: Optional[int], created_at: Optional[datetime]) -> List[PackedAnswer]:
+    return [PackedAnswer(entry, submission_id, created_at) for entry in document]
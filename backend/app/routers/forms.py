@@ -1,21 +1,94 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, delete
+from sqlalchemy import select, func, and_, delete, insert, update, bindparam
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime
+import hashlib
 
+from ..config import settings
 from ..database import get_db
-from ..models import Form, Question, Submission, User, FormStatus as FormStatusModel
+from ..answer_matrix import answer_matrices, get_answer_matrix
+from ..answer_storage import strip_packed_answers
+from ..calculations import calculation_errors
+from ..compiled import CompiledForm, get_compiled_form, bump_form_version, form_cache
+from ..form_purge import form_purger
+from ..ingest import recompute_calculations
+from ..ordering import ORDER_GAP, keep_orders, order_between, spaced_orders
+from ..skip_logic import logic_errors
+from ..statistics import CHOICE_TYPES, compute_form_statistics, statistics_cache
+from ..models import (
+    Answer, AnswerStorage, Form, Question, QuestionRollup, QuestionType, User, FormStatus as FormStatusModel
+)
 from ..schemas import (
-    FormCreate, FormUpdate, FormResponse, FormListResponse,
-    QuestionCreate, QuestionUpdate, QuestionResponse,
-    FormStatistics, FormStatus
+    FormCreate, FormUpdate, FormDocument, FormResponse, FormListResponse,
+    QuestionBase, QuestionCreate, QuestionUpdate, QuestionResponse, QuestionOrder, QuestionMove,
+    FormStatistics, FormStatus, Crosstab
 )
 from .auth import get_current_user, get_current_user_optional
 
 router = APIRouter(prefix="/forms", tags=["Forms"])
 
+def _form_etag(*parts) -> str:
+    """Strong validator for a form representation"""
+    digest = hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+def _cache_headers(etag: str, updated_at: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+def _logic_errors(questions: List[Question]) -> List[str]:
+    return logic_errors(questions) + calculation_errors(questions)
+
+async def _check_logic(db: AsyncSession, form_id: int):
+    """Refuse to publish skip logic or calculations that cannot be evaluated, e.g. a cycle"""
+    result = await db.execute(select(Question).where(Question.form_id == form_id))
+    errors = _logic_errors(result.scalars().all())
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+async def _recompute_calculations(db: AsyncSession, form_id: int, changed: List[int]) -> int:
+    """Update stored calculated answers for a definition change made in this transaction"""
+    await db.flush()
+    result = await db.execute(
+        select(Form)
+        .options(selectinload(Form.questions))
+        .where(Form.id == form_id)
+        .execution_options(populate_existing=True)
+    )
+    return await recompute_calculations(db, CompiledForm(result.scalar_one()), changed)
+
+def _question_columns(q_data: QuestionBase) -> dict:
+    """Question columns as submitted, without form_id and order"""
+    return dict(
+        question_type=q_data.question_type,
+        label=q_data.label,
+        description=q_data.description,
+        placeholder=q_data.placeholder,
+        required=q_data.required,
+        options=[opt.model_dump() for opt in q_data.options],
+        validation=q_data.validation.model_dump() if q_data.validation else {},
+        skip_logic=q_data.skip_logic.model_dump() if q_data.skip_logic else {},
+        default_value=q_data.default_value,
+        calculation=q_data.calculation,
+        min_value=q_data.min_value,
+        max_value=q_data.max_value,
+        step=q_data.step,
+        matrix_rows=q_data.matrix_rows,
+        matrix_columns=q_data.matrix_columns,
+        appearance=q_data.appearance
+    )
+
 @router.get("", response_model=List[FormListResponse])
 async def list_forms(
     skip: int = Query(0, ge=0),
@@ -26,7 +99,7 @@ async def list_forms(
     current_user: User = Depends(get_current_user)
 ):
     """List all forms for current user"""
-    query = select(Form).where(Form.owner_id == current_user.id)
+    query = select(Form).where(Form.owner_id == current_user.id, Form.deleted_at.is_(None))
     
     if status:
         query = query.where(Form.status == status)
@@ -39,21 +112,15 @@ async def list_forms(
     result = await db.execute(query)
     forms = result.scalars().all()
     
-    # Get submission counts
     form_list = []
     for form in forms:
-        count_result = await db.execute(
-            select(func.count(Submission.id)).where(Submission.form_id == form.id)
-        )
-        submission_count = count_result.scalar() or 0
-        
         form_dict = {
             "id": form.id,
             "title": form.title,
             "description": form.description,
             "status": form.status,
             "is_public": form.is_public,
-            "submission_count": submission_count,
+            "submission_count": form.submission_count,
             "created_at": form.created_at,
             "updated_at": form.updated_at
         }
@@ -79,6 +146,7 @@ async def create_form(
         submission_limit=form_data.submission_limit,
         start_date=form_data.start_date,
         end_date=form_data.end_date,
+        answer_storage=AnswerStorage(form_data.answer_storage or settings.answer_storage_default),
         owner_id=current_user.id
     )
     
@@ -89,26 +157,14 @@ async def create_form(
     for i, q_data in enumerate(form_data.questions):
         question = Question(
             form_id=form.id,
-            question_type=q_data.question_type,
-            label=q_data.label,
-            description=q_data.description,
-            placeholder=q_data.placeholder,
-            required=q_data.required,
-            order=q_data.order if q_data.order else i,
-            options=[opt.model_dump() for opt in q_data.options],
-            validation=q_data.validation.model_dump() if q_data.validation else {},
-            skip_logic=q_data.skip_logic.model_dump() if q_data.skip_logic else {},
-            default_value=q_data.default_value,
-            calculation=q_data.calculation,
-            min_value=q_data.min_value,
-            max_value=q_data.max_value,
-            step=q_data.step,
-            matrix_rows=q_data.matrix_rows,
-            matrix_columns=q_data.matrix_columns,
-            appearance=q_data.appearance
+            order=q_data.order if q_data.order else i * ORDER_GAP,
+            **_question_columns(q_data)
         )
         db.add(question)
     
+    if form.status == FormStatusModel.PUBLISHED:
+        await _check_logic(db, form.id)
+    
     await db.commit()
     await db.refresh(form)
     
@@ -135,35 +191,47 @@ async def create_form(
         created_at=form.created_at,
         updated_at=form.updated_at,
         questions=[QuestionResponse.model_validate(q) for q in form.questions],
-        submission_count=0
+        submission_count=0,
+        answer_storage=form.answer_storage
     )
 
 @router.get("/{form_id}", response_model=FormResponse)
 async def get_form(
     form_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     """Get a form by ID"""
+    # Resolve access and the cache validator without touching the questions
     result = await db.execute(
-        select(Form)
-        .options(selectinload(Form.questions))
-        .where(Form.id == form_id)
+        select(Form.version, Form.updated_at, Form.is_public, Form.owner_id, Form.submission_count)
+        .where(Form.id == form_id, Form.deleted_at.is_(None))
     )
-    form = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not form:
+    if not row:
         raise HTTPException(status_code=404, detail="Form not found")
     
     # Check access
-    if not form.is_public and (not current_user or form.owner_id != current_user.id):
+    if not row.is_public and (not current_user or row.owner_id != current_user.id):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get submission count
-    count_result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.form_id == form.id)
+    submission_count = row.submission_count
+    
+    etag = _form_etag("form", form_id, row.version, submission_count)
+    headers = _cache_headers(etag, row.updated_at, "private, no-cache")
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    
+    result = await db.execute(
+        select(Form)
+        .options(selectinload(Form.questions))
+        .where(Form.id == form_id)
     )
-    submission_count = count_result.scalar() or 0
+    form = result.scalar_one()
     
     return FormResponse(
         id=form.id,
@@ -180,7 +248,8 @@ async def get_form(
         created_at=form.created_at,
         updated_at=form.updated_at,
         questions=[QuestionResponse.model_validate(q) for q in sorted(form.questions, key=lambda x: x.order)],
-        submission_count=submission_count
+        submission_count=submission_count,
+        answer_storage=form.answer_storage
     )
 
 @router.put("/{form_id}", response_model=FormResponse)
@@ -194,7 +263,7 @@ async def update_form(
     result = await db.execute(
         select(Form)
         .options(selectinload(Form.questions))
-        .where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        .where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
@@ -209,15 +278,149 @@ async def update_form(
     for field, value in update_data.items():
         setattr(form, field, value)
     
-    form.updated_at = datetime.utcnow()
+    if update_data.get("status") == FormStatusModel.PUBLISHED:
+        errors = _logic_errors(form.questions)
+        if errors:
+            raise HTTPException(status_code=400, detail=errors)
+    
+    await bump_form_version(db, form.id)
     
     await db.commit()
     await db.refresh(form)
     
-    count_result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.form_id == form.id)
+    return FormResponse(
+        id=form.id,
+        title=form.title,
+        description=form.description,
+        status=form.status,
+        settings=form.settings,
+        is_public=form.is_public,
+        allow_anonymous=form.allow_anonymous,
+        submission_limit=form.submission_limit,
+        start_date=form.start_date,
+        end_date=form.end_date,
+        owner_id=form.owner_id,
+        created_at=form.created_at,
+        updated_at=form.updated_at,
+        questions=[QuestionResponse.model_validate(q) for q in form.questions],
+        submission_count=form.submission_count,
+        answer_storage=form.answer_storage
     )
-    submission_count = count_result.scalar() or 0
+
+@router.put("/{form_id}/document", response_model=FormResponse)
+async def save_form_document(
+    form_id: int,
+    document: FormDocument,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Save a whole form as edited in the builder.
+    
+    The form fields are set and the listed questions are diffed by id
+    against the stored ones: questions without an id are inserted, those
+    named in `deleted_ids` are deleted and, of the rest, only those that
+    differ are updated, each kind with one bulk statement. A stored
+    question that is neither listed nor named fails the save, so a
+    document sent without its questions cannot wipe them. Questions are
+    ordered as listed, keeping the stored order keys that still fit.
+    Everything runs in one transaction with a single version bump.
+    """
+    result = await db.execute(
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
+    )
+    form = result.scalar_one_or_none()
+    
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    # Plain rows, so nothing stale is left in the session after the bulk writes
+    result = await db.execute(select(Question.__table__).where(Question.form_id == form_id))
+    stored = {row["id"]: row for row in result.mappings()}
+    
+    listed = [q.id for q in document.questions if q.id is not None]
+    unknown = [qid for qid in listed if qid not in stored]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Questions {unknown} are not in this form")
+    if len(set(listed)) != len(listed):
+        raise HTTPException(status_code=400, detail="A question is listed more than once")
+    kept = set(listed)
+    deleted = [qid for qid in stored if qid not in kept]
+    missing = [qid for qid in deleted if qid not in set(document.deleted_ids)]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Questions {missing} are neither listed nor in deleted_ids"
+        )
+    
+    orders = keep_orders([stored[q.id]["order"] if q.id is not None else None for q in document.questions])
+    now = datetime.utcnow()
+    inserts = []
+    updates = []
+    changed = set()  # Questions whose change may alter calculated answers
+    for q_data, order in zip(document.questions, orders):
+        columns = _question_columns(q_data)
+        columns["order"] = order
+        if q_data.id is None:
+            inserts.append({"form_id": form_id, **columns})
+            continue
+        # Compared as the builder sees them, e.g. an empty validation as a
+        # rule with every field null
+        row = stored[q_data.id]
+        current = _question_columns(QuestionBase.model_validate(row))
+        current["order"] = row["order"]
+        diff = {field: value for field, value in columns.items() if current[field] != value}
+        if diff:
+            updates.append({"id": q_data.id, "updated_at": now, **diff})
+            if "calculation" in diff or "question_type" in diff:
+                changed.add(q_data.id)
+    for field, value in document.model_dump(exclude_unset=True, exclude={"questions", "deleted_ids"}).items():
+        setattr(form, field, value)
+    modified = bool(deleted or updates or inserts) or db.is_modified(form)
+    
+    if deleted:
+        # Children first, for databases whose foreign keys predate ON DELETE CASCADE
+        await db.execute(delete(Answer).where(Answer.question_id.in_(deleted)))
+        await db.execute(delete(QuestionRollup).where(QuestionRollup.question_id.in_(deleted)))
+        await db.execute(
+            delete(Question).where(Question.id.in_(deleted)).execution_options(synchronize_session=False)
+        )
+        if form.answer_storage == AnswerStorage.PACKED:
+            await strip_packed_answers(db, form_id, deleted)
+        changed.update(deleted)
+    if updates:
+        await db.execute(update(Question), updates)
+    if inserts:
+        result = await db.execute(
+            insert(Question)
+            .returning(Question.id, sort_by_parameter_order=True)
+            .execution_options(render_nulls=True),
+            inserts
+        )
+        changed.update(
+            question_id for question_id, row in zip(result.scalars(), inserts)
+            if row["question_type"] == QuestionType.CALCULATE and row["calculation"]
+        )
+    
+    if form.status == FormStatusModel.PUBLISHED:
+        await _check_logic(db, form_id)
+    recomputed = 0
+    if changed:
+        recomputed = await _recompute_calculations(db, form_id, list(changed))
+    # A save that changed nothing keeps the version, and with it cached copies
+    if modified:
+        await bump_form_version(db, form_id)
+    await db.commit()
+    
+    if recomputed:
+        statistics_cache.invalidate(form_id)
+    
+    result = await db.execute(
+        select(Form)
+        .options(selectinload(Form.questions))
+        .where(Form.id == form_id)
+        .execution_options(populate_existing=True)
+    )
+    form = result.scalar_one()
     
     return FormResponse(
         id=form.id,
@@ -234,26 +437,50 @@ async def update_form(
         created_at=form.created_at,
         updated_at=form.updated_at,
         questions=[QuestionResponse.model_validate(q) for q in form.questions],
-        submission_count=submission_count
+        submission_count=form.submission_count,
+        answer_storage=form.answer_storage
     )
 
-@router.delete("/{form_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{form_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"description": "Hidden now, purged in the background"}}
+)
 async def delete_form(
     form_id: int,
+    background: bool = Query(False, description="Hide the form now and delete its submissions in batches"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete a form"""
+    """Delete a form.
+    
+    Submissions, answers and questions go with it.
+    For forms with many submissions pass `background=true`: the form
+    disappears immediately and its data is purged in bounded batches.
+    """
     result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
+    if background:
+        form.deleted_at = datetime.utcnow()
+        await db.commit()
+        form_cache.invalidate(form_id)
+        statistics_cache.invalidate(form_id)
+        answer_matrices.invalidate(form_id)
+        form_purger.schedule(form_id)
+        return Response(status_code=status.HTTP_202_ACCEPTED)
+    
     await db.delete(form)
     await db.commit()
+    
+    form_cache.invalidate(form_id)
+    statistics_cache.invalidate(form_id)
+    answer_matrices.invalidate(form_id)
 
 @router.post("/{form_id}/duplicate", response_model=FormResponse)
 async def duplicate_form(
@@ -265,7 +492,7 @@ async def duplicate_form(
     result = await db.execute(
         select(Form)
         .options(selectinload(Form.questions))
-        .where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        .where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     original = result.scalar_one_or_none()
     
@@ -280,6 +507,7 @@ async def duplicate_form(
         settings=original.settings,
         is_public=False,
         allow_anonymous=original.allow_anonymous,
+        answer_storage=original.answer_storage,
         owner_id=current_user.id
     )
     
@@ -313,72 +541,69 @@ async def duplicate_form(
     await db.commit()
     await db.refresh(new_form)
     
-    return await get_form(new_form.id, db, current_user)
+    return await get_form(new_form.id, response=Response(), if_none_match=None, db=db, current_user=current_user)
 
 @router.get("/{form_id}/statistics", response_model=FormStatistics)
 async def get_form_statistics(
     form_id: int,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get form statistics"""
+    """Get form statistics, optionally for the submissions matching some filters"""
     result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    # Get submission counts
-    now = datetime.utcnow()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start.replace(day=today_start.day - today_start.weekday())
-    month_start = today_start.replace(day=1)
+    if status or date_from or date_to:
+        # Rollups cover all submissions; filtered statistics come from the answer matrix
+        compiled = await get_compiled_form(db, form_id, form.version)
+        matrix = await get_answer_matrix(db, compiled)
+        return matrix.statistics(matrix.mask(status, date_from, date_to), datetime.utcnow())
     
-    total_result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.form_id == form_id)
-    )
-    total = total_result.scalar() or 0
+    statistics = statistics_cache.get(form_id)
+    if statistics is None:
+        statistics = await compute_form_statistics(db, form_id)
+        statistics_cache.put(form_id, statistics)
     
-    today_result = await db.execute(
-        select(func.count(Submission.id)).where(
-            and_(Submission.form_id == form_id, Submission.created_at >= today_start)
-        )
+    return statistics
+
+@router.get("/{form_id}/crosstab", response_model=Crosstab)
+async def get_crosstab(
+    form_id: int,
+    row: int = Query(..., description="Question whose categories are the rows"),
+    column: int = Query(..., description="Question whose categories are the columns"),
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Count submissions by the options chosen for two choice questions"""
+    result = await db.execute(
+        select(Form.version).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
-    today = today_result.scalar() or 0
+    version = result.scalar_one_or_none()
     
-    week_result = await db.execute(
-        select(func.count(Submission.id)).where(
-            and_(Submission.form_id == form_id, Submission.created_at >= week_start)
-        )
-    )
-    week = week_result.scalar() or 0
+    if version is None:
+        raise HTTPException(status_code=404, detail="Form not found")
     
-    month_result = await db.execute(
-        select(func.count(Submission.id)).where(
-            and_(Submission.form_id == form_id, Submission.created_at >= month_start)
-        )
-    )
-    month = month_result.scalar() or 0
+    compiled = await get_compiled_form(db, form_id, version)
+    for question_id in (row, column):
+        question = compiled.question_map.get(question_id)
+        if not question:
+            raise HTTPException(status_code=404, detail=f"Question {question_id} not found")
+        if question.question_type not in CHOICE_TYPES:
+            raise HTTPException(status_code=400, detail=f"Question {question_id} is not a choice question")
     
-    # Average duration
-    avg_result = await db.execute(
-        select(func.avg(Submission.duration_seconds)).where(
-            and_(Submission.form_id == form_id, Submission.duration_seconds.isnot(None))
-        )
-    )
-    avg_duration = avg_result.scalar()
-    
-    return FormStatistics(
-        total_submissions=total,
-        submissions_today=today,
-        submissions_this_week=week,
-        submissions_this_month=month,
-        average_duration=avg_duration,
-        completion_rate=100.0,  # Simplified for now
-        question_stats=[]
-    )
+    matrix = await get_answer_matrix(db, compiled)
+    return matrix.crosstab(row, column, matrix.mask(status, date_from, date_to))
 
 # Question endpoints
 @router.post("/{form_id}/questions", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED)
@@ -390,40 +615,132 @@ async def add_question(
 ):
     """Add a question to a form"""
     result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    question = Question(
-        form_id=form_id,
-        question_type=question_data.question_type,
-        label=question_data.label,
-        description=question_data.description,
-        placeholder=question_data.placeholder,
-        required=question_data.required,
-        order=question_data.order,
-        options=[opt.model_dump() for opt in question_data.options],
-        validation=question_data.validation.model_dump() if question_data.validation else {},
-        skip_logic=question_data.skip_logic.model_dump() if question_data.skip_logic else {},
-        default_value=question_data.default_value,
-        calculation=question_data.calculation,
-        min_value=question_data.min_value,
-        max_value=question_data.max_value,
-        step=question_data.step,
-        matrix_rows=question_data.matrix_rows,
-        matrix_columns=question_data.matrix_columns,
-        appearance=question_data.appearance
-    )
+    order = question_data.order
+    if "order" not in question_data.model_fields_set:
+        # Without an explicit key the question goes last
+        result = await db.execute(select(func.max(Question.order)).where(Question.form_id == form_id))
+        order = order_between(result.scalar(), None)
+    
+    question = Question(form_id=form_id, order=order, **_question_columns(question_data))
     
     db.add(question)
+    if form.status == FormStatusModel.PUBLISHED:
+        await _check_logic(db, form_id)
+    recomputed = 0
+    if question.question_type == QuestionType.CALCULATE and question.calculation:
+        await db.flush()
+        recomputed = await _recompute_calculations(db, form_id, [question.id])
+    await bump_form_version(db, form_id)
     await db.commit()
     await db.refresh(question)
     
+    if recomputed:
+        statistics_cache.invalidate(form_id)
+    
     return question
 
+async def _write_orders(db: AsyncSession, form_id: int, orders: List[QuestionOrder]) -> None:
+    """Set the order keys of questions of a form in one executemany UPDATE;
+    ids of other forms match nothing"""
+    if not orders:
+        return
+    questions = Question.__table__
+    await db.execute(
+        questions.update()
+        .where(and_(questions.c.id == bindparam("question_id"), questions.c.form_id == form_id))
+        .values(order=bindparam("new_order")),
+        [{"question_id": item.id, "new_order": item.order} for item in orders]
+    )
+
+# Declared before /{form_id}/questions/{question_id}, which would take "reorder" for an id
+@router.put("/{form_id}/questions/reorder")
+async def reorder_questions(
+    form_id: int,
+    question_orders: List[QuestionOrder],
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Reorder questions in a form.
+    
+    Only the questions whose key changed need to be sent; they are all
+    written by one statement.
+    """
+    result = await db.execute(
+        select(Form.id).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    await _write_orders(db, form_id, question_orders)
+    await bump_form_version(db, form_id)
+    await db.commit()
+    
+    return {"message": "Questions reordered successfully"}
+
+@router.put("/{form_id}/questions/{question_id}/move", response_model=List[QuestionOrder])
+async def move_question(
+    form_id: int,
+    question_id: int,
+    move: QuestionMove,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Move a question right after another one, or first.
+    
+    The question gets a key in the gap between its new neighbours, so only
+    its row changes; when that gap has run out the form's questions are
+    respaced ORDER_GAP apart. Returns the keys that changed.
+    """
+    result = await db.execute(
+        select(Form.id).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    result = await db.execute(
+        select(Question.id, Question.order)
+        .where(Question.form_id == form_id)
+        .order_by(Question.order, Question.id)
+    )
+    keys = {row.id: row.order for row in result}
+    if question_id not in keys:
+        raise HTTPException(status_code=404, detail="Question not found")
+    if move.after_id is not None and (move.after_id not in keys or move.after_id == question_id):
+        raise HTTPException(status_code=400, detail=f"Question {move.after_id} is not another question of this form")
+    
+    others = [qid for qid in keys if qid != question_id]
+    position = others.index(move.after_id) + 1 if move.after_id is not None else 0
+    before = keys[others[position - 1]] if position > 0 else None
+    after = keys[others[position]] if position < len(others) else None
+    
+    current = keys[question_id]
+    if (before is None or before < current) and (after is None or current < after):
+        return []
+    
+    order = order_between(before, after)
+    if order is not None:
+        changes = [QuestionOrder(id=question_id, order=order)]
+    else:
+        others.insert(position, question_id)
+        changes = [
+            QuestionOrder(id=qid, order=order)
+            for qid, order in zip(others, spaced_orders(len(others)))
+            if keys[qid] != order
+        ]
+    
+    await _write_orders(db, form_id, changes)
+    await bump_form_version(db, form_id)
+    await db.commit()
+    
+    return changes
+
 @router.put("/{form_id}/questions/{question_id}", response_model=QuestionResponse)
 async def update_question(
     form_id: int,
@@ -439,7 +756,8 @@ async def update_question(
         .where(and_(
             Question.id == question_id,
             Question.form_id == form_id,
-            Form.owner_id == current_user.id
+            Form.owner_id == current_user.id,
+            Form.deleted_at.is_(None)
         ))
     )
     question = result.scalar_one_or_none()
@@ -461,9 +779,22 @@ async def update_question(
     
     question.updated_at = datetime.utcnow()
     
+    calculation_changed = "calculation" in update_data or "question_type" in update_data
+    if "skip_logic" in update_data or calculation_changed:
+        result = await db.execute(select(Form.status).where(Form.id == form_id))
+        if result.scalar_one() == FormStatusModel.PUBLISHED:
+            await _check_logic(db, form_id)
+    
+    recomputed = 0
+    if calculation_changed:
+        recomputed = await _recompute_calculations(db, form_id, [question_id])
+    await bump_form_version(db, form_id)
     await db.commit()
     await db.refresh(question)
     
+    if recomputed:
+        statistics_cache.invalidate(form_id)
+    
     return question
 
 @router.delete("/{form_id}/questions/{question_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -475,102 +806,70 @@ async def delete_question(
 ):
     """Delete a question"""
     result = await db.execute(
-        select(Question)
+        select(Question, Form.answer_storage)
         .join(Form)
         .where(and_(
             Question.id == question_id,
             Question.form_id == form_id,
-            Form.owner_id == current_user.id
+            Form.owner_id == current_user.id,
+            Form.deleted_at.is_(None)
         ))
     )
-    question = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not question:
+    if not row:
         raise HTTPException(status_code=404, detail="Question not found")
+    question, answer_storage = row
     
     await db.delete(question)
+    if answer_storage == AnswerStorage.PACKED:
+        await strip_packed_answers(db, form_id, [question_id])
+    # Calculations that read the question now see it as unanswered
+    recomputed = await _recompute_calculations(db, form_id, [question_id])
+    await bump_form_version(db, form_id)
     await db.commit()
-
-@router.put("/{form_id}/questions/reorder")
-async def reorder_questions(
-    form_id: int,
-    question_orders: List[dict],  # [{id: 1, order: 0}, ...]
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Reorder questions in a form"""
-    result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
-    )
-    form = result.scalar_one_or_none()
     
-    if not form:
-        raise HTTPException(status_code=404, detail="Form not found")
-    
-    for item in question_orders:
-        await db.execute(
-            select(Question)
-            .where(and_(Question.id == item["id"], Question.form_id == form_id))
-        )
-        # Update order using direct SQL for efficiency
-        from sqlalchemy import update
-        await db.execute(
-            update(Question)
-            .where(and_(Question.id == item["id"], Question.form_id == form_id))
-            .values(order=item["order"])
-        )
-    
-    await db.commit()
-    
-    return {"message": "Questions reordered successfully"}
+    if recomputed:
+        statistics_cache.invalidate(form_id)
 
 # Public form access
 @router.get("/public/{form_id}", response_model=FormResponse)
 async def get_public_form(
     form_id: int,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
 ):
     """Get a public form for filling"""
     result = await db.execute(
-        select(Form)
-        .options(selectinload(Form.questions))
-        .where(and_(Form.id == form_id, Form.is_public == True, Form.status == FormStatusModel.PUBLISHED))
+        select(
+            Form.version, Form.updated_at, Form.is_public, Form.status,
+            Form.start_date, Form.end_date, Form.submission_limit, Form.submission_count
+        )
+        .where(Form.id == form_id, Form.deleted_at.is_(None))
     )
-    form = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not form:
+    if not row or not row.is_public or row.status != FormStatusModel.PUBLISHED:
         raise HTTPException(status_code=404, detail="Form not found or not available")
     
     # Check date restrictions
     now = datetime.utcnow()
-    if form.start_date and now < form.start_date:
+    if row.start_date and now < row.start_date:
         raise HTTPException(status_code=403, detail="Form not yet available")
-    if form.end_date and now > form.end_date:
+    if row.end_date and now > row.end_date:
         raise HTTPException(status_code=403, detail="Form has expired")
     
     # Check submission limit
-    if form.submission_limit:
-        count_result = await db.execute(
-            select(func.count(Submission.id)).where(Submission.form_id == form.id)
-        )
-        count = count_result.scalar() or 0
-        if count >= form.submission_limit:
-            raise HTTPException(status_code=403, detail="Form has reached submission limit")
+    if row.submission_limit and row.submission_count >= row.submission_limit:
+        raise HTTPException(status_code=403, detail="Form has reached submission limit")
     
-    return FormResponse(
-        id=form.id,
-        title=form.title,
-        description=form.description,
-        status=form.status,
-        settings=form.settings,
-        is_public=form.is_public,
-        allow_anonymous=form.allow_anonymous,
-        submission_limit=form.submission_limit,
-        start_date=form.start_date,
-        end_date=form.end_date,
-        owner_id=None,  # Hide owner for public access
-        created_at=form.created_at,
-        updated_at=form.updated_at,
-        questions=[QuestionResponse.model_validate(q) for q in sorted(form.questions, key=lambda x: x.order)],
-        submission_count=0
-    )
+    # The version changes with any edit to the form or its questions
+    etag = _form_etag("public", form_id, row.version)
+    headers = _cache_headers(etag, row.updated_at, "public, no-cache")
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    form = await get_compiled_form(db, form_id, version=row.version)
+    
+    # Serialized once per form version
+    return Response(content=form.public_body, media_type="application/json", headers=headers)
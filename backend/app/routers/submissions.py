@@ -1,119 +1,196 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, and_, delete, insert, update, tuple_
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import datetime
-import json
-import io
+from itertools import groupby
+import base64
 
 from ..database import get_db
-from ..models import Form, Question, Submission, Answer, User, FormStatus
-from ..schemas import SubmissionCreate, SubmissionResponse, AnswerCreate, ExportRequest
+from ..compiled import get_compiled_form
+from ..config import settings
+from ..counters import release_submissions, next_change_seq, current_change_seq
+from ..ingest import (
+    IngestError, Origin, check_form_open, check_submission, store_submissions, submission_response
+)
+from ..ingest_buffer import ingest_buffer
+from ..statistics import statistics_cache, rollup_deltas, apply_rollups
+from ..exports import STREAMERS, MEDIA_TYPES, export_available
+from ..export_jobs import export_jobs, ExportJob
+from ..models import Form, Question, Submission, SubmissionTombstone, Answer, User
+from ..packed_answers import unpack_answers
+from ..schemas import (
+    SubmissionCreate, SubmissionResponse, SubmissionPage, AnswerCreate,
+    SubmissionReceipt, BulkSubmissionCreate, BulkSubmissionResult, BulkSubmissionResponse,
+    ExportRequest, ExportJobResponse, SubmissionSelection, SubmissionStatusChange, BulkChangeResponse
+)
 from .auth import get_current_user, get_current_user_optional
 
 router = APIRouter(prefix="/submissions", tags=["Submissions"])
 
-@router.post("/forms/{form_id}", response_model=SubmissionResponse, status_code=status.HTTP_201_CREATED)
+def _filter_submissions(query, status: Optional[str], date_from: Optional[datetime], date_to: Optional[datetime]):
+    if status:
+        query = query.where(Submission.status == status)
+    if date_from:
+        query = query.where(Submission.created_at >= date_from)
+    if date_to:
+        query = query.where(Submission.created_at <= date_to)
+    return query
+
+def _encode_cursor(submission: Submission) -> str:
+    raw = f"{submission.created_at.isoformat()}|{submission.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, submission_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(submission_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.post(
+    "/forms/{form_id}",
+    response_model=SubmissionResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": SubmissionReceipt, "description": "Queued by the ingest buffer"}}
+)
 async def create_submission(
     form_id: int,
     submission_data: SubmissionCreate,
     request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     """Submit a form response"""
     # Get form
-    result = await db.execute(
-        select(Form)
-        .options(selectinload(Form.questions))
-        .where(Form.id == form_id)
-    )
-    form = result.scalar_one_or_none()
+    form = await get_compiled_form(db, form_id)
     
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    # Check if form is available
-    if form.status != FormStatus.PUBLISHED and (not current_user or form.owner_id != current_user.id):
-        raise HTTPException(status_code=403, detail="Form is not published")
+    # Check availability and required questions
+    now = datetime.utcnow()
+    try:
+        check_form_open(form, current_user, now)
+        pending = check_submission(form, submission_data, Origin.from_request(request, current_user, now))
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    # With the ingest buffer on, acknowledge once journaled; rows are written in batches
+    if ingest_buffer.running:
+        # Refuse what a full form would reject anyway; a submission that loses
+        # the race for the last slots is set aside by the buffer instead
+        if form.submission_limit:
+            result = await db.execute(select(Form.submission_count).where(Form.id == form_id))
+            if result.scalar_one() >= form.submission_limit:
+                raise HTTPException(status_code=403, detail="Form has reached submission limit")
+        sequence = await ingest_buffer.submit(form_id, submission_data, pending.origin)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=SubmissionReceipt(form_id=form_id, sequence=sequence).model_dump()
+        )
     
-    # Check anonymous access
-    if not form.allow_anonymous and not current_user:
-        raise HTTPException(status_code=401, detail="Authentication required")
+    # Take a slot under the submission limit and write the rows
+    await store_submissions(db, form, [pending])
     
-    # Check date restrictions
-    now = datetime.utcnow()
-    if form.start_date and now < form.start_date:
-        raise HTTPException(status_code=403, detail="Form not yet available")
-    if form.end_date and now > form.end_date:
-        raise HTTPException(status_code=403, detail="Form has expired")
-    
-    # Check submission limit
-    if form.submission_limit:
-        count_result = await db.execute(
-            select(func.count(Submission.id)).where(Submission.form_id == form.id)
+    # A retry of a stored submission gets the stored one back
+    if pending.duplicate:
+        result = await db.execute(
+            select(Submission)
+            .options(selectinload(Submission.answer_rows))
+            .where(Submission.id == pending.id)
         )
-        count = count_result.scalar() or 0
-        if count >= form.submission_limit:
-            raise HTTPException(status_code=403, detail="Form has reached submission limit")
+        response.status_code = status.HTTP_200_OK
+        return result.scalar_one()
+    
+    if pending.id is None:
+        raise HTTPException(status_code=403, detail="Form has reached submission limit")
+    
+    await db.commit()
     
-    # Validate required questions
-    question_ids = {q.id for q in form.questions}
-    required_ids = {q.id for q in form.questions if q.required}
-    answered_ids = {a.question_id for a in submission_data.answers}
+    statistics_cache.invalidate(form_id)
     
-    missing_required = required_ids - answered_ids
-    if missing_required:
+    return submission_response(form_id, pending)
+
+@router.post("/bulk", response_model=BulkSubmissionResponse)
+async def create_submissions_bulk(
+    bulk_data: BulkSubmissionCreate,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """Submit many form responses at once, e.g. when an offline device syncs.
+    
+    Each form is loaded once, every submission is written with multi-row
+    inserts in a single transaction, and failures are reported per item.
+    """
+    items = bulk_data.items
+    if len(items) > settings.bulk_submission_max_items:
         raise HTTPException(
-            status_code=400,
-            detail=f"Missing required questions: {missing_required}"
+            status_code=413,
+            detail=f"At most {settings.bulk_submission_max_items} submissions per request"
         )
     
-    # Create submission
-    submission = Submission(
-        form_id=form_id,
-        user_id=current_user.id if current_user else None,
-        status=submission_data.status,
-        ip_address=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent", "")[:500],
-        geolocation=submission_data.geolocation or {},
-        started_at=now,
-        completed_at=now if submission_data.status == "completed" else None
-    )
+    now = datetime.utcnow()
+    origin = Origin.from_request(request, current_user, now)
+    results: List[Optional[BulkSubmissionResult]] = [None] * len(items)
     
-    db.add(submission)
-    await db.flush()
+    # Group payloads by form, keeping their position in the request
+    by_form = {}
+    for index, item in enumerate(items):
+        by_form.setdefault(item.form_id, []).append(index)
     
-    # Create answers
-    for answer_data in submission_data.answers:
-        if answer_data.question_id not in question_ids:
-            continue  # Skip invalid question IDs
+    stored_forms = []
+    for form_id, indexes in by_form.items():
+        form = await get_compiled_form(db, form_id)
         
-        answer = Answer(
-            submission_id=submission.id,
-            question_id=answer_data.question_id,
-            value_text=answer_data.value_text,
-            value_number=answer_data.value_number,
-            value_json=answer_data.value_json,
-            value_file=answer_data.value_file,
-            repeat_index=answer_data.repeat_index
-        )
-        db.add(answer)
+        pending = []
+        for index in indexes:
+            try:
+                if not form:
+                    raise IngestError(404, "Form not found")
+                check_form_open(form, current_user, now)
+                pending.append((index, check_submission(form, items[index], origin)))
+            except IngestError as e:
+                results[index] = BulkSubmissionResult(
+                    index=index, form_id=form_id, status_code=e.status_code, detail=e.detail
+                )
+        
+        if not pending:
+            continue
+        
+        stored = await store_submissions(db, form, [p for _, p in pending])
+        if stored:
+            stored_forms.append(form_id)
+        
+        for index, p in pending:
+            if p.id is not None:
+                results[index] = BulkSubmissionResult(
+                    index=index, form_id=form_id, status_code=200 if p.duplicate else 201, id=p.id
+                )
+            else:
+                results[index] = BulkSubmissionResult(
+                    index=index, form_id=form_id, status_code=403,
+                    detail="Form has reached submission limit"
+                )
     
     await db.commit()
-    await db.refresh(submission)
     
-    # Load answers
-    result = await db.execute(
-        select(Submission)
-        .options(selectinload(Submission.answers))
-        .where(Submission.id == submission.id)
-    )
-    submission = result.scalar_one()
+    for form_id in stored_forms:
+        statistics_cache.invalidate(form_id)
     
-    return submission
+    created = sum(1 for r in results if r.status_code == 201)
+    duplicates = sum(1 for r in results if r.status_code == 200)
+    return BulkSubmissionResponse(
+        created=created,
+        duplicates=duplicates,
+        failed=len(results) - created - duplicates,
+        results=results
+    )
 
 @router.get("/forms/{form_id}", response_model=List[SubmissionResponse])
 async def list_submissions(
@@ -129,7 +206,7 @@ async def list_submissions(
     """List submissions for a form"""
     # Check form ownership
     result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
@@ -138,22 +215,55 @@ async def list_submissions(
     
     # Build query
     query = select(Submission).where(Submission.form_id == form_id)
+    query = _filter_submissions(query, status, date_from, date_to)
     
-    if status:
-        query = query.where(Submission.status == status)
-    if date_from:
-        query = query.where(Submission.created_at >= date_from)
-    if date_to:
-        query = query.where(Submission.created_at <= date_to)
-    
-    query = query.options(selectinload(Submission.answers))
-    query = query.order_by(Submission.created_at.desc()).offset(skip).limit(limit)
+    query = query.options(selectinload(Submission.answer_rows))
+    query = query.order_by(Submission.created_at.desc(), Submission.id.desc()).offset(skip).limit(limit)
     
     result = await db.execute(query)
     submissions = result.scalars().all()
     
     return submissions
 
+@router.get("/forms/{form_id}/page", response_model=SubmissionPage)
+async def page_submissions(
+    form_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List submissions newest first using an opaque cursor instead of an offset"""
+    # Check form ownership
+    result = await db.execute(
+        select(Form.id).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    query = select(Submission).where(Submission.form_id == form_id)
+    query = _filter_submissions(query, status, date_from, date_to)
+    
+    # Seek past the last row of the previous page on the (form_id, created_at, id) index
+    if cursor:
+        query = query.where(tuple_(Submission.created_at, Submission.id) < _decode_cursor(cursor))
+    
+    query = query.options(selectinload(Submission.answer_rows))
+    query = query.order_by(Submission.created_at.desc(), Submission.id.desc()).limit(limit + 1)
+    
+    result = await db.execute(query)
+    submissions = result.scalars().all()
+    
+    next_cursor = None
+    if len(submissions) > limit:
+        submissions = submissions[:limit]
+        next_cursor = _encode_cursor(submissions[-1])
+    
+    return SubmissionPage(items=submissions, next_cursor=next_cursor)
+
 @router.get("/{submission_id}", response_model=SubmissionResponse)
 async def get_submission(
     submission_id: int,
@@ -163,9 +273,9 @@ async def get_submission(
     """Get a specific submission"""
     result = await db.execute(
         select(Submission)
-        .options(selectinload(Submission.answers))
+        .options(selectinload(Submission.answer_rows))
         .join(Form)
-        .where(and_(Submission.id == submission_id, Form.owner_id == current_user.id))
+        .where(and_(Submission.id == submission_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     submission = result.scalar_one_or_none()
     
@@ -183,16 +293,155 @@ async def delete_submission(
     """Delete a submission"""
     result = await db.execute(
         select(Submission)
+        .options(selectinload(Submission.answer_rows))
         .join(Form)
-        .where(and_(Submission.id == submission_id, Form.owner_id == current_user.id))
+        .where(and_(Submission.id == submission_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     submission = result.scalar_one_or_none()
     
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
     
-    await db.delete(submission)
+    form = await get_compiled_form(db, submission.form_id)
+    await apply_rollups(db, submission.form_id, rollup_deltas(form, submission.answers, sign=-1))
+    
+    # Answers rows are deleted explicitly too, for databases whose foreign
+    # keys predate ON DELETE CASCADE (see app.schema_upgrade)
+    await db.execute(delete(Answer).where(Answer.submission_id == submission.id))
+    await db.execute(delete(Submission).where(Submission.id == submission.id))
+    change_seq = await release_submissions(db, submission.form_id)
+    db.add(SubmissionTombstone(
+        form_id=submission.form_id,
+        submission_id=submission.id,
+        change_seq=change_seq
+    ))
+    await db.commit()
+    
+    statistics_cache.invalidate(submission.form_id)
+
+BULK_CHUNK = 1000  # Ids per IN list in bulk operations
+
+async def _selected_ids(db: AsyncSession, form_id: int, selection: SubmissionSelection, *criteria) -> List[int]:
+    """Ids of the form's submissions matching a selection, in id order"""
+    query = select(Submission.id).where(Submission.form_id == form_id, *criteria)
+    query = _filter_submissions(query, selection.status, selection.date_from, selection.date_to).order_by(Submission.id)
+    if selection.ids is None:
+        result = await db.execute(query)
+        return list(result.scalars())
+    
+    ids = sorted(set(selection.ids))
+    found = []
+    for start in range(0, len(ids), BULK_CHUNK):
+        result = await db.execute(query.where(Submission.id.in_(ids[start:start + BULK_CHUNK])))
+        found.extend(result.scalars())
+    return found
+
+@router.post("/forms/{form_id}/bulk-delete", response_model=BulkChangeResponse)
+async def delete_submissions_bulk(
+    form_id: int,
+    selection: SubmissionSelection,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Delete the submissions of a form picked by id or by filter.
+    
+    Ownership is checked once, then each chunk of submissions goes in one
+    DELETE, after one for its answers rows. Rollups and tombstones are
+    updated as for single deletes, in one pass for all of them.
+    """
+    form = await get_compiled_form(db, form_id)
+    
+    if not form or form.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    ids = await _selected_ids(db, form_id, selection)
+    deltas = {}
+    deleted = []
+    for start in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[start:start + BULK_CHUNK]
+        # Answers rows go before their submissions; read them for the rollups first
+        result = await db.execute(
+            select(
+                Answer.submission_id, Answer.question_id, Answer.value_text,
+                Answer.value_number, Answer.value_json, Answer.value_file
+            )
+            .where(Answer.submission_id.in_(chunk))
+            .order_by(Answer.submission_id)
+        )
+        for _, answers in groupby(result, key=lambda a: a.submission_id):
+            rollup_deltas(form, list(answers), sign=-1, deltas=deltas)
+        
+        await db.execute(delete(Answer).where(Answer.submission_id.in_(chunk)))
+        result = await db.execute(
+            delete(Submission)
+            .where(Submission.id.in_(chunk))
+            .returning(Submission.id, Submission.created_at, Submission.packed_answers)
+            .execution_options(synchronize_session=False)
+        )
+        for submission_id, created_at, document in result:
+            deleted.append(submission_id)
+            if document is not None:
+                rollup_deltas(form, unpack_answers(document, submission_id, created_at), sign=-1, deltas=deltas)
+    
+    if deleted:
+        await apply_rollups(db, form_id, deltas)
+        last_seq = await release_submissions(db, form_id, len(deleted))
+        first_seq = last_seq - len(deleted) + 1
+        await db.execute(insert(SubmissionTombstone), [
+            {"form_id": form_id, "submission_id": submission_id, "change_seq": first_seq + offset}
+            for offset, submission_id in enumerate(deleted)
+        ])
     await db.commit()
+    
+    if deleted:
+        statistics_cache.invalidate(form_id)
+    
+    return BulkChangeResponse(form_id=form_id, affected=len(deleted))
+
+@router.post("/forms/{form_id}/bulk-status", response_model=BulkChangeResponse)
+async def change_submissions_status(
+    form_id: int,
+    change: SubmissionStatusChange,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Set the status of the submissions of a form picked by id or by
+    filter, e.g. from completed to validated.
+    
+    Submissions already in the new status are left alone. The others are
+    updated a chunk per UPDATE and share one new change sequence number.
+    """
+    result = await db.execute(
+        select(Form.id).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    ids = await _selected_ids(db, form_id, change, Submission.status.is_distinct_from(change.new_status))
+    if ids:
+        change_seq = await next_change_seq(db, form_id)
+        now = datetime.utcnow()
+        for start in range(0, len(ids), BULK_CHUNK):
+            await db.execute(
+                update(Submission)
+                .where(Submission.id.in_(ids[start:start + BULK_CHUNK]))
+                .values(status=change.new_status, change_seq=change_seq, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+    await db.commit()
+    
+    if ids:
+        statistics_cache.invalidate(form_id)
+    
+    return BulkChangeResponse(form_id=form_id, affected=len(ids))
+
+async def _pin_watermark(db: AsyncSession, form_id: int, export_config: ExportRequest) -> ExportRequest:
+    """Fix the upper watermark of an export to the form's current change sequence.
+    
+    Pass it back as `since` to get only the changes made after this export.
+    """
+    until = await current_change_seq(db, form_id)
+    return export_config.model_copy(update={"until": until})
 
 @router.post("/forms/{form_id}/export")
 async def export_submissions(
@@ -203,148 +452,100 @@ async def export_submissions(
 ):
     """Export submissions to various formats"""
     # Check form ownership
-    result = await db.execute(
-        select(Form)
-        .options(selectinload(Form.questions))
-        .where(and_(Form.id == form_id, Form.owner_id == current_user.id))
-    )
-    form = result.scalar_one_or_none()
+    form = await get_compiled_form(db, form_id)
     
-    if not form:
+    if not form or form.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    # Build query
-    query = select(Submission).where(Submission.form_id == form_id)
+    if export_config.format not in STREAMERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {export_config.format}")
     
-    if export_config.date_from:
-        query = query.where(Submission.created_at >= export_config.date_from)
-    if export_config.date_to:
-        query = query.where(Submission.created_at <= export_config.date_to)
+    if not export_available(export_config.format):
+        raise HTTPException(status_code=500, detail=f"{export_config.format.upper()} export is not available")
     
-    query = query.options(selectinload(Submission.answers))
-    query = query.order_by(Submission.created_at.asc())
+    export_config = await _pin_watermark(db, form_id, export_config)
     
-    result = await db.execute(query)
-    submissions = result.scalars().all()
+    # Rows are produced from a server-side cursor while the body is sent
+    return StreamingResponse(
+        STREAMERS[export_config.format](form, export_config),
+        media_type=MEDIA_TYPES[export_config.format],
+        headers={
+            "Content-Disposition": f"attachment; filename=form_{form_id}_export.{export_config.format}",
+            "X-Export-Watermark": str(export_config.until)
+        }
+    )
+
+def _job_response(job: ExportJob) -> ExportJobResponse:
+    return ExportJobResponse(
+        id=job.id,
+        form_id=job.form_id,
+        format=job.config.format,
+        status=job.status,
+        rows_done=job.rows_done,
+        rows_total=job.rows_total,
+        cached=job.cached,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        watermark=job.config.until
+    )
+
+def _get_job(job_id: str, current_user: User) -> ExportJob:
+    job = export_jobs.get(job_id)
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@router.post("/forms/{form_id}/export/jobs", response_model=ExportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_export_job(
+    form_id: int,
+    export_config: ExportRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Start a background export, or reuse a cached one for unchanged data"""
+    form = await get_compiled_form(db, form_id)
     
-    # Build question map
-    questions = sorted(form.questions, key=lambda x: x.order)
-    question_map = {q.id: q for q in questions}
-    
-    if export_config.format == "json":
-        # JSON export
-        data = []
-        for sub in submissions:
-            row = {
-                "id": sub.id,
-                "submitted_at": sub.created_at.isoformat(),
-                "status": sub.status
-            }
-            if export_config.include_metadata:
-                row["ip_address"] = sub.ip_address
-                row["geolocation"] = sub.geolocation
-            
-            for answer in sub.answers:
-                q = question_map.get(answer.question_id)
-                if q:
-                    key = q.label[:50]
-                    value = answer.value_text or answer.value_number or answer.value_json
-                    row[key] = value
-            
-            data.append(row)
-        
-        content = json.dumps(data, indent=2, ensure_ascii=False, default=str)
-        return StreamingResponse(
-            io.BytesIO(content.encode()),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename=form_{form_id}_export.json"}
-        )
+    if not form or form.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Form not found")
     
-    elif export_config.format == "csv":
-        import csv
-        
-        output = io.StringIO()
-        
-        # Headers
-        headers = ["ID", "Fecha", "Estado"]
-        if export_config.include_metadata:
-            headers.extend(["IP", "Latitud", "Longitud"])
-        headers.extend([q.label[:50] for q in questions])
-        
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        
-        # Data rows
-        for sub in submissions:
-            row = [sub.id, sub.created_at.isoformat(), sub.status]
-            if export_config.include_metadata:
-                geo = sub.geolocation or {}
-                row.extend([sub.ip_address, geo.get("lat"), geo.get("lng")])
-            
-            answer_map = {a.question_id: a for a in sub.answers}
-            for q in questions:
-                answer = answer_map.get(q.id)
-                if answer:
-                    value = answer.value_text or answer.value_number or json.dumps(answer.value_json) if answer.value_json else ""
-                else:
-                    value = ""
-                row.append(value)
-            
-            writer.writerow(row)
-        
-        output.seek(0)
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=form_{form_id}_export.csv"}
-        )
+    if export_config.format not in STREAMERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {export_config.format}")
     
-    elif export_config.format == "xlsx":
-        try:
-            import pandas as pd
-            from openpyxl import Workbook
-            
-            # Build DataFrame
-            data_rows = []
-            for sub in submissions:
-                row = {
-                    "ID": sub.id,
-                    "Fecha": sub.created_at,
-                    "Estado": sub.status
-                }
-                if export_config.include_metadata:
-                    geo = sub.geolocation or {}
-                    row["IP"] = sub.ip_address
-                    row["Latitud"] = geo.get("lat")
-                    row["Longitud"] = geo.get("lng")
-                
-                answer_map = {a.question_id: a for a in sub.answers}
-                for q in questions:
-                    answer = answer_map.get(q.id)
-                    if answer:
-                        value = answer.value_text or answer.value_number or answer.value_json
-                    else:
-                        value = None
-                    row[q.label[:50]] = value
-                
-                data_rows.append(row)
-            
-            df = pd.DataFrame(data_rows)
-            
-            output = io.BytesIO()
-            df.to_excel(output, index=False, engine='openpyxl')
-            output.seek(0)
-            
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=form_{form_id}_export.xlsx"}
-            )
-        except ImportError:
-            raise HTTPException(status_code=500, detail="Excel export is not available")
+    if not export_available(export_config.format):
+        raise HTTPException(status_code=500, detail=f"{export_config.format.upper()} export is not available")
     
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported format: {export_config.format}")
+    export_config = await _pin_watermark(db, form_id, export_config)
+    
+    job = await export_jobs.submit(db, form, export_config)
+    return _job_response(job)
+
+@router.get("/export/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Poll the progress of an export job"""
+    return _job_response(_get_job(job_id, current_user))
+
+@router.get("/export/jobs/{job_id}/download")
+async def download_export_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Download the file produced by a finished export job"""
+    job = _get_job(job_id, current_user)
+    
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    if not job.path.exists():
+        raise HTTPException(status_code=410, detail="Export file has expired")
+    
+    return FileResponse(
+        job.path,
+        media_type=MEDIA_TYPES[job.config.format],
+        filename=f"form_{job.form_id}_export.{job.config.format}"
+    )
 
 @router.get("/forms/{form_id}/count")
 async def count_submissions(
@@ -354,16 +555,11 @@ async def count_submissions(
 ):
     """Get submission count for a form"""
     result = await db.execute(
-        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id))
+        select(Form).where(and_(Form.id == form_id, Form.owner_id == current_user.id, Form.deleted_at.is_(None)))
     )
     form = result.scalar_one_or_none()
     
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    count_result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.form_id == form_id)
-    )
-    count = count_result.scalar() or 0
-    
-    return {"form_id": form_id, "count": count}
+    return {"form_id": form_id, "count": form.submission_count}
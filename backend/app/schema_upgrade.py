@@ -0,0 +1,219 @@
+"""Bring a database created by an earlier version up to the current models.
+
+`init_db` creates missing tables but never changes existing ones, so run
+this once after upgrading, before starting the new version:
+
+    python -m app.schema_upgrade
+
+Missing columns and indexes are added, unique constraints the models no
+longer have are dropped, and foreign keys whose ON DELETE action changed
+are recreated. SQLite cannot alter constraints, so there
+the affected tables are rebuilt from the models and their rows copied
+over. Columns that summarise existing rows (submission counters and
+change sequences) are backfilled when they are added. Every step checks
+the live schema first, so the script can be re-run safely.
+"""
+from sqlalchemy import MetaData, Table, func, inspect, select, update
+from sqlalchemy.engine import Connection, Inspector
+from sqlalchemy.schema import Column, CreateColumn, CreateTable, ForeignKeyConstraint, UniqueConstraint
+from sqlalchemy.types import SchemaType
+from typing import List, Set, Tuple
+import asyncio
+
+from .database import Base, engine
+from .models import Form, Submission
+
+
+def _stale_foreign_keys(inspector: Inspector, table: Table) -> List[Tuple[ForeignKeyConstraint, str]]:
+    """Model foreign keys whose ON DELETE action differs from the live one,
+    with the live constraint's name"""
+    reflected = {
+        tuple(fk["constrained_columns"]): fk
+        for fk in inspector.get_foreign_keys(table.name)
+    }
+    stale = []
+    for constraint in table.foreign_key_constraints:
+        live = reflected.get(tuple(constraint.column_keys))
+        if live is None:
+            continue
+        wanted = (constraint.ondelete or "NO ACTION").upper()
+        current = (live["options"].get("ondelete") or "NO ACTION").upper()
+        if wanted != current:
+            stale.append((constraint, live["name"]))
+    return stale
+
+
+def _stale_unique_constraints(inspector: Inspector, table: Table) -> List[dict]:
+    """Live unique constraints that no longer match one of the model's"""
+    wanted = {
+        tuple(column.name for column in constraint.columns)
+        for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    }
+    return [
+        constraint for constraint in inspector.get_unique_constraints(table.name)
+        if tuple(constraint["column_names"]) not in wanted
+    ]
+
+
+def _add_column(conn: Connection, table: Table, column: Column) -> None:
+    if isinstance(column.type, SchemaType):
+        # Enum columns need their type on PostgreSQL
+        column.type.create(conn, checkfirst=True)
+    quote = conn.dialect.identifier_preparer.quote
+    definition = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} ADD COLUMN {definition}")
+
+
+def _recreate_foreign_key(conn: Connection, table: Table, constraint: ForeignKeyConstraint, name: str) -> None:
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(c) for c in constraint.column_keys)
+    referred = ", ".join(quote(element.column.name) for element in constraint.elements)
+    conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(name)}")
+    conn.exec_driver_sql(
+        f"ALTER TABLE {quote(table.name)} ADD CONSTRAINT {quote(name)} "
+        f"FOREIGN KEY ({columns}) REFERENCES {quote(constraint.referred_table.name)} ({referred}) "
+        f"ON DELETE {constraint.ondelete}"
+    )
+
+
+def _rebuild_sqlite_table(conn: Connection, inspector: Inspector, table: Table) -> None:
+    """Recreate a table from its model and copy its rows across, the way
+    SQLite documents for schema changes it cannot make in place. Runs with
+    foreign keys off, so dropping the old table cascades nowhere."""
+    quote = conn.dialect.identifier_preparer.quote
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    columns = ", ".join(quote(c.name) for c in table.columns if c.name in existing)
+
+    # The copy needs the tables its foreign keys point at to compile
+    metadata = MetaData()
+    for other in Base.metadata.tables.values():
+        other.to_metadata(metadata)
+    staging = table.to_metadata(metadata, name=f"_upgrade_{table.name}")
+
+    conn.execute(CreateTable(staging))
+    conn.exec_driver_sql(
+        f"INSERT INTO {quote(staging.name)} ({columns}) SELECT {columns} FROM {quote(table.name)}"
+    )
+    conn.exec_driver_sql(f"DROP TABLE {quote(table.name)}")
+    conn.exec_driver_sql(f"ALTER TABLE {quote(staging.name)} RENAME TO {quote(table.name)}")
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _backfill(conn: Connection, added: Set[Tuple[str, str]]) -> List[str]:
+    """Fill columns just added to tables that already had rows. Rows keep
+    their updated_at, which the columns' onupdate would otherwise bump."""
+    steps = []
+    if ("submissions", "change_seq") in added:
+        # Existing submissions take the first numbers of their form's sequence
+        numbered = select(
+            Submission.id,
+            func.row_number().over(partition_by=Submission.form_id, order_by=Submission.id).label("seq")
+        ).subquery()
+        conn.execute(
+            update(Submission)
+            .where(Submission.id == numbered.c.id)
+            .values(change_seq=numbered.c.seq, updated_at=Submission.updated_at)
+        )
+        steps.append("submissions.change_seq: numbered per form")
+    if ("forms", "submission_count") in added:
+        conn.execute(update(Form).values(
+            submission_count=select(func.count(Submission.id)).where(Submission.form_id == Form.id).scalar_subquery(),
+            updated_at=Form.updated_at
+        ))
+        steps.append("forms.submission_count: counted from submissions")
+    if ("forms", "change_seq") in added:
+        conn.execute(update(Form).values(
+            change_seq=func.coalesce(
+                select(func.max(Submission.change_seq)).where(Submission.form_id == Form.id).scalar_subquery(), 0
+            ),
+            updated_at=Form.updated_at
+        ))
+        steps.append("forms.change_seq: continued from submissions")
+    return steps
+
+
+def _upgrade(conn: Connection) -> List[str]:
+    sqlite = conn.dialect.name == "sqlite"
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    Base.metadata.create_all(conn)
+    steps = []
+    added: Set[Tuple[str, str]] = set()
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            steps.append(f"{table.name}: created")
+            continue
+        live = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in live]
+        stale = _stale_foreign_keys(inspector, table)
+        unique = _stale_unique_constraints(inspector, table)
+        added.update((table.name, column.name) for column in missing)
+        if sqlite:
+            if missing or stale or unique:
+                _rebuild_sqlite_table(conn, inspector, table)
+                changes = [f"column {column.name} added" for column in missing]
+                changes += [f"unique ({', '.join(u['column_names'])}) dropped" for u in unique]
+                changes += ["foreign keys recreated"] if stale else []
+                steps.append(f"{table.name}: rebuilt, {', '.join(changes)}")
+            continue
+        for column in missing:
+            _add_column(conn, table, column)
+            steps.append(f"{table.name}: column {column.name} added")
+        quote = conn.dialect.identifier_preparer.quote
+        for constraint in unique:
+            conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(constraint['name'])}")
+            steps.append(f"{table.name}: unique constraint {constraint['name']} dropped")
+        for constraint, name in stale:
+            _recreate_foreign_key(conn, table, constraint, name)
+            steps.append(f"{table.name}: {name} recreated with ON DELETE {constraint.ondelete}")
+
+    # A fresh inspector, as the tables have changed since the first one looked
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        live = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in live:
+                index.create(conn)
+                steps.append(f"{table.name}: index {index.name} created")
+
+    steps.extend(_backfill(conn, added))
+
+    if sqlite:
+        violations = conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise RuntimeError(f"Rows left without their parents: {violations[:10]}")
+    return steps
+
+
+async def upgrade() -> List[str]:
+    """Apply every pending step in one transaction; returns what was done"""
+    async with engine.connect() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            # Only takes effect outside a transaction, so before any step runs
+            await conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            steps = await conn.run_sync(_upgrade)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        finally:
+            if sqlite:
+                await conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    return steps
+
+
+async def main() -> None:
+    steps = await upgrade()
+    for step in steps:
+        print(step)
+    print("schema is up to date" if not steps else f"{len(steps)} steps applied")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,10 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import Optional, List, Any, Dict
 from datetime import datetime
+from uuid import UUID
+import re
+
+from .expressions import ExpressionError, parse
 from enum import Enum
 
 # Enums
@@ -37,6 +41,10 @@ class FormStatus(str, Enum):
     PUBLISHED = "published"
     ARCHIVED = "archived"
 
+class AnswerStorage(str, Enum):
+    ROWS = "rows"
+    PACKED = "packed"
+
 # User Schemas
 class UserBase(BaseModel):
     email: EmailStr
@@ -86,9 +94,24 @@ class ValidationRule(BaseModel):
     pattern: Optional[str] = None
     message: Optional[str] = None
 
+
+def _check_pattern(validation: Optional[ValidationRule]) -> None:
+    if validation and validation.pattern:
+        try:
+            re.compile(validation.pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern: {e}")
+
+def _check_expression(value: Optional[str], what: str) -> None:
+    if value and value.strip():
+        try:
+            parse(value)
+        except ExpressionError as e:
+            raise ValueError(f"Invalid {what}: {e}")
+
 # Skip Logic Schema
 class SkipLogic(BaseModel):
-    condition: Optional[str] = None  # Expression to evaluate
+    condition: Optional[str] = None  # Expression to evaluate, e.g. ${12} = 'yes'
     target_question_id: Optional[int] = None
     action: Optional[str] = "show"  # show, hide, skip
 
@@ -113,8 +136,16 @@ class QuestionBase(BaseModel):
     group_id: Optional[int] = None
     appearance: Dict[str, Any] = {}
 
+# Patterns and expressions are checked on input only, so questions stored
+# before the checks existed still load
 class QuestionCreate(QuestionBase):
-    pass
+    @model_validator(mode="after")
+    def check_expressions(self) -> "QuestionCreate":
+        _check_pattern(self.validation)
+        if self.skip_logic:
+            _check_expression(self.skip_logic.condition, "condition")
+        _check_expression(self.calculation, "calculation")
+        return self
 
 class QuestionUpdate(BaseModel):
     question_type: Optional[QuestionType] = None
@@ -127,8 +158,17 @@ class QuestionUpdate(BaseModel):
     validation: Optional[ValidationRule] = None
     skip_logic: Optional[SkipLogic] = None
     default_value: Optional[str] = None
+    calculation: Optional[str] = None
     min_value: Optional[float] = None
     max_value: Optional[float] = None
+    
+    @model_validator(mode="after")
+    def check_expressions(self) -> "QuestionUpdate":
+        _check_pattern(self.validation)
+        if self.skip_logic:
+            _check_expression(self.skip_logic.condition, "condition")
+        _check_expression(self.calculation, "calculation")
+        return self
 
 class QuestionResponse(QuestionBase):
     id: int
@@ -139,6 +179,13 @@ class QuestionResponse(QuestionBase):
     class Config:
         from_attributes = True
 
+class QuestionOrder(BaseModel):
+    id: int
+    order: int
+
+class QuestionMove(BaseModel):
+    after_id: Optional[int] = None  # Question to place it after; None moves it first
+
 # Question Group Schemas
 class QuestionGroupBase(BaseModel):
     name: str
@@ -185,6 +232,7 @@ class FormBase(BaseModel):
 
 class FormCreate(FormBase):
     questions: List[QuestionCreate] = []
+    answer_storage: Optional[AnswerStorage] = None  # Defaults to settings.answer_storage_default
 
 class FormUpdate(BaseModel):
     title: Optional[str] = None
@@ -197,6 +245,18 @@ class FormUpdate(BaseModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
 
+class QuestionDocument(QuestionCreate):
+    id: Optional[int] = None  # Stored question to update; None adds a new one
+
+class FormDocument(FormBase):
+    """A whole form as edited in the builder; questions are ordered as listed.
+    
+    Every stored question must be either listed or named in `deleted_ids`,
+    so a document missing questions is refused rather than deleting them.
+    """
+    questions: List[QuestionDocument]
+    deleted_ids: List[int] = []
+
 class FormResponse(FormBase):
     id: int
     owner_id: Optional[int]
@@ -204,6 +264,7 @@ class FormResponse(FormBase):
     updated_at: datetime
     questions: List[QuestionResponse] = []
     submission_count: int = 0
+    answer_storage: AnswerStorage = AnswerStorage.ROWS
     
     class Config:
         from_attributes = True
@@ -234,7 +295,7 @@ class AnswerCreate(AnswerBase):
     pass
 
 class AnswerResponse(AnswerBase):
-    id: int
+    id: Optional[int] = None  # None for answers of forms in packed storage
     submission_id: int
     created_at: datetime
     
@@ -245,6 +306,7 @@ class AnswerResponse(AnswerBase):
 class SubmissionBase(BaseModel):
     status: str = "completed"
     geolocation: Optional[Dict[str, Any]] = None
+    client_uuid: Optional[UUID] = None  # Generated by the client; retries with the same one are not stored twice
 
 class SubmissionCreate(SubmissionBase):
     answers: List[AnswerCreate]
@@ -262,6 +324,55 @@ class SubmissionResponse(SubmissionBase):
     class Config:
         from_attributes = True
 
+class SubmissionReceipt(BaseModel):
+    """Acknowledgement of a submission accepted by the ingest buffer"""
+    form_id: int
+    sequence: int
+    status: str = "queued"
+
+class BulkSubmissionItem(SubmissionCreate):
+    form_id: int
+
+class BulkSubmissionCreate(BaseModel):
+    items: List[BulkSubmissionItem]
+
+class BulkSubmissionResult(BaseModel):
+    index: int
+    form_id: int
+    status_code: int
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+
+class BulkSubmissionResponse(BaseModel):
+    created: int
+    duplicates: int = 0  # Already stored under the same client_uuid
+    failed: int
+    results: List[BulkSubmissionResult]
+
+class SubmissionPage(BaseModel):
+    items: List[SubmissionResponse]
+    next_cursor: Optional[str] = None
+
+class SubmissionSelection(BaseModel):
+    """Submissions of one form, by id and/or by filter; at least one must be given"""
+    ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if self.ids is None and self.status is None and self.date_from is None and self.date_to is None:
+            raise ValueError("Give ids or a filter (status, date_from, date_to)")
+        return self
+
+class SubmissionStatusChange(SubmissionSelection):
+    new_status: str = Field(..., min_length=1, max_length=50)
+
+class BulkChangeResponse(BaseModel):
+    form_id: int
+    affected: int  # Submissions deleted or changed
+
 # Template Schemas
 class TemplateBase(BaseModel):
     name: str
@@ -291,9 +402,32 @@ class FormStatistics(BaseModel):
     completion_rate: float
     question_stats: List[Dict[str, Any]] = []
 
+class Crosstab(BaseModel):
+    row_question_id: int
+    column_question_id: int
+    rows: List[str]  # Categories of the row question
+    columns: List[str]  # Categories of the column question
+    counts: List[List[int]]  # Submissions choosing each (row, column) pair
+    total: int  # Submissions answering both questions
+
 # Export Schema
 class ExportRequest(BaseModel):
-    format: str = "xlsx"  # xlsx, csv, json
+    format: str = "xlsx"  # xlsx, csv, json, ndjson, parquet, arrow
     include_metadata: bool = True
     date_from: Optional[datetime] = None
     date_to: Optional[datetime] = None
+    since: Optional[int] = None  # Watermark from a previous export; only later changes are exported
+    until: Optional[int] = None  # Upper watermark, set by the server for incremental exports
+
+class ExportJobResponse(BaseModel):
+    id: str
+    form_id: int
+    format: str
+    status: str  # queued, running, completed, failed
+    rows_done: int = 0
+    rows_total: Optional[int] = None
+    cached: bool = False
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    watermark: Optional[int] = None
@@ -0,0 +1,176 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set
+import logging
+
+from .expressions import ExpressionError, Evaluator, compile_expression, parse, references, truthy
+from .models import Question
+
+logger = logging.getLogger(__name__)
+
+# A question's skip_logic holds a condition and an action. "show" makes the
+# target relevant only while the condition holds; "hide" and "skip" make it
+# irrelevant while it holds. The target is `target_question_id`, or the
+# question itself when that is empty. Irrelevant questions are not required,
+# and their answers count as missing for the conditions that read them.
+
+HIDING_ACTIONS = {"hide", "skip"}
+
+
+def answer_values(answers: Iterable) -> Dict[int, Any]:
+    """Values conditions see, from the first instance of each answered question"""
+    values: Dict[int, Any] = {}
+    for answer in answers:
+        if answer.repeat_index or answer.question_id in values:
+            continue
+        if answer.value_text is not None:
+            values[answer.question_id] = answer.value_text
+        elif answer.value_number is not None:
+            values[answer.question_id] = answer.value_number
+        else:
+            values[answer.question_id] = answer.value_json
+    return values
+
+
+def find_cycle(dependencies: Mapping[int, Iterable[int]]) -> Optional[List[int]]:
+    """A cycle in a {node: nodes it depends on} graph, as a closed path, or None"""
+    WHITE, GREY, BLACK = 0, 1, 2
+    color: Dict[int, int] = {}
+    for start in dependencies:
+        if color.get(start, WHITE) != WHITE:
+            continue
+        path = [start]
+        iterators = [iter(dependencies.get(start, ()))]
+        color[start] = GREY
+        while iterators:
+            node = next(iterators[-1], None)
+            if node is None:
+                color[path.pop()] = BLACK
+                iterators.pop()
+                continue
+            state = color.get(node, WHITE)
+            if state == GREY:
+                return path[path.index(node):] + [node]
+            if state == WHITE:
+                color[node] = GREY
+                path.append(node)
+                iterators.append(iter(dependencies.get(node, ())))
+    return None
+
+
+def topological_order(dependencies: Mapping[int, Iterable[int]]) -> List[int]:
+    """Nodes of an acyclic graph, each after the nodes it depends on"""
+    order: List[int] = []
+    seen: Set[int] = set()
+    for start in dependencies:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack = [(start, iter(dependencies.get(start, ())))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                order.append(node)
+            elif child not in seen:
+                seen.add(child)
+                stack.append((child, iter(dependencies.get(child, ()))))
+    return order
+
+
+class _Rule:
+    __slots__ = ("hides", "evaluate")
+
+    def __init__(self, hides: bool, evaluate: Evaluator):
+        self.hides = hides
+        self.evaluate = evaluate
+
+
+def _question_rules(questions: Iterable[Question]):
+    """(target id, action, condition tree) for each question with skip logic"""
+    for question in questions:
+        logic = question.skip_logic or {}
+        condition = logic.get("condition")
+        if not condition:
+            continue
+        target = logic.get("target_question_id") or question.id
+        yield question.id, target, logic.get("action") or "show", condition
+
+
+def logic_errors(questions: List[Question]) -> List[str]:
+    """Problems that keep a form's skip logic from being evaluated"""
+    errors = []
+    ids = {q.id for q in questions}
+    dependencies: Dict[int, Set[int]] = {}
+
+    for question_id, target, action, condition in _question_rules(questions):
+        try:
+            refs = references(parse(condition))
+        except ExpressionError as e:
+            errors.append(f"Question {question_id}: invalid condition: {e}")
+            continue
+        unknown = sorted(refs - ids)
+        if unknown:
+            errors.append(f"Question {question_id}: condition refers to unknown questions {unknown}")
+        if target not in ids:
+            errors.append(f"Question {question_id}: skip logic targets unknown question {target}")
+        dependencies.setdefault(target, set()).update(refs & ids)
+
+    cycle = find_cycle(dependencies)
+    if cycle:
+        errors.append("Skip logic depends on itself: " + " -> ".join(str(q) for q in cycle))
+    return errors
+
+
+class RelevanceGraph:
+    """Compiled skip logic of a form.
+
+    Conditions are compiled once per form version and evaluated in dependency
+    order, so a question hidden by its own condition also counts as
+    unanswered for the questions that depend on it.
+    """
+
+    def __init__(self, questions: Iterable[Question]):
+        questions = list(questions)
+        rules: Dict[int, List[_Rule]] = {}
+        dependencies: Dict[int, Set[int]] = {}
+
+        for question_id, target, action, condition in _question_rules(questions):
+            try:
+                tree = parse(condition)
+            except ExpressionError:
+                logger.warning("Ignoring invalid skip logic on question %s", question_id)
+                continue
+            rules.setdefault(target, []).append(_Rule(action in HIDING_ACTIONS, compile_expression(tree)))
+            dependencies.setdefault(target, set()).update(references(tree))
+
+        cycle = find_cycle(dependencies)
+        while cycle:
+            # Publishing refuses cycles; older forms may still have one
+            logger.warning("Ignoring skip logic cycle %s", cycle)
+            for question_id in cycle:
+                rules.pop(question_id, None)
+                dependencies.pop(question_id, None)
+            cycle = find_cycle(dependencies)
+
+        self.rules = rules
+        self.order = [q for q in topological_order(dependencies) if q in rules]
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def hidden(self, values: Mapping[int, Any]) -> Set[int]:
+        """Ids of the questions that are not relevant for these answer values"""
+        hidden: Set[int] = set()
+        if not self.rules:
+            return hidden
+        values = dict(values)
+        for question_id in self.order:
+            relevant = True
+            for rule in self.rules[question_id]:
+                if truthy(rule.evaluate(values)) == rule.hides:
+                    relevant = False
+                    break
+            if not relevant:
+                hidden.add(question_id)
+                values.pop(question_id, None)
+        return hidden
@@ -0,0 +1,444 @@
+from sqlalchemy import select, func, case, delete, update, bindparam, null
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import argparse
+import asyncio
+import logging
+import math
+
+from .cache import TTLCache
+from .compiled import CompiledForm, CompiledQuestion, get_compiled_form
+from .config import settings
+from .database import async_session, dialect_insert
+from .models import Answer, Form, Submission, QuestionRollup, QuestionType
+from .packed_answers import unpack_answers
+from .schemas import FormStatistics
+
+logger = logging.getLogger(__name__)
+
+# Dashboards poll statistics constantly; reuse results for a few seconds
+statistics_cache = TTLCache(maxsize=1024, ttl=settings.statistics_cache_ttl)
+
+CHOICE_TYPES = {QuestionType.SELECT_ONE, QuestionType.SELECT_MULTIPLE, QuestionType.RATING}
+NUMERIC_TYPES = {QuestionType.INTEGER, QuestionType.DECIMAL, QuestionType.RANGE, QuestionType.RATING}
+COMPLETED_STATUSES = ("completed", "validated")
+PERCENTILES = (25, 50, 75, 90, 99)
+REBUILD_CHUNK = 1000  # Rows streamed per round trip while rebuilding rollups
+
+# Log-scaled bins give percentiles within 2% relative error, and merge by addition
+SKETCH_ACCURACY = 0.02
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Per (question_id, bucket): count, sum, min and max of the values added,
+# and min and max of the values removed
+Deltas = Dict[Tuple[int, str], List[Optional[float]]]
+
+
+def _count_since(since: datetime):
+    return func.count(case((Submission.created_at >= since, Submission.id)))
+
+
+def _sketch_bucket(value: float) -> str:
+    if value == 0:
+        return "z"
+    index = math.ceil(math.log(abs(value)) / _LOG_GAMMA)
+    return f"{'p' if value > 0 else 'n'}:{index}"
+
+
+def _bucket_value(bucket: str) -> float:
+    if bucket == "z":
+        return 0.0
+    sign, index = bucket.split(":")
+    value = 2 * _GAMMA ** int(index) / (_GAMMA + 1)
+    return value if sign == "p" else -value
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def answer_number(answer) -> Optional[float]:
+    if answer.value_number is not None:
+        return float(answer.value_number)
+    if answer.value_text:
+        try:
+            value = float(answer.value_text)
+        except ValueError:
+            return None
+        return value if math.isfinite(value) else None
+    return None
+
+
+def answer_choices(question: CompiledQuestion, answer) -> List[str]:
+    if question.question_type == QuestionType.RATING:
+        value = answer_number(answer)
+        return [_format_number(value)] if value is not None else []
+    if isinstance(answer.value_json, list):
+        return [str(v) for v in answer.value_json if v is not None]
+    if answer.value_json is not None and not isinstance(answer.value_json, dict):
+        return [str(answer.value_json)]
+    if answer.value_text:
+        if question.question_type == QuestionType.SELECT_MULTIPLE:
+            return [v for v in answer.value_text.split(",") if v]
+        return [answer.value_text]
+    return []
+
+
+def is_answered(answer) -> bool:
+    return any(v not in (None, "", [], {}) for v in (
+        answer.value_text, answer.value_number, answer.value_json, answer.value_file
+    ))
+
+
+def rollup_deltas(
+    form: CompiledForm,
+    answers: Iterable,
+    sign: int = 1,
+    deltas: Optional[Deltas] = None
+) -> Deltas:
+    """Per-bucket changes that storing (sign=1) or deleting (sign=-1) one
+    submission's answers makes.
+
+    Pass the result of a previous call as `deltas` to accumulate several
+    submissions into one set of changes.
+    """
+    if deltas is None:
+        deltas = {}
+
+    def bump(question_id: int, bucket: str):
+        delta = deltas.setdefault((question_id, bucket), [0, None, None, None, None, None])
+        delta[0] += sign
+
+    answered = set()
+    for answer in answers:
+        question = form.question_map.get(answer.question_id)
+        if question is None or not is_answered(answer):
+            continue
+
+        if question.id not in answered:
+            answered.add(question.id)
+            bump(question.id, "")
+
+        if question.question_type in CHOICE_TYPES:
+            for choice in answer_choices(question, answer):
+                bump(question.id, f"o:{choice}"[:255])
+
+        if question.question_type in NUMERIC_TYPES:
+            value = answer_number(answer)
+            if value is not None:
+                bump(question.id, _sketch_bucket(value))
+                # Numeric sum/min/max live on the summary row
+                summary = deltas[(question.id, "")]
+                summary[1] = (summary[1] or 0.0) + sign * value
+                low, high = (2, 3) if sign > 0 else (4, 5)
+                summary[low] = value if summary[low] is None else min(summary[low], value)
+                summary[high] = value if summary[high] is None else max(summary[high], value)
+
+    return deltas
+
+
+async def apply_rollups(db: AsyncSession, form_id: int, deltas: Deltas) -> None:
+    """Merge rollup deltas into the stored aggregates with one upsert.
+
+    A stored min or max that a removed value reached is cleared first, as
+    it may be gone; the next value stored sets it again, and reads fall
+    back to the sketch meanwhile (see _extreme).
+    """
+    if not deltas:
+        return
+
+    removed = [
+        {"q_id": question_id, "removed_min": delta[4], "removed_max": delta[5]}
+        for (question_id, bucket), delta in deltas.items()
+        if bucket == "" and delta[4] is not None
+    ]
+    if removed:
+        rollups = QuestionRollup.__table__
+        await db.execute(
+            update(rollups)
+            .where(rollups.c.question_id == bindparam("q_id"), rollups.c.bucket == "")
+            .values(
+                minimum=case((rollups.c.minimum >= bindparam("removed_min"), null()), else_=rollups.c.minimum),
+                maximum=case((rollups.c.maximum <= bindparam("removed_max"), null()), else_=rollups.c.maximum)
+            ),
+            removed
+        )
+
+    insert = dialect_insert(db)
+    stmt = insert(QuestionRollup)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[QuestionRollup.question_id, QuestionRollup.bucket],
+        set_={
+            "count": QuestionRollup.count + excluded.count,
+            "total": case(
+                (excluded.total.is_(None), QuestionRollup.total),
+                else_=func.coalesce(QuestionRollup.total, 0.0) + excluded.total
+            ),
+            "minimum": case(
+                (QuestionRollup.minimum.is_(None), excluded.minimum),
+                (excluded.minimum < QuestionRollup.minimum, excluded.minimum),
+                else_=QuestionRollup.minimum
+            ),
+            "maximum": case(
+                (QuestionRollup.maximum.is_(None), excluded.maximum),
+                (excluded.maximum > QuestionRollup.maximum, excluded.maximum),
+                else_=QuestionRollup.maximum
+            )
+        }
+    )
+    # render_nulls keeps rows with and without numeric values in one batch
+    await db.execute(stmt.execution_options(render_nulls=True), [
+        {
+            "question_id": question_id,
+            "bucket": bucket,
+            "form_id": form_id,
+            "count": count,
+            "total": total,
+            "minimum": minimum,
+            "maximum": maximum
+        }
+        for (question_id, bucket), (count, total, minimum, maximum, _, _) in deltas.items()
+    ])
+
+
+async def rebuild_rollups(db: AsyncSession, form: CompiledForm) -> int:
+    """Recompute a form's rollups from every stored submission.
+
+    Replaces the rows the form has, so it can be re-run. The form row is
+    locked first, so submissions stored meanwhile wait for the rebuild
+    instead of being counted twice or missed. Every question gets a
+    summary row, even unanswered ones. Marks the form's rollups as built
+    and returns how many submissions were read; the caller commits.
+    """
+    await db.execute(select(Form.id).where(Form.id == form.id).with_for_update())
+    await db.execute(delete(QuestionRollup).where(QuestionRollup.form_id == form.id))
+
+    deltas: Deltas = {(question.id, ""): [0, None, None, None, None, None] for question in form.questions}
+    submissions = 0
+    stream = await db.stream(
+        select(
+            Answer.submission_id, Answer.question_id, Answer.value_text,
+            Answer.value_number, Answer.value_json, Answer.value_file
+        )
+        .join(Submission, Submission.id == Answer.submission_id)
+        .where(Submission.form_id == form.id)
+        .order_by(Answer.submission_id)
+        .execution_options(yield_per=REBUILD_CHUNK)
+    )
+    # Rows come ordered by submission, so each one's answers are contiguous
+    answers: List = []
+    async for answer in stream:
+        if answers and answer.submission_id != answers[0].submission_id:
+            rollup_deltas(form, answers, deltas=deltas)
+            submissions += 1
+            answers = []
+        answers.append(answer)
+    if answers:
+        rollup_deltas(form, answers, deltas=deltas)
+        submissions += 1
+
+    stream = await db.stream(
+        select(Submission.id, Submission.created_at, Submission.packed_answers)
+        .where(Submission.form_id == form.id, Submission.packed_answers.is_not(None))
+        .execution_options(yield_per=REBUILD_CHUNK)
+    )
+    async for submission_id, created_at, document in stream:
+        rollup_deltas(form, unpack_answers(document, submission_id, created_at), deltas=deltas)
+        submissions += 1
+
+    await apply_rollups(db, form.id, deltas)
+    await db.execute(
+        update(Form).where(Form.id == form.id).values(rollups_built=True, updated_at=Form.updated_at)
+    )
+    return submissions
+
+
+class RollupBackfill:
+    """Rebuilds, in the background after startup, the rollups of forms
+    that had submissions before rollups existed, one form per transaction.
+    Until its turn comes a form reports no per-question statistics.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        async with async_session() as db:
+            result = await db.execute(
+                select(Form.id).where(Form.rollups_built.is_(False), Form.deleted_at.is_(None)).order_by(Form.id)
+            )
+            form_ids = result.scalars().all()
+        for form_id in form_ids:
+            try:
+                async with async_session() as db:
+                    form = await get_compiled_form(db, form_id)
+                    if form:
+                        await rebuild_rollups(db, form)
+                        await db.commit()
+            except Exception:
+                logger.exception("Rebuilding rollups of form %s failed; retried on the next start", form_id)
+            statistics_cache.invalidate(form_id)
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+rollup_backfill = RollupBackfill()
+
+
+def _extreme(stored: Optional[float], bucket: str) -> float:
+    """The stored min (or max) when it lies in `bucket`, the lowest (or
+    highest) sketch bucket holding values; else that bucket's value.
+
+    After deletions the stored value may be cleared, or set by a value
+    stored since that is not the extreme, so it is only trusted while it
+    falls in the right bucket. Otherwise the bucket's value stands in,
+    within SKETCH_ACCURACY of the true one.
+    """
+    if stored is not None and _sketch_bucket(stored) == bucket:
+        return stored
+    return _bucket_value(bucket)
+
+
+def _percentiles(bins: List[Tuple[float, int]], n: int) -> Dict[str, float]:
+    bins.sort()
+    result = {}
+    for p in PERCENTILES:
+        rank = p / 100 * (n - 1)
+        seen = 0
+        for value, count in bins:
+            seen += count
+            if seen > rank:
+                result[f"p{p}"] = value
+                break
+    return result
+
+
+async def question_statistics(db: AsyncSession, form: CompiledForm, total: int) -> List[Dict[str, Any]]:
+    """Per-question aggregates read from the rollup table"""
+    result = await db.execute(
+        select(QuestionRollup).where(QuestionRollup.form_id == form.id)
+    )
+    rollups = defaultdict(dict)
+    for row in result.scalars():
+        rollups[row.question_id][row.bucket] = row
+
+    stats = []
+    for question in form.questions:
+        if question.question_type == QuestionType.NOTE:
+            continue
+
+        buckets = rollups.get(question.id, {})
+        summary = buckets.get("")
+        answered = summary.count if summary else 0
+        item = {
+            "question_id": question.id,
+            "label": question.label,
+            "question_type": question.question_type.value,
+            "answered": answered,
+            "skipped": max(total - answered, 0)
+        }
+
+        if question.question_type in CHOICE_TYPES:
+            item["options"] = {
+                bucket[2:]: row.count
+                for bucket, row in buckets.items()
+                if bucket.startswith("o:") and row.count > 0
+            }
+
+        if question.question_type in NUMERIC_TYPES:
+            filled = sorted(
+                (_bucket_value(bucket), bucket, row.count)
+                for bucket, row in buckets.items()
+                if bucket[:2] in ("p:", "n:") or bucket == "z"
+                if row.count > 0
+            )
+            bins = [(value, count) for value, _, count in filled]
+            n = sum(count for _, count in bins)
+            item["count"] = n
+            item["min"] = _extreme(summary.minimum, filled[0][1]) if summary and n else None
+            item["max"] = _extreme(summary.maximum, filled[-1][1]) if summary and n else None
+            item["mean"] = summary.total / n if summary and n and summary.total is not None else None
+            item["percentiles"] = _percentiles(bins, n) if n else {}
+
+        stats.append(item)
+
+    return stats
+
+
+async def compute_form_statistics(db: AsyncSession, form_id: int) -> FormStatistics:
+    """Aggregate a form's submission statistics in a single statement"""
+    now = datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today_start - timedelta(days=today_start.weekday())
+    month_start = today_start.replace(day=1)
+
+    # Conditional aggregation works the same on Postgres and SQLite
+    result = await db.execute(
+        select(
+            func.count(Submission.id).label("total"),
+            _count_since(today_start).label("today"),
+            _count_since(week_start).label("week"),
+            _count_since(month_start).label("month"),
+            func.avg(Submission.duration_seconds).label("average_duration"),
+            func.count(case((Submission.status.in_(COMPLETED_STATUSES), Submission.id))).label("completed")
+        )
+        .where(Submission.form_id == form_id)
+    )
+    row = result.one()
+    total = row.total or 0
+
+    form = await get_compiled_form(db, form_id)
+
+    if form and total:
+        # Rollups of forms older than them are still being rebuilt by rollup_backfill
+        result = await db.execute(select(Form.rollups_built).where(Form.id == form_id))
+        if not result.scalar():
+            form = None
+
+    return FormStatistics(
+        total_submissions=total,
+        submissions_today=row.today or 0,
+        submissions_this_week=row.week or 0,
+        submissions_this_month=row.month or 0,
+        average_duration=row.average_duration,
+        completion_rate=round(100.0 * (row.completed or 0) / total, 2) if total else 0.0,
+        question_stats=await question_statistics(db, form, total) if form else []
+    )
+
+
+async def main(form_ids: list, all_forms: bool) -> None:
+    async with async_session() as db:
+        if all_forms:
+            result = await db.execute(select(Form.id).where(Form.deleted_at.is_(None)).order_by(Form.id))
+            form_ids = result.scalars().all()
+    for form_id in form_ids:
+        async with async_session() as db:
+            form = await get_compiled_form(db, form_id)
+            if not form:
+                print(f"form {form_id}: not found")
+                continue
+            submissions = await rebuild_rollups(db, form)
+            await db.commit()
+        statistics_cache.invalidate(form_id)
+        print(f"form {form_id}: rollups rebuilt from {submissions} submissions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild question rollups from stored submissions")
+    parser.add_argument("form_ids", type=int, nargs="*")
+    parser.add_argument("--all", action="store_true", help="Rebuild every form")
+    args = parser.parse_args()
+    if not args.form_ids and not args.all:
+        parser.error("give form ids or --all")
+    asyncio.run(main(args.form_ids, args.all))
@@ -0,0 +1,184 @@
+from typing import Any, Dict, Iterable, List, Optional
+import math
+import re
+
+from .models import Question, QuestionType
+
+# Answers are checked on every submit, so each question's rules are compiled
+# once per form version: patterns precompiled, option sets frozen and numeric
+# bounds pulled out of the JSON columns.
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+PHONE_RE = re.compile(r"\+?[0-9][0-9 ().-]{5,24}")
+URL_RE = re.compile(r"https?://[^\s/$.?#][^\s]*", re.IGNORECASE)
+
+NUMERIC_TYPES = {QuestionType.INTEGER, QuestionType.DECIMAL, QuestionType.RANGE}
+FORMAT_PATTERNS = {
+    QuestionType.EMAIL: (EMAIL_RE, "Must be a valid email address"),
+    QuestionType.PHONE: (PHONE_RE, "Must be a valid phone number"),
+    QuestionType.URL: (URL_RE, "Must be a valid URL"),
+}
+
+_MISSING = object()
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _numeric_value(answer) -> Any:
+    """The answer as a number, None when it is not numeric, or _MISSING"""
+    if answer.value_number is not None:
+        return _as_float(answer.value_number)
+    if answer.value_text not in (None, ""):
+        return _as_float(answer.value_text.strip())
+    if answer.value_json is not None and not isinstance(answer.value_json, (dict, list, bool)):
+        return _as_float(answer.value_json)
+    return _MISSING
+
+
+def _text_value(answer) -> Optional[str]:
+    if answer.value_text not in (None, ""):
+        return answer.value_text
+    if isinstance(answer.value_json, str) and answer.value_json:
+        return answer.value_json
+    return None
+
+
+def _choice_values(answer) -> List[str]:
+    if isinstance(answer.value_json, list):
+        return [str(v) for v in answer.value_json if v is not None]
+    if answer.value_json is not None and not isinstance(answer.value_json, dict):
+        return [str(answer.value_json)]
+    if answer.value_text:
+        return [answer.value_text]
+    return []
+
+
+class QuestionRules:
+    """Checks for the answers to one question"""
+
+    __slots__ = (
+        "question_id", "question_type", "numeric", "integer", "minimum", "maximum",
+        "min_length", "max_length", "pattern", "format", "options", "multiple", "message"
+    )
+
+    def __init__(self, question: Question):
+        rule = question.validation or {}
+        question_type = QuestionType(question.question_type)
+
+        self.question_id = question.id
+        self.question_type = question_type
+        self.numeric = question_type in NUMERIC_TYPES
+        self.integer = question_type == QuestionType.INTEGER
+        self.message = rule.get("message") or None
+
+        # Bounds from the validation rule, narrowed by a range question's slider limits
+        self.minimum = _as_float(rule.get("min")) if self.numeric else None
+        self.maximum = _as_float(rule.get("max")) if self.numeric else None
+        if question_type == QuestionType.RANGE:
+            slider_min, slider_max = _as_float(question.min_value), _as_float(question.max_value)
+            if slider_min is not None and (self.minimum is None or slider_min > self.minimum):
+                self.minimum = slider_min
+            if slider_max is not None and (self.maximum is None or slider_max < self.maximum):
+                self.maximum = slider_max
+
+        self.min_length = rule.get("min_length") or None
+        self.max_length = rule.get("max_length") or None
+
+        self.pattern = None
+        if rule.get("pattern"):
+            try:
+                self.pattern = re.compile(rule["pattern"])
+            except re.error:
+                pass  # Stored before patterns were checked on save; not enforceable
+
+        self.format = FORMAT_PATTERNS.get(question_type)
+
+        self.multiple = question_type == QuestionType.SELECT_MULTIPLE
+        self.options = None
+        if question_type in (QuestionType.SELECT_ONE, QuestionType.SELECT_MULTIPLE):
+            values = frozenset(
+                str(opt.get("value")) for opt in (question.options or []) if isinstance(opt, dict)
+            )
+            self.options = values or None
+
+    @property
+    def empty(self) -> bool:
+        """Whether there is nothing to check for this question"""
+        return not (
+            self.numeric or self.min_length or self.max_length
+            or self.pattern or self.format or self.options
+        )
+
+    def check(self, answer) -> Optional[Dict[str, Any]]:
+        """The first rule the answer breaks, as an error dict, or None"""
+        if self.numeric:
+            value = _numeric_value(answer)
+            if value is None:
+                return self._error(answer, "type", "Must be a number")
+            if value is not _MISSING:
+                if self.integer and not value.is_integer():
+                    return self._error(answer, "type", "Must be a whole number")
+                if self.minimum is not None and value < self.minimum:
+                    return self._error(answer, "min", f"Must be at least {self.minimum:g}")
+                if self.maximum is not None and value > self.maximum:
+                    return self._error(answer, "max", f"Must be at most {self.maximum:g}")
+
+        if self.options is not None:
+            choices = _choice_values(answer)
+            if not self.multiple and len(choices) > 1:
+                return self._error(answer, "choice", "Only one option may be selected")
+            if self.multiple and answer.value_text and answer.value_json is None:
+                choices = [v for v in answer.value_text.split(",") if v]
+            invalid = [c for c in choices if c not in self.options]
+            if invalid:
+                return self._error(answer, "choice", f"Not an option: {', '.join(invalid)}")
+            return None
+
+        text = _text_value(answer)
+        if text is None:
+            return None
+        if self.min_length and len(text) < self.min_length:
+            return self._error(answer, "min_length", f"Must be at least {self.min_length} characters")
+        if self.max_length and len(text) > self.max_length:
+            return self._error(answer, "max_length", f"Must be at most {self.max_length} characters")
+        if self.format is not None:
+            pattern, message = self.format
+            if not pattern.fullmatch(text.strip()):
+                return self._error(answer, "format", message)
+        if self.pattern is not None and not self.pattern.fullmatch(text):
+            return self._error(answer, "pattern", "Does not match the expected format")
+        return None
+
+    def _error(self, answer, code: str, message: str) -> Dict[str, Any]:
+        return {
+            "question_id": self.question_id,
+            "repeat_index": answer.repeat_index,
+            "code": code,
+            "message": self.message or message
+        }
+
+
+class FormValidator:
+    """Compiled answer checks for all questions of a form"""
+
+    def __init__(self, questions: Iterable[Question]):
+        rules = (QuestionRules(q) for q in questions)
+        self.rules = {r.question_id: r for r in rules if not r.empty}
+
+    def validate(self, answers: Iterable) -> List[Dict[str, Any]]:
+        """Errors for every answer that breaks its question's rules"""
+        errors = []
+        rules = self.rules
+        for answer in answers:
+            question_rules = rules.get(answer.question_id)
+            if question_rules is not None:
+                error = question_rules.check(answer)
+                if error is not None:
+                    errors.append(error)
+        return errors
@@ -0,0 +1,126 @@
+"""Crosstab of two questions, pivoting the answers table vs the answer matrix.
+
+Seeds a form straight into the database in DATABASE_URL (a throwaway SQLite
+file by default), then times a crosstab built by pivoting every answer in
+Python against building the answer matrix, refreshing it after a few new
+submissions and crossing two of its columns:
+
+    python -m benchmarks.answer_matrix --submissions 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import insert, select, update
+
+from app.answer_matrix import AnswerMatrix
+from app.compiled import get_compiled_form
+from app.database import async_session, init_db
+from app.models import Answer, Form, FormStatus, Question, QuestionType, Submission
+
+QUESTIONS = 20
+OPTIONS = [{"value": v, "label": v} for v in "abcde"]
+
+
+async def seed(submissions: int, first_seq: int = 1, form_id=None):
+    async with async_session() as db:
+        if form_id is None:
+            form = Form(title="Benchmark", status=FormStatus.PUBLISHED)
+            db.add(form)
+            await db.flush()
+            form_id = form.id
+            for i in range(QUESTIONS):
+                kind = (QuestionType.SELECT_ONE, QuestionType.SELECT_MULTIPLE, QuestionType.INTEGER, QuestionType.TEXT)[i % 4]
+                db.add(Question(form_id=form_id, question_type=kind, label=f"Q{i}", order=i, options=OPTIONS))
+            await db.flush()
+
+        result = await db.execute(select(Question.id, Question.question_type).where(Question.form_id == form_id))
+        questions = result.all()
+        result = await db.execute(
+            insert(Submission).returning(Submission.id),
+            [{"form_id": form_id, "status": "completed", "change_seq": first_seq + i} for i in range(submissions)]
+        )
+        rows = []
+        for submission_id in result.scalars():
+            for question_id, kind in questions:
+                row = {"submission_id": submission_id, "question_id": question_id,
+                       "value_text": None, "value_number": None, "value_json": None}
+                if kind == QuestionType.SELECT_ONE:
+                    row["value_text"] = random.choice("abcde")
+                elif kind == QuestionType.SELECT_MULTIPLE:
+                    row["value_json"] = random.sample("abcde", 2)
+                elif kind == QuestionType.INTEGER:
+                    row["value_number"] = random.randint(0, 99)
+                else:
+                    row["value_text"] = "text"
+                rows.append(row)
+        await db.execute(insert(Answer), rows)
+        await db.execute(update(Form).where(Form.id == form_id).values(change_seq=first_seq + submissions - 1))
+        await db.commit()
+        return form_id, sorted(q for q, kind in questions if kind in (QuestionType.SELECT_ONE, QuestionType.SELECT_MULTIPLE))
+
+
+async def pivot_crosstab(form_id: int, row_question: int, column_question: int):
+    """What a crosstab costs without the matrix: every answer through Python"""
+    async with async_session() as db:
+        result = await db.execute(
+            select(Answer.submission_id, Answer.question_id, Answer.value_text, Answer.value_json)
+            .join(Submission).where(Submission.form_id == form_id)
+        )
+        by_submission = {}
+        for submission_id, question_id, value_text, value_json in result:
+            by_submission.setdefault(submission_id, {})[question_id] = value_json if value_json is not None else value_text
+        counts = {}
+        for answers in by_submission.values():
+            if row_question in answers and column_question in answers:
+                for choice in answers[column_question]:
+                    key = (answers[row_question], choice)
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+async def main(submissions: int):
+    random.seed(1)
+    await init_db()
+    form_id, choice_questions = await seed(submissions)
+    row_question, column_question = choice_questions[0], choice_questions[1]
+
+    started = time.perf_counter()
+    await pivot_crosstab(form_id, row_question, column_question)
+    pivot_ms = (time.perf_counter() - started) * 1000
+
+    async with async_session() as db:
+        form = await get_compiled_form(db, form_id)
+        matrix = AnswerMatrix(form)
+        started = time.perf_counter()
+        await matrix.refresh(db)
+        build_ms = (time.perf_counter() - started) * 1000
+
+    await seed(100, first_seq=submissions + 1, form_id=form_id)
+    async with async_session() as db:
+        started = time.perf_counter()
+        await matrix.refresh(db)
+        refresh_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    matrix.crosstab(row_question, column_question, matrix.mask())
+    crosstab_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{submissions} submissions x {QUESTIONS} questions, matrix {matrix.nbytes / 2**20:.1f} MiB")
+    print(f"pivot in Python {pivot_ms:.0f} ms")
+    print(f"matrix build {build_ms:.0f} ms  refresh after 100 new {refresh_ms:.1f} ms  crosstab {crosstab_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=50000)
+    args = parser.parse_args()
+    asyncio.run(main(args.submissions))
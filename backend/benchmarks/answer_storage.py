@@ -0,0 +1,125 @@
+"""Answers rows vs packed answer documents for a wide form.
+
+Stores the same submissions into a form of each layout through the ingest
+path, then compares insert time, on-disk size (SQLite's dbstat) and the time
+to read every submission back with its answers as an export does:
+
+    python -m benchmarks.answer_storage --questions 120 --submissions 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import func, select, text
+
+from app.compiled import get_compiled_form
+from app.database import async_session, init_db
+from app.exports import iter_submissions
+from app.ingest import Origin, check_submission, store_submissions
+from app.models import AnswerStorage, Form, FormStatus, Question, QuestionType, Submission
+from app.schemas import AnswerCreate, ExportRequest, SubmissionCreate
+
+BATCH = 100
+OPTIONS = [{"value": v, "label": v} for v in "abcde"]
+KINDS = (QuestionType.SELECT_ONE, QuestionType.SELECT_MULTIPLE, QuestionType.INTEGER, QuestionType.TEXT)
+
+
+async def create_form(questions: int, storage: AnswerStorage) -> int:
+    async with async_session() as db:
+        form = Form(title=f"Benchmark {storage.value}", status=FormStatus.PUBLISHED, answer_storage=storage)
+        db.add(form)
+        await db.flush()
+        for i in range(questions):
+            db.add(Question(form_id=form.id, question_type=KINDS[i % 4], label=f"Q{i}", order=i, options=OPTIONS))
+        await db.commit()
+        return form.id
+
+
+def payload(form) -> SubmissionCreate:
+    answers = []
+    for question in form.questions:
+        if question.question_type == QuestionType.SELECT_ONE:
+            answers.append(AnswerCreate(question_id=question.id, value_text=random.choice("abcde")))
+        elif question.question_type == QuestionType.SELECT_MULTIPLE:
+            answers.append(AnswerCreate(question_id=question.id, value_json=random.sample("abcde", 2)))
+        elif question.question_type == QuestionType.INTEGER:
+            answers.append(AnswerCreate(question_id=question.id, value_number=random.randint(0, 99)))
+        else:
+            answers.append(AnswerCreate(question_id=question.id, value_text=f"text {random.randint(0, 9999)}"))
+    return SubmissionCreate(answers=answers)
+
+
+async def store(form_id: int, submissions: int) -> float:
+    async with async_session() as db:
+        form = await get_compiled_form(db, form_id)
+    origin = Origin(None, "127.0.0.1", "benchmark", datetime.utcnow())
+    batches = [
+        [check_submission(form, payload(form), origin) for _ in range(min(BATCH, submissions - start))]
+        for start in range(0, submissions, BATCH)
+    ]
+    started = time.perf_counter()
+    for pending in batches:
+        async with async_session() as db:
+            await store_submissions(db, form, pending)
+            await db.commit()
+    return time.perf_counter() - started
+
+
+async def read_back(form_id: int) -> float:
+    async with async_session() as db:
+        form = await get_compiled_form(db, form_id)
+    started = time.perf_counter()
+    answers = 0
+    async for sub in iter_submissions(form.id, ExportRequest(format="csv")):
+        answers += len(sub.answers)
+    return time.perf_counter() - started
+
+
+async def sizes(packed_form_id: int):
+    async with async_session() as db:
+        result = await db.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name = 'answers' "
+            "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'answers')"
+        ))
+        rows_bytes = result.scalar() or 0
+        result = await db.execute(
+            select(func.sum(func.length(Submission.packed_answers))).where(Submission.form_id == packed_form_id)
+        )
+        packed_bytes = result.scalar() or 0
+    return rows_bytes, packed_bytes
+
+
+async def main(questions: int, submissions: int):
+    random.seed(1)
+    await init_db()
+    rows_form = await create_form(questions, AnswerStorage.ROWS)
+    packed_form = await create_form(questions, AnswerStorage.PACKED)
+
+    rows_insert = await store(rows_form, submissions)
+    packed_insert = await store(packed_form, submissions)
+    rows_read = await read_back(rows_form)
+    packed_read = await read_back(packed_form)
+    rows_bytes, packed_bytes = await sizes(packed_form)
+
+    print(f"{submissions} submissions x {questions} questions")
+    print(f"rows    insert {rows_insert * 1000:.0f} ms  read {rows_read * 1000:.0f} ms  "
+          f"answers table + indexes {rows_bytes / 2**20:.1f} MiB")
+    print(f"packed  insert {packed_insert * 1000:.0f} ms  read {packed_read * 1000:.0f} ms  "
+          f"documents {packed_bytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=120)
+    parser.add_argument("--submissions", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.questions, args.submissions))
@@ -0,0 +1,93 @@
+"""Deleting a large form: ORM cascade vs ON DELETE CASCADE vs background purge.
+
+Seeds three identical forms, then deletes one with its submissions and
+answers loaded and deleted by the ORM (what `cascade="all, delete-orphan"`
+costs), one with a single DELETE left to ON DELETE CASCADE, and one in the
+background, reporting the longest purge transaction:
+
+    python -m benchmarks.form_delete --submissions 10000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import selectinload
+
+from benchmarks.answer_matrix import QUESTIONS, seed
+from app.database import async_session, init_db
+from app.form_purge import FormPurger
+from app.models import Form, Submission
+
+
+async def orm_delete(form_id: int) -> float:
+    started = time.perf_counter()
+    async with async_session() as db:
+        result = await db.execute(
+            select(Form)
+            .options(selectinload(Form.submissions).selectinload(Submission.answer_rows))
+            .where(Form.id == form_id)
+        )
+        await db.delete(result.scalar_one())
+        await db.commit()
+    return time.perf_counter() - started
+
+
+async def cascade_delete(form_id: int) -> float:
+    started = time.perf_counter()
+    async with async_session() as db:
+        await db.execute(delete(Form).where(Form.id == form_id))
+        await db.commit()
+    return time.perf_counter() - started
+
+
+class TimedPurger(FormPurger):
+    longest = 0.0
+
+    async def _delete_batch(self, model, form_id: int) -> int:
+        started = time.perf_counter()
+        deleted = await super()._delete_batch(model, form_id)
+        self.longest = max(self.longest, time.perf_counter() - started)
+        return deleted
+
+
+async def background_delete(form_id: int, batch_size: int):
+    purger = TimedPurger(batch_size)
+    started = time.perf_counter()
+    async with async_session() as db:
+        await db.execute(update(Form).where(Form.id == form_id).values(deleted_at=datetime.utcnow()))
+        await db.commit()
+    hidden = time.perf_counter() - started
+    purger.schedule(form_id)
+    await asyncio.gather(*purger._tasks.values())
+    return hidden, time.perf_counter() - started, purger.longest
+
+
+async def main(submissions: int, batch_size: int):
+    await init_db()
+    forms = [(await seed(submissions))[0] for _ in range(3)]
+
+    orm = await orm_delete(forms[0])
+    cascade = await cascade_delete(forms[1])
+    hidden, purged, longest = await background_delete(forms[2], batch_size)
+
+    print(f"{submissions} submissions x {QUESTIONS} answers")
+    print(f"ORM cascade {orm * 1000:.0f} ms  ON DELETE CASCADE {cascade * 1000:.0f} ms")
+    print(f"background: hidden in {hidden * 1000:.1f} ms, purged in {purged * 1000:.0f} ms, "
+          f"longest transaction {longest * 1000:.0f} ms ({batch_size} submissions)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.submissions, args.batch_size))
@@ -0,0 +1,60 @@
+"""Cost of compiling and evaluating skip logic for a wide form.
+
+Builds a form whose questions each depend on earlier ones, then times
+compiling its RelevanceGraph and evaluating it for one submission:
+
+    python -m benchmarks.skip_logic --questions 150 --rounds 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from app.models import Question, QuestionType
+from app.skip_logic import RelevanceGraph
+
+
+def build_questions(count: int):
+    questions = []
+    for i in range(1, count + 1):
+        logic = {}
+        if i > 1:
+            a, b = random.randint(1, i - 1), random.randint(1, i - 1)
+            logic = {
+                "condition": f"${{{a}}} > 10 and (selected(${{{b}}}, 'x') or not empty(${{{b}}}))",
+                "action": "show" if i % 3 else "hide"
+            }
+        questions.append(Question(id=i, question_type=QuestionType.INTEGER, label=f"Q{i}", skip_logic=logic))
+    return questions
+
+
+def main(count: int, rounds: int):
+    random.seed(1)
+    questions = build_questions(count)
+
+    started = time.perf_counter()
+    graph = RelevanceGraph(questions)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    values = {i: random.choice([5, 50, "x y", None]) for i in range(1, count + 1)}
+    started = time.perf_counter()
+    for _ in range(rounds):
+        graph.hidden(values)
+    per_call_us = (time.perf_counter() - started) / rounds * 1e6
+
+    print(f"{count} questions with skip logic")
+    print(f"compile {compile_ms:.2f} ms  evaluate {per_call_us:.1f} us per submission")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=150)
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.questions, args.rounds)
@@ -0,0 +1,89 @@
+"""Latency of POST /api/submissions/forms/{form_id} for a wide form.
+
+Runs the app in-process against the database in DATABASE_URL (a throwaway
+SQLite file by default) and prints p50/p99 per submit:
+
+    python -m benchmarks.submit_latency --questions 150 --submissions 500
+
+Needs httpx, which is not part of requirements.txt.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+import httpx
+
+from app.database import async_session, init_db
+from app.main import app
+from app.models import Form, FormStatus, Question, QuestionType
+
+
+async def seed_form(question_count: int):
+    async with async_session() as db:
+        form = Form(title="Benchmark", status=FormStatus.PUBLISHED, is_public=True, allow_anonymous=True)
+        db.add(form)
+        await db.flush()
+        questions = []
+        for i in range(question_count):
+            kind = (QuestionType.TEXT, QuestionType.INTEGER, QuestionType.SELECT_ONE)[i % 3]
+            question = Question(
+                form_id=form.id,
+                question_type=kind,
+                label=f"Q{i}",
+                order=i,
+                options=[{"value": "a", "label": "A"}, {"value": "b", "label": "B"}]
+            )
+            db.add(question)
+            questions.append(question)
+        await db.commit()
+        return form.id, [(q.id, q.question_type) for q in questions]
+
+
+def make_answers(questions, n: int):
+    answers = []
+    for question_id, kind in questions:
+        if kind == QuestionType.INTEGER:
+            answers.append({"question_id": question_id, "value_number": n % 90})
+        elif kind == QuestionType.SELECT_ONE:
+            answers.append({"question_id": question_id, "value_text": "ab"[n % 2]})
+        else:
+            answers.append({"question_id": question_id, "value_text": f"answer {n}"})
+    return answers
+
+
+async def run(question_count: int, submissions: int, warmup: int):
+    await init_db()
+    form_id, questions = await seed_form(question_count)
+    transport = httpx.ASGITransport(app=app)
+    timings = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for n in range(warmup + submissions):
+            body = {"answers": make_answers(questions, n)}
+            started = time.perf_counter()
+            response = await client.post(f"/api/submissions/forms/{form_id}", json=body)
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            if n >= warmup:
+                timings.append(elapsed * 1000)
+
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{submissions} submits x {question_count} questions")
+    print(f"p50 {statistics.median(timings):.2f} ms  p99 {p99:.2f} ms  mean {statistics.fmean(timings):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=150)
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.questions, args.submissions, args.warmup))
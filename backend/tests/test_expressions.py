@@ -0,0 +1,94 @@
+"""Parsing and evaluation of form expressions, including the size limits
+that keep hostile input from exhausting the parser.
+
+Run from backend/ with `python -m pytest tests`.
+"""
+import pytest
+
+from app.expressions import (
+    MAX_DEPTH, MAX_LENGTH, MAX_NESTING, ExpressionError, compile_expression, parse, references
+)
+
+
+def evaluate(text: str, values: dict):
+    return compile_expression(parse(text))(values)
+
+
+@pytest.mark.parametrize("text, values, expected", [
+    ("${12} = 'yes' and (${14} >= 18 or selected(${15}, 'minor'))", {12: "yes", 14: 20}, True),
+    ("${12} = 'yes' and (${14} >= 18 or selected(${15}, 'minor'))", {12: "yes", 14: 10, 15: ["minor"]}, True),
+    ("${12} = 'yes' and (${14} >= 18 or selected(${15}, 'minor'))", {12: "no", 14: 20}, False),
+    ("if(empty(${20}), 0, ${20} * 1.16)", {}, 0),
+    ("if(empty(${20}), 0, ${20} * 1.16)", {20: 100}, pytest.approx(116.0)),
+    ("7 div 2 + 7 mod 2", {}, 4.5),
+    ("-${1} + 3", {1: 5}, -2.0),
+    ("not(${1} != null)", {}, True),
+    ("${1} > 2", {}, False),
+    ("${1} + 2", {}, None),
+    ("${1} / 0", {1: 3}, None),
+    ("concat(${1}, '-', count_selected(${2}))", {1: "a", 2: "x y"}, "a-2"),
+    ("coalesce(${1}, ${2}, 'none')", {2: ""}, "none"),
+    ("round(${1}, 1) = 2.3", {1: 2.34}, True),
+    ("max(${1}, ${2}, 3)", {1: 7}, 7.0),
+    ("${1} < '2024-02-01'", {1: "2024-01-15"}, True),
+    ("string-length(${1}) == 3", {1: "abc"}, True),
+])
+def test_valid_expressions_evaluate(text, values, expected):
+    assert evaluate(text, values) == expected
+
+
+def test_references_lists_every_question_read():
+    assert references(parse("if(${1} > 0, ${2}, coalesce(${3}, ${1}))")) == {1, 2, 3}
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "   ",
+    "${1} +",
+    "(${1} = 2",
+    "${1} = 2)",
+    "${1} ${2}",
+    "${abc} = 1",
+    "${1} = 'open",
+    "${1} # 2",
+    "unknown(${1})",
+    "if(${1}, 2)",
+    "selected(${1}, 'a', 'b')",
+    "round()",
+    "and ${1}",
+])
+def test_malformed_expressions_are_rejected(text):
+    with pytest.raises(ExpressionError):
+        parse(text)
+
+
+def test_length_limit():
+    padding = " " * (MAX_LENGTH - len("${1} = 1"))
+    parse("${1} = 1" + padding)
+    with pytest.raises(ExpressionError, match="longer than"):
+        parse("${1} = 1" + padding + " ")
+
+
+@pytest.mark.parametrize("wrap", [
+    lambda inner: f"({inner})",
+    lambda inner: f"abs({inner})",
+    lambda inner: f"-{inner}",
+    lambda inner: f"not {inner}",
+])
+def test_nesting_limit(wrap):
+    def nest(levels: int) -> str:
+        text = "${1}"
+        for _ in range(levels):
+            text = wrap(text)
+        return text
+
+    parse(nest(MAX_NESTING))
+    with pytest.raises(ExpressionError, match="nested too deeply"):
+        parse(nest(MAX_NESTING + 1))
+
+
+def test_depth_limit():
+    # Each operator in a chain adds a level to the tree without any nesting
+    parse(" + ".join(["${1}"] * MAX_DEPTH))
+    with pytest.raises(ExpressionError, match="chain of operations"):
+        parse(" + ".join(["${1}"] * (MAX_DEPTH + 1)))
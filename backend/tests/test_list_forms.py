@@ -0,0 +1,65 @@
+"""GET /forms must load a page of forms in a fixed number of statements.
+
+Run from backend/ with `python -m pytest tests`.
+"""
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+)
+
+from sqlalchemy import event
+
+from app.database import async_session, engine, init_db
+from app.models import Form, Question, QuestionType, User
+from app.routers.forms import list_forms
+
+
+async def add_forms(owner: User, count: int) -> None:
+    async with async_session() as db:
+        for i in range(count):
+            form = Form(title=f"Form {i}", owner_id=owner.id, submission_count=i)
+            form.questions = [
+                Question(question_type=QuestionType.TEXT, label="Name", order=1024),
+                Question(question_type=QuestionType.INTEGER, label="Age", order=2048)
+            ]
+            db.add(form)
+        await db.commit()
+
+
+async def count_list_statements(owner: User) -> tuple:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        async with async_session() as db:
+            forms = await list_forms(skip=0, limit=100, status=None, search=None, db=db, current_user=owner)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+    return len(forms), len(statements)
+
+
+async def run() -> None:
+    await init_db()
+    async with async_session() as db:
+        owner = User(email="owner@example.com", hashed_password="x")
+        db.add(owner)
+        await db.commit()
+
+    await add_forms(owner, 5)
+    listed_few, statements_few = await count_list_statements(owner)
+    await add_forms(owner, 15)
+    listed_many, statements_many = await count_list_statements(owner)
+
+    assert (listed_few, listed_many) == (5, 20)
+    assert statements_many == statements_few, (statements_few, statements_many)
+
+
+def test_list_forms_statements_do_not_grow_with_forms():
+    asyncio.run(run())
@@ -0,0 +1,151 @@
+"""Sparse question order keys: picking keys in the gaps, respacing when a
+gap runs out, and writing only the questions whose key changed.
+
+Run from backend/ with `python -m pytest tests`.
+"""
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+)
+
+import pytest
+from sqlalchemy import event, select
+
+from app.database import async_session, engine, init_db
+from app.models import Form, Question, QuestionType, User
+from app.ordering import ORDER_GAP, keep_orders, order_between, spaced_orders
+from app.routers.forms import move_question, reorder_questions
+from app.schemas import QuestionMove, QuestionOrder
+
+
+@pytest.mark.parametrize("before, after, expected", [
+    (None, None, ORDER_GAP),
+    (1024, None, 1024 + ORDER_GAP),
+    (None, 1024, 1024 - ORDER_GAP),
+    (1024, 2048, 1536),
+    (5, 7, 6),
+    (5, 6, None),
+])
+def test_order_between(before, after, expected):
+    assert order_between(before, after) == expected
+
+
+def test_keep_orders_keeps_an_unchanged_order():
+    assert keep_orders(spaced_orders(5)) == spaced_orders(5)
+
+
+def test_keep_orders_rekeys_only_the_moved_question():
+    # The last question moved to second place
+    orders = keep_orders([1024, 4096, 2048, 3072])
+    assert orders[0] == 1024 and orders[2:] == [2048, 3072]
+    assert 1024 < orders[1] < 2048
+
+
+def test_keep_orders_places_new_questions_in_the_gaps():
+    orders = keep_orders([None, 1024, None, None, 2048, None])
+    assert orders[1] == 1024 and orders[4] == 2048
+    assert orders == sorted(set(orders))
+
+
+def test_keep_orders_moves_dense_keys_to_the_top_without_respacing():
+    assert keep_orders([3, 0, 1, 2]) == [0 - ORDER_GAP, 0, 1, 2]
+
+
+def test_keep_orders_respaces_when_adjacent_keys_leave_no_gap():
+    assert keep_orders([1, None, 2]) == spaced_orders(3)
+    # The second question moved between the adjacent keys 4 and 5
+    assert keep_orders([1, 3, 4, 2, 5]) == spaced_orders(5)
+
+
+async def add_form(owner: User, orders: list) -> tuple:
+    async with async_session() as db:
+        form = Form(title="Ordered", owner_id=owner.id)
+        form.questions = [
+            Question(question_type=QuestionType.TEXT, label=f"Q{i}", order=order)
+            for i, order in enumerate(orders)
+        ]
+        db.add(form)
+        await db.commit()
+        return form.id, [question.id for question in form.questions]
+
+
+async def stored_orders(question_ids: list) -> list:
+    async with async_session() as db:
+        result = await db.execute(select(Question.id, Question.order).where(Question.id.in_(question_ids)))
+        keys = dict(result.all())
+    return [keys[question_id] for question_id in question_ids]
+
+
+async def written_rows(call) -> int:
+    """How many question rows the UPDATEs issued by `call` were given"""
+    rows = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE questions"):
+            rows.extend(parameters if executemany else [parameters])
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        async with async_session() as db:
+            await call(db)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+    return len(rows)
+
+
+async def run_reorder(owner: User) -> None:
+    form_id, ids = await add_form(owner, spaced_orders(4))
+    _, other_ids = await add_form(owner, spaced_orders(1))
+
+    # Only the questions sent are written; another form's question is untouched
+    changes = [QuestionOrder(id=ids[3], order=1536), QuestionOrder(id=other_ids[0], order=99)]
+    written = await written_rows(
+        lambda db: reorder_questions(form_id=form_id, question_orders=changes, db=db, current_user=owner)
+    )
+    assert written == 2
+    assert await stored_orders(ids) == [1024, 2048, 3072, 1536]
+    assert await stored_orders(other_ids) == [1024]
+
+
+async def run_move(owner: User) -> None:
+    form_id, ids = await add_form(owner, spaced_orders(4))
+
+    # A gap is left between the new neighbours: only the moved row is written
+    written = await written_rows(
+        lambda db: move_question(form_id=form_id, question_id=ids[3], move=QuestionMove(after_id=ids[0]), db=db, current_user=owner)
+    )
+    assert written == 1
+    assert await stored_orders(ids) == [1024, 2048, 3072, 1536]
+
+    # Already in place: nothing is written
+    written = await written_rows(
+        lambda db: move_question(form_id=form_id, question_id=ids[3], move=QuestionMove(after_id=ids[0]), db=db, current_user=owner)
+    )
+    assert written == 0
+
+    # No gap between 1024 and 1025: the form is respaced, writing only the keys that changed
+    form_id, ids = await add_form(owner, [1024, 1025, 4096, 5120])
+    async with async_session() as db:
+        changes = await move_question(
+            form_id=form_id, question_id=ids[3], move=QuestionMove(after_id=ids[0]), db=db, current_user=owner
+        )
+    assert {change.id: change.order for change in changes} == {ids[3]: 2048, ids[1]: 3072}
+    assert await stored_orders(ids) == [1024, 3072, 4096, 2048]
+
+
+async def run() -> None:
+    await init_db()
+    async with async_session() as db:
+        owner = User(email="orderer@example.com", hashed_password="x")
+        db.add(owner)
+        await db.commit()
+    await run_reorder(owner)
+    await run_move(owner)
+
+
+def test_reorder_and_move_write_only_the_questions_that_moved():
+    asyncio.run(run())